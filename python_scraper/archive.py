@@ -0,0 +1,201 @@
+"""Raw page archive and offline re-extraction.
+
+With ``SCRAPER_ARCHIVE=1`` every fetched page body is stored zstd-compressed
+under its sha256 in a content-addressed directory (identical pages are kept
+once), and each crawl writes a manifest listing its pages in order. After a
+fix to LIST_CONFIGS or the price parser, ``replay`` re-runs extraction over
+archived crawls on every core without touching the network:
+
+    python archive.py list [--domain mytek.tn]
+    python archive.py replay [--crawl ID ...] [--domain D] [--since 2026-01-01] [--workers N] [--save]
+
+Replay prints one JSON line per crawl with the re-extracted result. With
+--save, results whose URL belongs to a Website are persisted like a scrape.
+"""
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(__file__), 'libs'))
+import json
+import time
+import uuid
+import hashlib
+import datetime
+import argparse
+import threading
+
+from state import STATE_DIR
+
+ENABLED = os.getenv('SCRAPER_ARCHIVE', '0') == '1'
+ARCHIVE_DIR = os.getenv('SCRAPER_ARCHIVE_DIR') or os.path.join(STATE_DIR, 'archive')
+ZSTD_LEVEL = 10
+
+_local = threading.local()
+
+
+def _zstd():
+    import zstandard
+    return zstandard
+
+
+def _object_path(digest):
+    return os.path.join(ARCHIVE_DIR, 'objects', digest[:2], digest[2:] + '.zst')
+
+
+def _write_atomic(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp, 'wb') as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+def store_page(html):
+    """Archives a page body; returns its content hash (None when archiving is off or fails)."""
+    if not ENABLED or html is None: return None
+    body = html.encode('utf-8')
+    digest = hashlib.sha256(body).hexdigest()
+    path = _object_path(digest)
+    if os.path.exists(path): return digest
+    try:
+        # Compressors are not thread-safe; keep one per thread
+        compressor = getattr(_local, 'compressor', None)
+        if compressor is None:
+            compressor = _local.compressor = _zstd().ZstdCompressor(level=ZSTD_LEVEL)
+        _write_atomic(path, compressor.compress(body))
+        return digest
+    except Exception as e:
+        print(f"Archive write error: {e}", file=sys.stderr)
+        return None
+
+
+def load_page(digest):
+    with open(_object_path(digest), 'rb') as f:
+        return _zstd().ZstdDecompressor().decompress(f.read()).decode('utf-8')
+
+
+class Crawl:
+    """Manifest of one crawl: start URL, method and the archived pages in crawl order."""
+
+    def __init__(self, url, domain, method):
+        started = datetime.datetime.now()
+        self.manifest = {"id": f"{started:%Y%m%dT%H%M%S}-{uuid.uuid4().hex[:8]}", "url": url, "domain": domain,
+                         "method": method, "startedAt": started.isoformat(), "pages": []}
+
+    def add(self, url, digest):
+        if not digest: return
+        self.manifest["pages"].append({"url": url, "hash": digest, "fetchedAt": time.time()})
+        # Rewritten per page so a crawl that dies midway still has a usable manifest
+        try: _write_atomic(manifest_path(self.manifest["id"]), json.dumps(self.manifest).encode('utf-8'))
+        except OSError as e: print(f"Archive manifest error: {e}", file=sys.stderr)
+
+
+def start_crawl(url, domain, method):
+    return Crawl(url, domain, method) if ENABLED else None
+
+
+def manifest_path(crawl_id):
+    return os.path.join(ARCHIVE_DIR, 'crawls', crawl_id + '.json')
+
+
+def load_manifests(crawl_ids=None, domain=None, since=None):
+    directory = os.path.join(ARCHIVE_DIR, 'crawls')
+    names = [c + '.json' for c in crawl_ids] if crawl_ids else sorted(os.listdir(directory)) if os.path.isdir(directory) else []
+    manifests = []
+    for name in names:
+        try:
+            with open(os.path.join(directory, name), encoding='utf-8') as f: manifest = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Skipping manifest {name}: {e}", file=sys.stderr); continue
+        if domain and domain not in manifest["domain"]: continue
+        if since and manifest["startedAt"] < since: continue
+        manifests.append(manifest)
+    return sorted(manifests, key=lambda m: m["startedAt"])
+
+
+def _replay_page(task):
+    """Worker: re-extracts one archived page. Returns ("items", [...]) or ("single", {...})."""
+    import extraction_cache
+    import scraper
+    # Re-extraction is the point: never answer from cards extracted by the old code
+    extraction_cache.ENABLED = False
+    domain, digest = task
+    config = scraper.get_list_config(domain)
+    soup, markup = scraper.parse_page(load_page(digest), config)
+    try:
+        if config:
+            items = scraper.extract_items(soup, domain, config, markup)
+            if items: return "items", items
+        specific = scraper.extract_specific_data(soup, domain)
+        if config and not scraper.looks_like_product(specific): return "items", []
+        title = soup.title.string.strip() if soup.title and soup.title.string else ""
+        return "single", dict(specific or {}, title=title)
+    finally:
+        soup.decompose()
+
+
+def replay(manifests, workers=None):
+    """Yields (manifest, result) for every crawl, extracting all their pages in parallel processes."""
+    import scraper
+    from item_store import ItemStore
+    from revisit import page_fingerprint
+    from concurrent.futures import ProcessPoolExecutor
+
+    tasks = [(m["domain"], p["hash"]) for m in manifests for p in m["pages"]]
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+        results = iter(pool.map(_replay_page, tasks, chunksize=8))
+        for manifest in manifests:
+            pages = [next(results) for _ in manifest["pages"]]
+            if pages and pages[0][0] == "single":
+                data = dict(pages[0][1], method=manifest["method"], domain=manifest["domain"], type="single",
+                            timestamp=datetime.datetime.now().isoformat())
+            else:
+                items, page_stats = ItemStore(), []
+                for i, (_, page_items) in enumerate(pages):
+                    items.extend(page_items)
+                    page_stats.append({"key": str(i), "count": len(page_items), "fingerprint": page_fingerprint(page_items)})
+                data = scraper.list_result(items, page_stats, manifest["domain"], manifest["url"])
+            yield manifest, dict(data, replayOf=manifest["id"])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    sub = parser.add_subparsers(dest='command', required=True)
+    ls = sub.add_parser('list')
+    ls.add_argument('--domain')
+    rp = sub.add_parser('replay')
+    rp.add_argument('--crawl', nargs='*', help="Crawl ids (default: every archived crawl)")
+    rp.add_argument('--domain')
+    rp.add_argument('--since', help="ISO date; only crawls started at or after it")
+    rp.add_argument('--workers', type=int)
+    rp.add_argument('--save', action='store_true', help="Persist results of crawls whose URL is a Website")
+    args = parser.parse_args()
+
+    if args.command == 'list':
+        for m in load_manifests(domain=args.domain):
+            print(json.dumps({"id": m["id"], "url": m["url"], "method": m["method"], "startedAt": m["startedAt"], "pages": len(m["pages"])}))
+        return
+
+    supabase = None
+    if args.save:
+        from scraper import get_supabase_client
+        supabase = get_supabase_client()
+    started = time.time()
+    manifests = load_manifests(args.crawl, args.domain, args.since)
+    count = 0
+    for manifest, data in replay(manifests, args.workers):
+        count += 1
+        if supabase:
+            from scraper import save_scraped_data
+            website = supabase.table('Website').select('id').eq('url', manifest["url"]).execute()
+            if website.data: save_scraped_data(supabase, website.data[0]["id"], manifest["url"], data)
+        from scraper import print_json
+        print_json({"success": True, "crawl": manifest["id"], "data": data})
+    print(f"Replayed {count} crawl(s), {sum(len(m['pages']) for m in manifests)} page(s) in {time.time() - started:.1f}s", file=sys.stderr)
+    if supabase:
+        from scraper import drain_spool
+        sys.stdout.flush()
+        drain_spool(supabase, detach=True)
+
+
+if __name__ == "__main__":
+    main()
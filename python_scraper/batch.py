@@ -0,0 +1,112 @@
+"""Batch entry point: scrape many websites through one shared worker pool.
+
+Usage:
+    python batch.py jobs.json            # JSON list of jobs ("-" reads stdin)
+    python batch.py --active             # every active Website in Supabase
+
+A job is either a URL string or an object with ``url`` and optionally
+``website_id``, ``mode``, ``minPrice``, ``maxPrice``, ``nameFilter``,
+``referenceFilter``, ``limit``, ``topK``, ``orderBy``, ``deadline``
+(seconds) and ``priority`` (``interactive`` or the default ``background``).
+Jobs with a ``website_id`` are persisted like a normal scrape. Results are
+printed as one JSON object, in the order of the jobs.
+"""
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(__file__), 'libs'))
+import json
+import time
+import urllib.parse
+import argparse
+
+from scraper import get_supabase_client, run_job, drain_spool, print_json
+from matching import wait_for_updates
+from worker_pool import WorkStealingPool
+from job_control import JobControl
+from lanes import BACKGROUND, LANES, BackgroundThrottle
+
+
+def normalize_job(job):
+    if isinstance(job, str): job = {"url": job}
+    return {
+        "url": job["url"],
+        "website_id": job.get("website_id") or job.get("websiteId"),
+        "mode": job.get("mode") or "auto",
+        "min_price": job.get("minPrice"),
+        "max_price": job.get("maxPrice"),
+        "name_filter": job["nameFilter"].lower() if job.get("nameFilter") else None,
+        "reference_filter": job["referenceFilter"].lower() if job.get("referenceFilter") else None,
+        "limit": job.get("limit"),
+        "top_k": job.get("topK"),
+        "order_by": job.get("orderBy") or "priceAmount",
+        "deadline": job.get("deadline"),
+        "lane": job.get("priority") if job.get("priority") in LANES else BACKGROUND,
+    }
+
+
+def job_domain(job):
+    return urllib.parse.urlparse(job["url"]).netloc
+
+
+def fetch_active_jobs(supabase):
+    response = supabase.table('Website').select('id,url,metadata').eq('isActive', True).execute()
+    jobs = []
+    for w in response.data or []:
+        metadata = w.get("metadata")
+        jobs.append({"url": w["url"], "website_id": w["id"], "mode": metadata.get("mode") if isinstance(metadata, dict) else None})
+    return jobs
+
+
+def run_batch(jobs, supabase=None, workers=4, per_domain=2):
+    """Runs every job concurrently across domains and returns the results in job order."""
+    jobs = [normalize_job(j) for j in jobs]
+
+    def execute(job):
+        started = time.time()
+        ctl = JobControl(job["deadline"], BackgroundThrottle() if job["lane"] == BACKGROUND else None)
+        result = run_job(job["url"], job["mode"], job["min_price"], job["max_price"], job["name_filter"],
+                         job["reference_filter"], job["website_id"], supabase, ctl=ctl,
+                         limit=job["limit"], top_k=job["top_k"], order_by=job["order_by"])
+        result.update({"url": job["url"], "website_id": job["website_id"], "elapsed": round(time.time() - started, 3)})
+        return result
+
+    pool = WorkStealingPool(workers, per_domain)
+    try:
+        futures = [pool.submit(job_domain(job), execute, job, lane=job["lane"]) for job in jobs]
+        results = []
+        for job, future in zip(jobs, futures):
+            try: results.append(future.result())
+            except Exception as e: results.append({"error": str(e), "url": job["url"], "website_id": job["website_id"]})
+        return results
+    finally:
+        pool.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('jobs', nargs='?', help="JSON file with a list of jobs, or - for stdin")
+    parser.add_argument('--active', action='store_true', help="Scrape every active website from Supabase")
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--perDomain', type=int, default=2)
+    args = parser.parse_args()
+
+    supabase = get_supabase_client()
+    if args.active:
+        if not supabase:
+            print(json.dumps({"error": "Supabase is not configured"})); return
+        jobs = fetch_active_jobs(supabase)
+    elif args.jobs:
+        with (sys.stdin if args.jobs == '-' else open(args.jobs)) as f:
+            jobs = json.load(f)
+    else:
+        parser.error("either a jobs file or --active is required")
+
+    started = time.time()
+    results = run_batch(jobs, supabase, args.workers, args.perDomain)
+    print_json({"success": True, "count": len(results), "elapsed": round(time.time() - started, 3), "results": results})
+    drain_spool(supabase, detach=True)
+    wait_for_updates()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,270 @@
+"""Whole-catalog crawls: category tree discovery plus a crawl of every leaf listing.
+
+Usage:
+    python catalog.py discover [--domains tunisianet.com.tn,mytek.tn] [--refresh]
+    python catalog.py crawl [--domains ...] [--perDomain 2] [--deadline S] [--refresh]
+
+Discovery starts from the retailer's home page (LIST_CONFIGS "catalog"),
+follows its navigation menu and each category's subcategory links through a
+Frontier, and reads every category page's breadcrumb to place it in the
+tree. A category reached under several URLs, or two URLs whose breadcrumbs
+name the same category, is kept once. The tree is cached in the state
+directory for ``CATALOG_TTL`` seconds.
+
+A crawl then scrapes every leaf listing (a listing without subcategories),
+at most ``per_domain`` at a time per retailer, and tags each product with
+its category path ("Informatique > Ordinateur portable"). Running a job in
+``catalog`` mode (scraper.py, batch.py, or a Website whose metadata has
+``{"mode": "catalog"}``) does the same for the job URL's retailer and saves
+the result like any list scrape.
+"""
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(__file__), 'libs'))
+import re
+import json
+import time
+import threading
+import urllib.parse
+import argparse
+
+from bs4 import BeautifulSoup
+
+from scraper import LIST_CONFIGS, scrape_url, list_result, flush_state, watch_for_cancel, print_json
+from fetch import fetch_page
+from frontier import Frontier
+from urls import canonical_url
+from item_store import ItemStore
+from worker_pool import WorkStealingPool
+from job_control import JobControl, JobStopped
+from circuit_breaker import CircuitOpenError
+from lanes import BackgroundThrottle
+from state import load_json, update_json
+
+STATE_FILE = 'catalog.json'
+CATALOG_TTL = float(os.getenv('SCRAPER_CATALOG_TTL', str(7 * 86400)))
+# Politeness budget: leaf listings of one retailer crawled at the same time
+PER_DOMAIN = int(os.getenv('SCRAPER_CATALOG_CONCURRENCY', '2'))
+MAX_CATEGORIES = 500
+# Home page = 0, menu categories = 1, their subcategories = 2, ...
+MAX_DEPTH = 4
+HOME_CRUMBS = {"accueil", "acceuil", "home"}
+PATH_SEPARATOR = " > "
+
+_lock = threading.Lock()
+
+
+def catalog_domains():
+    return [d for d, cfg in LIST_CONFIGS.items() if cfg.get("catalog")]
+
+
+def catalog_domain(host):
+    """LIST_CONFIGS key of a host name (www.mytek.tn -> mytek.tn), like get_list_config matches it."""
+    return next((d for d in catalog_domains() if d in host), host)
+
+
+def catalog_config(domain):
+    cfg = (LIST_CONFIGS.get(domain) or {}).get("catalog")
+    if not cfg: raise ValueError(f"No catalog configured for {domain}")
+    return cfg
+
+
+def _text(el):
+    return " ".join(el.get_text(" ", strip=True).split())
+
+
+def breadcrumb(soup, selector):
+    """Category names of the page's breadcrumb, without the home crumb."""
+    names = []
+    for el in soup.select(selector):
+        name = _text(el)
+        if name and (not names or names[-1] != name): names.append(name)
+    return names[1:] if names and names[0].lower() in HOME_CRUMBS else names
+
+
+def category_links(soup, selector, page_url, domain, pattern):
+    """(absolute url, link text) of the category links matched by selector, on the retailer's own site."""
+    site = domain[4:] if domain.startswith("www.") else domain
+    links = []
+    for a in soup.select(selector):
+        href = (a.get("href") or "").strip()
+        if not href or href.startswith(("#", "javascript:", "mailto:", "tel:")): continue
+        url = urllib.parse.urljoin(page_url, href)
+        parts = urllib.parse.urlsplit(url)
+        if parts.scheme not in ("http", "https") or not (parts.hostname or "").endswith(site): continue
+        if pattern and not re.search(pattern, parts.path): continue
+        links.append((url, _text(a)))
+    return links
+
+
+def is_leaf(category, categories):
+    """A listing no other category sits below."""
+    if not category["listing"]: return False
+    depth = len(category["path"])
+    return not any(len(c["path"]) > depth and c["path"][:depth] == category["path"] for c in categories)
+
+
+def discover(domain, ctl=None, max_categories=MAX_CATEGORIES):
+    """Walks the retailer's navigation; returns its categories as {"url", "name", "path", "listing", "leaf"}."""
+    ctl = ctl or JobControl()
+    cfg = catalog_config(domain)
+    card = LIST_CONFIGS[domain]["card"]
+    frontier = Frontier(max_pending=max_categories)
+    frontier.push(cfg["home"], depth=0, path=[])
+    categories, paths, duplicates = [], set(), 0
+    while frontier and len(categories) < max_categories:
+        url, meta = frontier.pop()
+        ctl.between_pages()
+        try:
+            html = fetch_page(url, ctl=ctl)
+        except (JobStopped, CircuitOpenError):
+            raise
+        except Exception as e:
+            print(f"Catalog discovery: skipping {url}: {e}", file=sys.stderr)
+            continue
+        soup = BeautifulSoup(html, 'html.parser')
+        try:
+            if meta["depth"] == 0:
+                selector = cfg["nav"]
+            else:
+                title = soup.select_one(cfg.get("title") or "h1")
+                name = (_text(title) if title else "") or meta["name"]
+                path = breadcrumb(soup, cfg["breadcrumb"]) if cfg.get("breadcrumb") else []
+                # Breadcrumbs that stop at the parent, or no breadcrumb: the page's own name ends the path
+                if not path or path[-1].lower() != name.lower(): path = (path or meta["path"]) + [name]
+                key = tuple(p.lower() for p in path)
+                if key in paths:
+                    duplicates += 1
+                    continue
+                paths.add(key)
+                categories.append({"url": url, "name": name, "path": path, "listing": bool(soup.select_one(card))})
+                selector = cfg.get("subcategories")
+            if selector and meta["depth"] < MAX_DEPTH:
+                for link, text in category_links(soup, selector, url, domain, cfg.get("category")):
+                    frontier.push(link, priority=meta["depth"] + 1, depth=meta["depth"] + 1, name=text,
+                                  path=categories[-1]["path"] if meta["depth"] else [])
+        finally:
+            soup.decompose()
+    for category in categories:
+        category["leaf"] = is_leaf(category, categories)
+    print(f"Catalog of {domain}: {len(categories)} categories, {sum(c['leaf'] for c in categories)} leaf listings"
+          f" ({duplicates} duplicate(s) skipped)", file=sys.stderr)
+    return categories
+
+
+def load_tree(domain, ctl=None, refresh=False):
+    """Cached category tree of domain, rediscovered when older than CATALOG_TTL."""
+    cached = (load_json(STATE_FILE, {}) or {}).get(domain)
+    if cached and not refresh and time.time() - cached["discoveredAt"] < CATALOG_TTL:
+        return cached["categories"]
+    categories = discover(domain, ctl)
+    # An empty tree means the navigation selectors missed; don't cache that
+    if categories:
+        with _lock:
+            update_json(STATE_FILE, lambda state: state.update({domain: {"discoveredAt": time.time(), "categories": categories}}), {})
+    return categories
+
+
+def crawl_leaf(category, ctl, on_page=None):
+    """Scrapes one leaf listing; returns (its result, its items tagged with the category path)."""
+    label = PATH_SEPARATOR.join(category["path"])
+    tag = lambda items: [dict(item, category=label) for item in items]
+    data = scrape_url(category["url"], "auto", ctl=ctl, on_page=on_page and (lambda items: on_page(tag(items))))
+    if not data or data.get("type") != "list": return data, []
+    return data, tag(data["data"])
+
+
+def crawl_catalog(domains, ctl=None, per_domain=PER_DOMAIN, refresh=False, trees=None, on_page=None):
+    """Crawls every leaf listing of each domain; returns {domain: list result} with items tagged by category.
+    trees maps domains to already loaded category trees; the others are loaded (or discovered) first.
+    on_page receives every scraped page's tagged items, from whichever leaf crawl produced them."""
+    ctl = ctl or JobControl()
+    pool = WorkStealingPool(workers=per_domain * len(domains), per_key_limit=per_domain, interactive_workers=0)
+    try:
+        # Discovery walks a retailer's menu one page at a time; retailers are discovered in parallel
+        pending = {d: pool.submit(d, load_tree, d, ctl, refresh) for d in domains if d not in (trees or {})}
+        results, jobs = {}, {}
+        for domain in domains:
+            try:
+                categories = trees[domain] if domain in (trees or {}) else pending[domain].result()
+            except JobStopped as e:
+                results[domain] = list_result(ItemStore(), [], domain, catalog_config(domain)["home"], e.reason)
+                continue
+            except Exception as e:
+                print(f"Catalog discovery of {domain} failed: {e}", file=sys.stderr)
+                results[domain] = {"error": str(e), "domain": domain}
+                continue
+            jobs[domain] = [(c, pool.submit(domain, crawl_leaf, c, ctl, on_page)) for c in categories if c["leaf"]]
+        results.update({domain: _merge(domain, leaf_jobs) for domain, leaf_jobs in jobs.items()})
+        return {domain: results[domain] for domain in domains}
+    finally:
+        pool.shutdown()
+
+
+def _merge(domain, jobs):
+    items, pages, summary, seen = ItemStore(), [], [], set()
+    stop_reason = None
+    for index, (category, future) in enumerate(jobs):
+        entry = {"url": category["url"], "path": category["path"], "count": 0}
+        try:
+            data, category_items = future.result()
+        except JobStopped as e:
+            entry["stopReason"] = stop_reason = e.reason
+            data, category_items = None, []
+        except Exception as e:
+            entry["error"] = str(e)
+            data, category_items = None, []
+        if data and data.get("stopReason"):
+            entry["stopReason"] = data["stopReason"]
+            if data["stopReason"] in ("deadline", "cancelled"): stop_reason = data["stopReason"]
+        for item in category_items:
+            # A product listed under two leaves belongs to the first one
+            key = canonical_url(item["url"]) if item.get("url") else None
+            if key and key in seen: continue
+            if key: seen.add(key)
+            items.append(item)
+            entry["count"] += 1
+        for page in (data or {}).get("pages", []):
+            pages.append(dict(page, key=f"{index}:{page['key']}"))
+        summary.append(entry)
+    home = LIST_CONFIGS[domain]["catalog"]["home"]
+    return dict(list_result(items, pages, domain, home, stop_reason), method="catalog", categories=summary)
+
+
+def crawl_domain(domain, ctl=None, refresh=False, on_page=None):
+    """Catalog crawl of a single retailer (scrape_url "catalog" mode). Discovery errors propagate."""
+    domain = catalog_domain(domain)
+    categories = load_tree(domain, ctl, refresh)
+    if not categories: raise ValueError(f"No categories found on {domain}")
+    return crawl_catalog([domain], ctl, trees={domain: categories}, on_page=on_page)[domain]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('command', choices=['discover', 'crawl'])
+    parser.add_argument('--domains', type=str, help="Comma separated retailers (default: every retailer with a catalog)")
+    parser.add_argument('--perDomain', type=int, default=PER_DOMAIN, help="Leaf listings of one retailer crawled at once")
+    parser.add_argument('--deadline', type=float, help="Time budget in seconds for the whole crawl")
+    parser.add_argument('--refresh', action='store_true', help="Rediscover the category trees instead of using the cached ones")
+    args = parser.parse_args()
+
+    domains = [d.strip() for d in args.domains.split(",") if d.strip()] if args.domains else catalog_domains()
+    unknown = [d for d in domains if d not in catalog_domains()]
+    if unknown:
+        print(json.dumps({"error": f"No catalog configured for: {', '.join(unknown)}"})); return
+
+    ctl = JobControl(args.deadline, BackgroundThrottle())
+    watch_for_cancel(ctl)
+    started = time.time()
+    try:
+        if args.command == 'discover':
+            result = {d: load_tree(d, ctl, args.refresh) for d in domains}
+        else:
+            result = crawl_catalog(domains, ctl, args.perDomain, args.refresh)
+    finally:
+        flush_state()
+    print_json({"success": True, "elapsed": round(time.time() - started, 3), "data": result})
+
+
+if __name__ == "__main__":
+    main()
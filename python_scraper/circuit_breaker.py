@@ -0,0 +1,130 @@
+"""Per-domain circuit breaker for the fetch layer.
+
+closed     requests flow; outcomes are kept in a sliding window
+open       too many recent failures: requests fail fast with CircuitOpenError
+           until the cooldown expires (the cooldown doubles each time the
+           domain trips again, up to MAX_COOLDOWN)
+half-open  after the cooldown a single probe request is let through; success
+           closes the circuit, failure opens it again
+
+Open circuits are also written to the state directory so that scraper
+processes started during an outage fail fast without re-learning it.
+"""
+import time
+import threading
+import collections
+
+from state import load_json, update_json
+
+STATE_FILE = 'circuits.json'
+WINDOW = 20
+MIN_CALLS = 5
+FAILURE_RATIO = 0.5
+CONSECUTIVE_FAILURES = 5
+BASE_COOLDOWN = 30.0
+MAX_COOLDOWN = 300.0
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half-open"
+
+
+class CircuitOpenError(Exception):
+    def __init__(self, domain, retry_after):
+        super().__init__(f"Circuit open for {domain}, retry in {retry_after:.0f}s")
+        self.domain = domain
+        self.retry_after = retry_after
+
+
+class _Circuit:
+    def __init__(self):
+        self.state = CLOSED
+        self.outcomes = collections.deque(maxlen=WINDOW)
+        self.consecutive = 0
+        self.open_until = 0.0
+        self.cooldown = BASE_COOLDOWN
+        self.probing = False
+
+
+class CircuitBreaker:
+    def __init__(self, persist=True):
+        self.persist = persist
+        self._circuits = collections.defaultdict(_Circuit)
+        self._lock = threading.Lock()
+        if persist:
+            now = time.time()
+            for domain, saved in (load_json(STATE_FILE, {}) or {}).items():
+                if saved.get("openUntil", 0) > now:
+                    circuit = self._circuits[domain]
+                    circuit.state, circuit.open_until = OPEN, saved["openUntil"]
+                    circuit.cooldown = saved.get("cooldown", BASE_COOLDOWN)
+
+    def state(self, domain):
+        with self._lock:
+            return self._circuits[domain].state
+
+    def before_call(self, domain):
+        """Raises CircuitOpenError when domain should not be contacted right now.
+        Returns True when the call is a half-open circuit's probe; the caller must then end it with
+        record_success, record_failure or, when the call proved nothing either way, release."""
+        with self._lock:
+            circuit = self._circuits[domain]
+            now = time.time()
+            if circuit.state == OPEN:
+                if now < circuit.open_until:
+                    raise CircuitOpenError(domain, circuit.open_until - now)
+                circuit.state, circuit.probing = HALF_OPEN, False
+            if circuit.state == HALF_OPEN:
+                if circuit.probing:
+                    raise CircuitOpenError(domain, circuit.cooldown / 4)
+                circuit.probing = True
+                return True
+            return False
+
+    def release(self, domain):
+        """Ends a probe without an outcome (cancelled, bad URL, browser failing to start): the next
+        call probes again. Does nothing once the probe's outcome was recorded."""
+        with self._lock:
+            circuit = self._circuits[domain]
+            if circuit.state == HALF_OPEN: circuit.probing = False
+
+    def record_success(self, domain):
+        with self._lock:
+            circuit = self._circuits[domain]
+            circuit.outcomes.append(True)
+            circuit.consecutive = 0
+            if circuit.state != CLOSED:
+                circuit.state, circuit.probing, circuit.cooldown = CLOSED, False, BASE_COOLDOWN
+                circuit.outcomes.clear()
+                self._save(domain, circuit)
+
+    def record_failure(self, domain):
+        with self._lock:
+            circuit = self._circuits[domain]
+            circuit.outcomes.append(False)
+            circuit.consecutive += 1
+            failures = circuit.outcomes.count(False)
+            tripped = circuit.state == HALF_OPEN or circuit.consecutive >= CONSECUTIVE_FAILURES or \
+                (len(circuit.outcomes) >= MIN_CALLS and failures / len(circuit.outcomes) >= FAILURE_RATIO)
+            if not tripped: return
+            if circuit.state == HALF_OPEN:
+                circuit.cooldown = min(MAX_COOLDOWN, circuit.cooldown * 2)
+            circuit.state, circuit.probing = OPEN, False
+            circuit.open_until = time.time() + circuit.cooldown
+            circuit.outcomes.clear()
+            self._save(domain, circuit)
+
+    def _save(self, domain, circuit):
+        """Writes this domain's circuit into the shared file, leaving other domains (and the
+        circuits other processes opened) alone; expired entries are dropped on the way."""
+        if not self.persist: return
+
+        def update(saved):
+            now = time.time()
+            for d in [d for d, c in saved.items() if c.get("openUntil", 0) <= now]: del saved[d]
+            if circuit.state == OPEN: saved[domain] = {"openUntil": circuit.open_until, "cooldown": circuit.cooldown}
+            else: saved.pop(domain, None)
+        try:
+            update_json(STATE_FILE, update, {})
+        except OSError:
+            pass
+
+breaker = CircuitBreaker()
@@ -0,0 +1,98 @@
+"""Selector drift detection from per-domain extraction norms.
+
+When a retailer changes its theme the list selectors silently stop
+matching: no cards, far fewer cards, or cards whose price or image is
+suddenly missing. Every healthy first listing page updates the domain's
+norms (moving averages of the card count, of field fill rates and of the
+price parse rate). A first page that collapses far below those norms is
+reported as drift, so the crawl can switch to another extraction path or
+stop after one page instead of paginating through nothing.
+"""
+import threading
+
+from state import load_json, update_json
+
+STATE_FILE = 'drift.json'
+# Norms are trusted once this many healthy first pages were seen
+MIN_SAMPLES = 3
+ALPHA = 0.2
+# A rate this far below its norm is drift; only fields normally filled count
+MAX_DROP = 0.5
+MIN_NORM = 0.8
+# While norms are learned, pages with fewer items say nothing
+MIN_ITEMS = 3
+FIELDS = ("price", "image", "reference")
+
+SELECTOR_DRIFT = "selector_drift"
+# The card count norm is learned from first pages only; later pages of a listing may be short
+FEW_CARDS = "few_cards"
+
+_lock = threading.Lock()
+
+
+class SelectorDrift(Exception):
+    def __init__(self, domain, report):
+        super().__init__(f"Selector drift on {domain}: {report['reason']}")
+        self.domain = domain
+        self.report = report
+
+
+def page_health(items, empty=False):
+    """Card count, field fill rates and price parse rate of one page of unfiltered items.
+    empty marks a page without cards that says it has nothing to list (no results, empty category)."""
+    n = len(items)
+    health = {"cards": n, "fill": {}, "priceParse": None, "empty": bool(empty and not n)}
+    if n:
+        health["fill"] = {f: sum(1 for i in items if i.get(f)) / float(n) for f in FIELDS}
+        health["priceParse"] = sum(1 for i in items if (i.get("priceAmount") or 0) > 0) / float(n)
+    return health
+
+
+def _norms(domain):
+    return (load_json(STATE_FILE, {}) or {}).get(domain)
+
+
+def _learned(norms):
+    return bool(norms) and norms.get("samples", 0) >= MIN_SAMPLES
+
+
+def check(domain, health):
+    """Drift report {"reason", "expected", "observed"} or None when the page looks normal."""
+    norms = _norms(domain)
+    if not _learned(norms): return None
+    if not health["cards"]:
+        # A search without results or an empty category is not drift
+        if health.get("empty"): return None
+        return {"reason": "no_cards", "expected": round(norms["cards"], 1), "observed": 0}
+    if health["cards"] < norms["cards"] * (1 - MAX_DROP):
+        return {"reason": FEW_CARDS, "expected": round(norms["cards"], 1), "observed": health["cards"]}
+    rates = dict(health["fill"], priceParse=health["priceParse"])
+    for field, observed in rates.items():
+        expected = norms["rates"].get(field)
+        if expected is None or expected < MIN_NORM: continue
+        if observed < expected - MAX_DROP:
+            reason = "price_unparsed" if field == "priceParse" else f"field_missing:{field}"
+            return {"reason": reason, "expected": round(expected, 2), "observed": round(observed, 2)}
+    return None
+
+
+def record(domain, health):
+    """Folds a healthy page into the domain's norms."""
+    if not health["cards"]: return
+    rates = dict(health["fill"], priceParse=health["priceParse"])
+
+    def update(state):
+        norms = state.get(domain)
+        if health["cards"] < MIN_ITEMS and not _learned(norms): return
+        if not norms:
+            norms = {"samples": 0, "cards": float(health["cards"]), "rates": dict(rates)}
+        else:
+            norms["cards"] += ALPHA * (health["cards"] - norms["cards"])
+            for field, value in rates.items():
+                prev = norms["rates"].get(field, value)
+                norms["rates"][field] = prev + ALPHA * (value - prev)
+        norms["samples"] += 1
+        state[domain] = norms
+
+    with _lock:
+        update_json(STATE_FILE, update, {})
@@ -0,0 +1,97 @@
+"""Persistent extraction cache keyed by a hash of each card's raw HTML.
+
+Listing pages change little between crawls, so most product cards come back
+byte for byte identical. Each card's markup is hashed with mmh3 (128 bit)
+and looked up here first; only new or changed cards go through the
+selectors. The raw markup is cut from the parsed source using the position
+html.parser records for every tag, so a cache hit costs a short scan and a
+hash instead of serializing the card.
+
+Entries are namespaced by domain and a fingerprint of the domain's list
+config, so editing a selector invalidates what it extracted. Each namespace
+is kept in memory and written to the state directory by flush().
+"""
+import os
+import re
+import json
+import zlib
+import threading
+import collections
+
+import mmh3
+
+from html_regions import element_end
+from state import load_json, save_json
+
+CACHE_DIR = 'extraction'
+# Bump when extract_items changes what it produces from the same markup
+EXTRACTION_VERSION = 1
+MAX_ENTRIES = 50000
+ENABLED = os.getenv('SCRAPER_EXTRACTION_CACHE', '1') != '0'
+
+_namespaces = {}
+_dirty = set()
+_lock = threading.Lock()
+
+
+def namespace(domain, config):
+    fingerprint = zlib.crc32(json.dumps([EXTRACTION_VERSION, config], sort_keys=True).encode('utf-8'))
+    return f"{domain}-{fingerprint:08x}"
+
+
+def _entries(ns):
+    entries = _namespaces.get(ns)
+    if entries is None:
+        entries = collections.OrderedDict(load_json(os.path.join(CACHE_DIR, ns + '.json'), {}) or {})
+        _namespaces[ns] = entries
+    return entries
+
+
+class SourceIndex:
+    """Maps the (sourceline, sourcepos) of a parsed tag back to its raw markup."""
+
+    def __init__(self, markup):
+        self.markup = markup
+        self._line_starts = [0] + [m.end() for m in re.finditer('\n', markup)]
+
+    def raw(self, tag):
+        if tag.sourceline is None or tag.sourceline > len(self._line_starts): return None
+        start = self._line_starts[tag.sourceline - 1] + tag.sourcepos
+        if not self.markup.startswith('<' + tag.name, start): return None
+        return self.markup[start:element_end(self.markup, tag.name, start)]
+
+
+def card_key(tag, source=None):
+    raw = source.raw(tag) if source else None
+    if raw is None: raw = str(tag)
+    return "%032x" % mmh3.hash128(raw, signed=False)
+
+
+def lookup(ns, key):
+    """A copy of the cached item for key, or None."""
+    with _lock:
+        entries = _entries(ns)
+        item = entries.get(key)
+        if item is None: return None
+        entries.move_to_end(key)
+    return dict(item)
+
+
+def store(ns, extracted):
+    """extracted: iterable of (key, item)."""
+    with _lock:
+        entries = _entries(ns)
+        for key, item in extracted:
+            entries[key] = dict(item)
+            entries.move_to_end(key)
+        while len(entries) > MAX_ENTRIES: entries.popitem(last=False)
+        _dirty.add(ns)
+
+
+def flush():
+    """Writes the namespaces changed since the last flush."""
+    with _lock:
+        pending = [(ns, dict(_namespaces[ns])) for ns in _dirty]
+        _dirty.clear()
+    for ns, entries in pending:
+        save_json(os.path.join(CACHE_DIR, ns + '.json'), entries)
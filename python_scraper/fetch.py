@@ -0,0 +1,166 @@
+"""HTTP fetch layer for the static scraper.
+
+Fetch latency is tracked per domain. Once a domain has enough samples its
+timeout follows the observed p95 instead of the fixed 15 seconds, and a
+request still running after the p95 gets a hedged duplicate; whichever
+answers first wins. Transient failures (connection errors, timeouts, 429
+and 5xx) are retried with exponential backoff, and feed the domain's
+circuit breaker: once a domain trips, fetches fail fast with
+CircuitOpenError instead of burning their timeout and retry budget.
+"""
+import sys
+import time
+import threading
+import collections
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+import requests
+from tenacity import retry, retry_if_exception, stop_after_attempt, wait_random_exponential
+
+from circuit_breaker import breaker
+
+DEFAULT_HEADERS = {'User-Agent': 'Mozilla/5.0'}
+DEFAULT_TIMEOUT = 15
+# Adaptive timeout = p95 * TIMEOUT_FACTOR, kept within [MIN_TIMEOUT, DEFAULT_TIMEOUT]
+TIMEOUT_FACTOR = 3
+MIN_TIMEOUT = 3
+# Samples needed before a domain's latency is trusted
+MIN_SAMPLES = 5
+LATENCY_WINDOW = 50
+RETRY_ATTEMPTS = 3
+# How often a pending request checks whether its job was stopped
+POLL_INTERVAL = 0.2
+
+_thread_state = threading.local()
+_fetch_executor = ThreadPoolExecutor(max_workers=16, thread_name_prefix="fetch")
+
+
+def get_http_session():
+    """Per-thread requests session so long-lived workers keep their connections warm."""
+    session = getattr(_thread_state, "session", None)
+    if session is None:
+        session = requests.Session()
+        _thread_state.session = session
+    return session
+
+
+class LatencyTracker:
+    """Sliding window of successful fetch durations per domain."""
+
+    def __init__(self, window=LATENCY_WINDOW):
+        self._samples = collections.defaultdict(lambda: collections.deque(maxlen=window))
+        self._lock = threading.Lock()
+
+    def record(self, domain, seconds):
+        with self._lock:
+            self._samples[domain].append(seconds)
+
+    def quantile(self, domain, q):
+        with self._lock:
+            samples = sorted(self._samples.get(domain, ()))
+        if len(samples) < MIN_SAMPLES: return None
+        return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+    def timeout_for(self, domain):
+        p95 = self.quantile(domain, 0.95)
+        if p95 is None: return DEFAULT_TIMEOUT
+        return min(DEFAULT_TIMEOUT, max(MIN_TIMEOUT, p95 * TIMEOUT_FACTOR))
+
+    def hedge_delay(self, domain):
+        return self.quantile(domain, 0.95)
+
+    def stats(self, domain):
+        return {"p50": self.quantile(domain, 0.5), "p95": self.quantile(domain, 0.95), "timeout": self.timeout_for(domain)}
+
+
+latency = LatencyTracker()
+
+
+class TransientHTTPError(requests.HTTPError):
+    pass
+
+
+def is_transient(error):
+    return isinstance(error, (requests.ConnectionError, requests.Timeout, TransientHTTPError))
+
+
+def _get(url, domain, headers, timeout):
+    started = time.monotonic()
+    response = get_http_session().get(url, headers=headers, timeout=timeout, verify=False)
+    if response.status_code == 429 or response.status_code >= 500:
+        raise TransientHTTPError(f"{response.status_code} for {url}", response=response)
+    response.raise_for_status()
+    latency.record(domain, time.monotonic() - started)
+    return response.text
+
+
+def _hedged_get(url, domain, headers, timeout, ctl=None):
+    delay = latency.hedge_delay(domain)
+    if delay is None and ctl is None:
+        return _get(url, domain, headers, timeout)
+    # Requests run on the executor so that a stopped job can walk away from them
+    started = time.monotonic()
+    futures = {_fetch_executor.submit(_get, url, domain, headers, timeout)}
+    hedged = delay is None
+    error = None
+    while futures:
+        step = POLL_INTERVAL if ctl else None
+        if not hedged: step = max(0.0, min(step or delay, started + delay - time.monotonic()))
+        done, futures = wait(futures, timeout=step, return_when=FIRST_COMPLETED)
+        for future in done:
+            try: return future.result()
+            except Exception as e: error = e
+        if ctl: ctl.checkpoint()
+        if not hedged and futures and time.monotonic() - started >= delay:
+            print(f"Hedging slow request to {url} after {delay:.2f}s", file=sys.stderr)
+            futures.add(_fetch_executor.submit(_get, url, domain, headers, timeout))
+            hedged = True
+    raise error
+
+
+def _log_retry(state):
+    print(f"Retrying {state.args[0]} after: {state.outcome.exception()}", file=sys.stderr)
+
+
+def _job_control(state):
+    return state.kwargs.get("ctl")
+
+
+def _job_stopped(state):
+    ctl = _job_control(state)
+    return bool(ctl and ctl.stopped)
+
+
+_backoff = wait_random_exponential(multiplier=0.5, max=8)
+
+
+def _wait_within_deadline(state):
+    delay = _backoff(state)
+    remaining = _job_control(state).remaining() if _job_control(state) else None
+    return delay if remaining is None else min(delay, remaining)
+
+
+@retry(retry=retry_if_exception(is_transient), stop=stop_after_attempt(RETRY_ATTEMPTS) | _job_stopped,
+       wait=_wait_within_deadline, before_sleep=_log_retry, reraise=True)
+def fetch_page(url, headers=None, timeout=None, ctl=None):
+    """Returns the body of url, raising on network errors and HTTP error statuses.
+    With a JobControl the timeout and retries stay within the job deadline, and a deadline or
+    cancellation abandons the in-flight request (DeadlineExceeded / JobCancelled)."""
+    domain = urllib.parse.urlparse(url).netloc
+    probe = breaker.before_call(domain)
+    try:
+        if timeout is None: timeout = latency.timeout_for(domain)
+        if ctl: timeout = ctl.timeout(timeout)
+        text = _hedged_get(url, domain, headers or DEFAULT_HEADERS, timeout, ctl)
+    except Exception as e:
+        if is_transient(e): breaker.record_failure(domain)
+        # Any other HTTP answer (404...) still proves the domain is up
+        elif isinstance(e, requests.HTTPError): breaker.record_success(domain)
+        raise
+    else:
+        breaker.record_success(domain)
+    finally:
+        # A stopped job or an invalid URL says nothing about the domain
+        if probe: breaker.release(domain)
+    return text
@@ -0,0 +1,47 @@
+"""Byte-level pre-scan that cuts the product grid out of a listing page.
+
+Region hints are simple selectors from LIST_CONFIGS (``#id`` or ``.class``).
+Each matching container is located with a regex and closed by counting
+nested open/close tags of the same name, so the HTML parser only ever sees
+the grid and pagination markup instead of headers, menus and scripts.
+"""
+import re
+
+
+def _start_pattern(hint):
+    if hint.startswith('#'):
+        attr, value = 'id', re.escape(hint[1:])
+        return re.compile(r'<([a-zA-Z][\w-]*)\b[^>]*?\b%s\s*=\s*["\']%s["\']' % (attr, value), re.I)
+    if hint.startswith('.'):
+        value = re.escape(hint[1:])
+        return re.compile(r'<([a-zA-Z][\w-]*)\b[^>]*?\bclass\s*=\s*["\'][^"\']*(?<![\w-])%s(?![\w-])' % value, re.I)
+    raise ValueError(f"Unsupported region hint: {hint}")
+
+
+def element_end(html, tag, start):
+    """Returns the index just past the closing tag matching the element opened at start."""
+    depth = 0
+    for m in re.compile(r'<(/?)%s\b[^>]*>' % re.escape(tag), re.I).finditer(html, start):
+        if m.group(1):
+            depth -= 1
+            if depth == 0: return m.end()
+        elif not m.group(0).endswith('/>'):
+            depth += 1
+    return len(html)
+
+
+def cut_regions(html, hints):
+    """Returns a minimal document holding every region matched by hints, or None if nothing matched."""
+    found = []
+    for hint in hints:
+        for m in _start_pattern(hint).finditer(html):
+            found.append((m.start(), element_end(html, m.group(1), m.start())))
+    if not found: return None
+    # Keep outermost regions only so nested hints are not emitted twice
+    spans = []
+    for start, end in sorted(found):
+        if spans and start < spans[-1][1]: continue
+        spans.append((start, end))
+    title = re.search(r'<title\b[^>]*>.*?</title>', html, re.I | re.S)
+    head = f"<head>{title.group(0)}</head>" if title else ""
+    return "<html>" + head + "<body>" + "".join(html[s:e] for s, e in spans) + "</body></html>"
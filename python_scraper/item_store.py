@@ -0,0 +1,94 @@
+"""Compact storage for scraped list items.
+
+Items extracted from listing pages are kept as slotted records instead of
+dicts, and the low-cardinality string fields (domain, category, price text)
+are interned so thousands of products share one copy of each value.
+Results keep their ItemStore up to serialization: ``dump`` writes it to the
+output one item at a time instead of building the whole list of dicts.
+"""
+import sys
+import json
+
+ITEM_FIELDS = ("name", "url", "price", "priceAmount", "image", "reference", "domain", "category")
+INTERNED_FIELDS = ("price", "domain", "category")
+
+
+class ItemRecord:
+    __slots__ = ITEM_FIELDS
+
+    def __init__(self, data):
+        for field in ITEM_FIELDS:
+            value = data.get(field)
+            if field in INTERNED_FIELDS and isinstance(value, str):
+                value = sys.intern(value)
+            setattr(self, field, value)
+
+    def to_dict(self):
+        # Missing fields are omitted, matching the dicts built by extract_list_data
+        return {f: getattr(self, f) for f in ITEM_FIELDS if getattr(self, f) is not None}
+
+
+class ItemStore:
+    """Append-only list of ItemRecord with dict-shaped iteration."""
+
+    def __init__(self, items=None):
+        self._records = []
+        if items: self.extend(items)
+
+    def append(self, item):
+        self._records.append(item if isinstance(item, ItemRecord) else ItemRecord(item))
+
+    def extend(self, items):
+        for item in items:
+            self.append(item)
+
+    def __len__(self):
+        return len(self._records)
+
+    def __bool__(self):
+        return bool(self._records)
+
+    def __iter__(self):
+        for record in self._records:
+            yield record.to_dict()
+
+    def __getitem__(self, index):
+        if isinstance(index, slice): return [record.to_dict() for record in self._records[index]]
+        return self._records[index].to_dict()
+
+    def to_list(self):
+        return [record.to_dict() for record in self._records]
+
+
+def iterencode(value):
+    """Chunks of json.dumps(value), with ItemStore values encoded as lists, item by item."""
+    if isinstance(value, ItemStore):
+        yield "["
+        for i, item in enumerate(value):
+            if i: yield ", "
+            yield json.dumps(item)
+        yield "]"
+    elif isinstance(value, dict):
+        yield "{"
+        for i, (key, item) in enumerate(value.items()):
+            yield (", " if i else "") + json.dumps(key if isinstance(key, str) else str(key)) + ": "
+            yield from iterencode(item)
+        yield "}"
+    elif isinstance(value, (list, tuple)):
+        yield "["
+        for i, item in enumerate(value):
+            if i: yield ", "
+            yield from iterencode(item)
+        yield "]"
+    else:
+        yield json.dumps(value)
+
+
+def dump(value, out):
+    """json.dump that streams ItemStore values instead of converting them to a list first."""
+    for chunk in iterencode(value):
+        out.write(chunk)
+
+
+def dumps(value):
+    return "".join(iterencode(value))
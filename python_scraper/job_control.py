@@ -0,0 +1,97 @@
+"""Per-job control shared by every fetch, wait and parse step of a scrape.
+
+A JobControl carries the job's time budget and its cancellation flag. Steps
+ask it for their timeout, sleep through it, and call checkpoint() between
+units of work so the job can stop with what it has collected so far.
+"""
+import sys
+import time
+import threading
+
+
+class JobStopped(Exception):
+    reason = "stopped"
+
+
+class DeadlineExceeded(JobStopped):
+    reason = "deadline"
+
+
+class JobCancelled(JobStopped):
+    reason = "cancelled"
+
+
+class JobControl:
+    def __init__(self, deadline=None, pause_hook=None):
+        self.deadline_at = time.monotonic() + deadline if deadline else None
+        # Called with this control at page boundaries; may block to let other work through
+        self.pause_hook = pause_hook
+        self._cancelled = threading.Event()
+        self._callbacks = []
+        self._lock = threading.Lock()
+
+    def remaining(self):
+        """Seconds left, or None when the job has no deadline."""
+        if self.deadline_at is None: return None
+        return max(0.0, self.deadline_at - time.monotonic())
+
+    @property
+    def expired(self):
+        return self.deadline_at is not None and time.monotonic() >= self.deadline_at
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    @property
+    def stopped(self):
+        return self.cancelled or self.expired
+
+    def cancel(self):
+        """Requests cancellation and runs the registered release callbacks (e.g. quitting a browser)."""
+        with self._lock:
+            if self._cancelled.is_set(): return
+            self._cancelled.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            try: callback()
+            except Exception as e: print(f"Cancel callback failed: {e}", file=sys.stderr)
+
+    def on_cancel(self, callback):
+        """Registers callback to run on cancel; returns a function that unregisters it."""
+        def unregister():
+            with self._lock:
+                if callback in self._callbacks: self._callbacks.remove(callback)
+
+        with self._lock:
+            if not self._cancelled.is_set():
+                self._callbacks.append(callback)
+                return unregister
+        callback()
+        return unregister
+
+    def checkpoint(self):
+        if self.cancelled: raise JobCancelled("Job cancelled")
+        if self.expired: raise DeadlineExceeded("Job deadline exceeded")
+
+    def between_pages(self):
+        """Page-boundary checkpoint: the only place a job may be paused."""
+        self.checkpoint()
+        if self.pause_hook:
+            self.pause_hook(self)
+            self.checkpoint()
+
+    def wait(self, seconds):
+        """Sleeps up to seconds, returning early (without raising) when cancelled."""
+        self._cancelled.wait(seconds)
+
+    def timeout(self, default):
+        """default capped to the time left; raises once the job is stopped."""
+        self.checkpoint()
+        remaining = self.remaining()
+        return default if remaining is None else min(default, remaining)
+
+    def sleep(self, seconds):
+        # Wakes up as soon as the job is cancelled
+        self._cancelled.wait(self.timeout(seconds))
+        self.checkpoint()
@@ -0,0 +1,124 @@
+"""Priority lanes: interactive scrapes preempt scheduled bulk refreshes.
+
+Two lanes share the worker pool by weighted fair share (stride scheduling):
+for every background job started, up to ``LANE_WEIGHTS[INTERACTIVE]``
+interactive jobs may start. On top of that, running background crawls
+pause between pages while interactive work is pending anywhere - in this
+process or in a dashboard-triggered ``scraper.py`` announced through a
+marker file - and after a pause they are guaranteed to run for a weighted
+share of that time before they can be paused again.
+"""
+import os
+import time
+import uuid
+import threading
+import contextlib
+
+from state import state_path, STATE_DIR
+
+INTERACTIVE, BACKGROUND = "interactive", "background"
+LANES = (INTERACTIVE, BACKGROUND)
+LANE_WEIGHTS = {INTERACTIVE: 4, BACKGROUND: 1}
+
+MARKER_DIR = 'interactive'
+# Markers are refreshed while their job runs; older ones belong to dead processes
+MARKER_REFRESH = 10.0
+MARKER_MAX_AGE = 30.0
+# A background crawl never waits longer than this at a single page boundary
+MAX_PAUSE = 30.0
+PAUSE_POLL = 0.2
+
+_local_demand = 0
+_demand_lock = threading.Lock()
+
+
+class LaneSelector:
+    """Stride scheduler choosing which lane starts the next job."""
+
+    def __init__(self, weights=None):
+        self.weights = dict(weights or LANE_WEIGHTS)
+        self._pass = {lane: 0.0 for lane in self.weights}
+
+    def choose(self, ready):
+        """Picks one of the ready lanes and charges it for one job."""
+        ready = [lane for lane in ready if lane in self.weights]
+        if not ready: return None
+        lane = min(ready, key=lambda l: (self._pass[l], LANES.index(l) if l in LANES else len(LANES)))
+        # A lane that sat idle must not bank credit and then monopolise the pool
+        floor = min(self._pass[l] for l in ready)
+        self._pass[lane] = max(self._pass[lane], floor) + 1.0 / self.weights[lane]
+        return lane
+
+
+def add_interactive_demand(delta):
+    global _local_demand
+    with _demand_lock:
+        _local_demand += delta
+
+
+def _marker_dir():
+    return os.path.join(STATE_DIR, MARKER_DIR)
+
+
+def interactive_demand():
+    """Interactive jobs pending or running in this process and in other scraper processes."""
+    with _demand_lock:
+        demand = _local_demand
+    try:
+        now = time.time()
+        for name in os.listdir(_marker_dir()):
+            if name.startswith(f"{os.getpid()}-"): continue
+            try:
+                if now - os.path.getmtime(os.path.join(_marker_dir(), name)) <= MARKER_MAX_AGE: demand += 1
+            except OSError:
+                pass
+    except OSError:
+        pass
+    return demand
+
+
+@contextlib.contextmanager
+def interactive_marker():
+    """Announces an interactive job to background workers in other processes while it runs."""
+    path = state_path(MARKER_DIR, f"{os.getpid()}-{uuid.uuid4().hex[:8]}")
+    done = threading.Event()
+
+    def refresh():
+        while not done.wait(MARKER_REFRESH):
+            try: os.utime(path)
+            except OSError: pass
+
+    try:
+        open(path, 'w').close()
+        created = True
+    except OSError:
+        created = False
+    if created:
+        threading.Thread(target=refresh, name="interactive-marker", daemon=True).start()
+    try:
+        yield
+    finally:
+        done.set()
+        if created:
+            try: os.remove(path)
+            except OSError: pass
+
+
+class BackgroundThrottle:
+    """Pause hook for one background job's JobControl (called between pages)."""
+
+    def __init__(self, weights=None):
+        weights = weights or LANE_WEIGHTS
+        self.ratio = weights[INTERACTIVE] / float(weights[BACKGROUND])
+        self._resumed_at = 0.0
+        self._last_pause = 0.0
+
+    def __call__(self, ctl):
+        if not interactive_demand(): return
+        # Weighted fair share: after pausing P seconds the job runs at least P / ratio
+        if time.monotonic() - self._resumed_at < self._last_pause / self.ratio: return
+        started = time.monotonic()
+        while interactive_demand() and time.monotonic() - started < MAX_PAUSE and not ctl.stopped:
+            ctl.wait(PAUSE_POLL)
+        self._resumed_at = time.monotonic()
+        self._last_pause = self._resumed_at - started
@@ -0,0 +1,325 @@
+"""Cross-retailer product matching with blocking keys.
+
+Comparing every product with every other one is quadratic, so each item is
+only compared with the items it shares a blocking key with:
+
+* its normalized reference (``ref:``),
+* brand + model-number tokens of its name (``model:``),
+* LSH bands of a MinHash signature of its name shingles (``lsh:``).
+
+Candidate pairs from different retailers are scored and matches are merged
+into product clusters. Clusters live in a SQLite database in the state
+directory and are updated incrementally after each scrape, from a background
+thread so the job's result never waits for them; a merge is never undone by
+a later scrape.
+
+    python matching.py            # prints every cluster spanning several retailers
+"""
+import re
+import os
+import sys
+import json
+import array
+import queue
+import sqlite3
+import threading
+import unicodedata
+
+import mmh3
+
+from state import state_path
+from urls import normalize_url
+
+DB_FILE = 'clusters.db'
+# Host parameters per IN (...) query, below SQLite's limit
+SQL_CHUNK = 500
+# Seconds a writer waits for another process's batch to commit
+LOCK_TIMEOUT = 60.0
+# Seconds an exiting scraper gives the background updater to finish
+UPDATE_WAIT = float(os.getenv('SCRAPER_MATCHING_WAIT', '10'))
+NUM_PERM = 64
+# 16 bands of 4 rows: pairs become candidates from a name similarity of about 0.5
+BANDS = 16
+ROWS = NUM_PERM // BANDS
+SHINGLE_SIZE = 3
+# Keys shared by more items than this (a bare brand, a generic word) say nothing
+MAX_BLOCK = 100
+MATCH_THRESHOLD = 0.7
+MIN_REFERENCE_LENGTH = 4
+
+KNOWN_BRANDS = {
+    "acer", "apple", "asus", "dell", "hp", "huawei", "lenovo", "lg", "msi", "oppo", "realme",
+    "samsung", "sony", "tcl", "toshiba", "xiaomi", "infinix", "tecno", "honor", "canon", "epson", "brother",
+}
+UNIT_TOKEN = re.compile(r'^\d+[a-z]{1,3}$')
+REFERENCE_LABEL = re.compile(r'^\s*(r[ée]f[ée]rence|ref|sku|code)\s*[:.#-]?\s*', re.I)
+
+def _ascii(text):
+    return unicodedata.normalize('NFKD', text or "").encode('ascii', 'ignore').decode('ascii').lower()
+
+
+def normalize_reference(ref):
+    """Canonical form of a reference or model number: label removed, upper case, alphanumerics only."""
+    if not ref: return None
+    ref = REFERENCE_LABEL.sub('', _ascii(ref))
+    ref = re.sub(r'[^0-9a-z]', '', ref).upper()
+    return ref if len(ref) >= MIN_REFERENCE_LENGTH else None
+
+
+def name_tokens(name):
+    return re.findall(r'[0-9a-z]+', _ascii(name))
+
+
+def model_numbers(tokens):
+    """Tokens mixing letters and digits, e.g. 82xf00bjfg or a15, but not quantities like 8go or 512gb."""
+    return {t for t in tokens if len(t) >= 3 and re.search(r'\d', t) and re.search(r'[a-z]', t) and not UNIT_TOKEN.match(t)}
+
+
+def brand_of(tokens):
+    for t in tokens:
+        if t in KNOWN_BRANDS: return t
+    return tokens[0] if tokens else ""
+
+
+def shingles(tokens):
+    """Character shingles of each token, so "16go" and "16 go" still overlap."""
+    out = set()
+    for t in tokens:
+        if len(t) <= SHINGLE_SIZE: out.add(t)
+        else: out.update(t[i:i + SHINGLE_SIZE] for i in range(len(t) - SHINGLE_SIZE + 1))
+    return out
+
+
+def minhash(features):
+    """NUM_PERM-slot signature; slot i uses h1 + i * h2 of a single 128-bit mmh3 hash."""
+    signature = [0xFFFFFFFF] * NUM_PERM
+    for feature in features:
+        h1, h2 = mmh3.hash64(feature, signed=False)
+        for i in range(NUM_PERM):
+            h = (h1 + i * h2) & 0xFFFFFFFF
+            if h < signature[i]: signature[i] = h
+    return signature
+
+
+def similarity(sig_a, sig_b):
+    """MinHash estimate of the Jaccard similarity of two names."""
+    return sum(a == b for a, b in zip(sig_a, sig_b)) / float(NUM_PERM)
+
+
+def profile(item, domain=None):
+    """Matching features of one scraped item."""
+    tokens = name_tokens(item.get("name"))
+    brand = brand_of(tokens)
+    reference = normalize_reference(item.get("reference"))
+    models = model_numbers(tokens)
+    signature = minhash(shingles(tokens))
+    keys = [f"model:{brand}:{m}" for m in sorted(models)]
+    if reference: keys.append(f"ref:{reference}")
+    keys += [f"lsh:{b}:{mmh3.hash(','.join(map(str, signature[b * ROWS:(b + 1) * ROWS])), signed=False)}" for b in range(BANDS)]
+    return {
+        "domain": domain or item.get("domain"),
+        "name": item.get("name"),
+        "url": item.get("url"),
+        "priceAmount": item.get("priceAmount") or 0.0,
+        "reference": reference,
+        "models": sorted(models | ({reference.lower()} if reference else set())),
+        "signature": signature,
+        "keys": keys,
+    }
+
+
+def score(a, b):
+    """Match confidence in [0, 1] for two profiles."""
+    if a["reference"] and b["reference"]:
+        # Two references name two SKUs, however alike the titles are
+        return 1.0 if a["reference"] == b["reference"] else 0.0
+    models_a, models_b = set(a["models"]), set(b["models"])
+    s = similarity(a["signature"], b["signature"])
+    if models_a & models_b: s = 0.5 + 0.5 * s
+    elif models_a and models_b: s *= 0.5  # both name a model number and they differ
+    else: s *= 0.8
+    prices = sorted(p for p in (a["priceAmount"], b["priceAmount"]) if p > 0)
+    if len(prices) == 2 and prices[1] > 2 * prices[0]: s *= 0.5
+    return s
+
+
+class ClusterIndex:
+    """Items, their blocking keys and the clusters they belong to, stored in the DB_FILE database.
+
+    Adding an item reads and writes only the rows of its blocks and clusters. Writers hold the
+    database's write lock for their whole batch (BEGIN IMMEDIATE), so concurrent scraper processes
+    merge clusters one batch after the other instead of overwriting each other's."""
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def _others(self, keys, domain):
+        """(key, profile) of the items among keys listed by another retailer than domain."""
+        keys = list(keys)
+        for i in range(0, len(keys), SQL_CHUNK):
+            chunk = keys[i:i + SQL_CHUNK]
+            rows = self.conn.execute(f"SELECT key, profile, signature FROM items WHERE domain IS NOT ? AND key IN ({','.join('?' * len(chunk))})",
+                                     [domain] + chunk)
+            for key, stored, signature in rows:
+                yield key, dict(json.loads(stored), signature=array.array('I', signature).tolist())
+
+    def _unblock(self, key):
+        self.conn.execute("DELETE FROM blocks WHERE key = ?", (key,))
+
+    def _compatible(self, ca, cb):
+        """A cluster holds one listing per retailer and never two different references."""
+        rows = self.conn.execute("SELECT cluster, domain, reference FROM items WHERE cluster IN (?, ?)", (ca, cb)).fetchall()
+        a, b = [r for r in rows if r[0] == ca], [r for r in rows if r[0] == cb]
+        if {r[1] for r in a} & {r[1] for r in b}: return False
+        refs_a, refs_b = {r[2] for r in a if r[2]}, {r[2] for r in b if r[2]}
+        return not (refs_a and refs_b and not refs_a & refs_b)
+
+    def _size(self, cluster):
+        return self.conn.execute("SELECT COUNT(*) FROM items WHERE cluster = ?", (cluster,)).fetchone()[0]
+
+    def _merge(self, a, b):
+        ca, cb = self.cluster_of_key(a), self.cluster_of_key(b)
+        if ca == cb or not self._compatible(ca, cb): return
+        # Relabel the smaller cluster
+        if self._size(ca) < self._size(cb): ca, cb = cb, ca
+        self.conn.execute("UPDATE items SET cluster = ? WHERE cluster = ?", (ca, cb))
+
+    def candidates(self, key, blocks):
+        found = set()
+        for block in blocks:
+            members = [r[0] for r in self.conn.execute("SELECT key FROM blocks WHERE block = ? LIMIT ?", (block, MAX_BLOCK + 1))]
+            if len(members) > MAX_BLOCK: continue
+            found.update(members)
+        found.discard(key)
+        return found
+
+    def _store(self, key, p, cluster):
+        # Blocking keys live in the blocks table, the signature as packed 32-bit slots
+        stored = {k: v for k, v in p.items() if k not in ("cluster", "keys", "signature")}
+        self.conn.execute("INSERT OR REPLACE INTO items (key, cluster, domain, reference, profile, signature) VALUES (?, ?, ?, ?, ?, ?)",
+                          (key, cluster, p["domain"], p["reference"], json.dumps(stored), array.array('I', p["signature"]).tobytes()))
+        self.conn.executemany("INSERT OR IGNORE INTO blocks (block, key) VALUES (?, ?)", [(block, key) for block in p["keys"]])
+
+    def add(self, item, domain=None):
+        """Indexes (or re-indexes) one item and merges it with its matches; returns its cluster id."""
+        if not item.get("url"): return None
+        key = normalize_url(item["url"])
+        p = profile(item, domain)
+        cluster = self.cluster_of_key(key)
+        if cluster: self._unblock(key)
+        self._store(key, p, cluster or key)
+        scored = [(score(p, o), other) for other, o in self._others(self.candidates(key, p["keys"]), p["domain"])]
+        # Best matches first, so a vague title joins the closest cluster rather than the first one seen
+        for s, other in sorted(scored, reverse=True):
+            if s < MATCH_THRESHOLD: break
+            self._merge(key, other)
+        return self.cluster_of_key(key)
+
+    def cluster_of_key(self, key):
+        row = self.conn.execute("SELECT cluster FROM items WHERE key = ?", (key,)).fetchone()
+        return row and row[0]
+
+    def cluster_of(self, url):
+        return self.cluster_of_key(normalize_url(url))
+
+    def multi_retailer_clusters(self):
+        out = []
+        clusters = [r[0] for r in self.conn.execute("SELECT cluster FROM items GROUP BY cluster HAVING COUNT(DISTINCT domain) > 1")]
+        for cluster_id in clusters:
+            members = [json.loads(r[0]) for r in self.conn.execute("SELECT profile FROM items WHERE cluster = ?", (cluster_id,))]
+            out.append({"id": cluster_id, "items": [
+                {k: m[k] for k in ("domain", "name", "url", "priceAmount", "reference")} for m in members]})
+        return out
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS items (key TEXT PRIMARY KEY, cluster TEXT NOT NULL, domain TEXT, reference TEXT, profile TEXT NOT NULL,
+    signature BLOB NOT NULL);
+CREATE INDEX IF NOT EXISTS items_cluster ON items (cluster);
+CREATE TABLE IF NOT EXISTS blocks (block TEXT NOT NULL, key TEXT NOT NULL, PRIMARY KEY (block, key)) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS blocks_key ON blocks (key);
+"""
+
+
+def _connect():
+    # Autocommit mode: transactions are opened explicitly, as BEGIN IMMEDIATE for writers
+    conn = sqlite3.connect(state_path(DB_FILE), timeout=LOCK_TIMEOUT, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def update_clusters(items, domain=None):
+    """Adds freshly scraped items to the persisted clusters; returns {item url: cluster id}."""
+    conn = _connect()
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            index = ClusterIndex(conn)
+            assigned = {item["url"]: index.add(item, domain) for item in items if item.get("url")}
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+    finally:
+        conn.close()
+    return assigned
+
+
+def load_clusters():
+    return ClusterIndex(_connect())
+
+
+class _Updater:
+    """Single background thread indexing scraped items, so matching never delays a job's result."""
+
+    def __init__(self):
+        self._queue = queue.Queue()
+        self._pending = 0
+        self._cond = threading.Condition()
+        self._thread = None
+
+    def submit(self, items, domain=None):
+        # Only the fields profile() reads; the job's item store can go
+        items = [{k: item.get(k) for k in ("name", "reference", "url", "priceAmount", "domain")} for item in items]
+        with self._cond:
+            self._pending += 1
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="cluster-updater", daemon=True)
+                self._thread.start()
+        self._queue.put((items, domain))
+
+    def _run(self):
+        while True:
+            items, domain = self._queue.get()
+            try: update_clusters(items, domain)
+            except Exception as e: print(f"Product matching error: {e}", file=sys.stderr)
+            with self._cond:
+                self._pending -= 1
+                self._cond.notify_all()
+
+    def wait(self, timeout=None):
+        """Waits for the submitted updates for at most timeout seconds; returns how many are left."""
+        with self._cond:
+            self._cond.wait_for(lambda: not self._pending, timeout)
+            return self._pending
+
+
+_updater = _Updater()
+
+
+def submit_update(items, domain=None):
+    """Queues update_clusters(items, domain) on the background updater."""
+    _updater.submit(items, domain)
+
+
+def wait_for_updates(timeout=UPDATE_WAIT):
+    """Lets queued updates finish before the process exits; returns how many were left undone."""
+    left = _updater.wait(timeout)
+    if left: print(f"Product matching: {left} update(s) left undone", file=sys.stderr)
+    return left
+
+
+if __name__ == "__main__":
+    print(json.dumps(load_clusters().multi_retailer_clusters()))
@@ -0,0 +1,169 @@
+"""Bulk persistence straight into the Postgres database behind the Prisma schema.
+
+With ``SCRAPER_PERSIST_BACKEND=postgres`` products are no longer written
+one PostgREST call (or two) at a time. Each batch is streamed with COPY
+into a temporary staging table, then merged into "Product" by two
+set-based statements, UPDATE ... FROM for URLs already known and INSERT
+... WHERE NOT EXISTS for the new ones, and the Website's scrapedData /
+lastScraped are updated in the same transaction. With the spool on
+(spool.py) that holds per drained batch: a job with more products than a
+spool batch commits in several, the last one with its summary. The
+connection string is the backend's ``DATABASE_URL``; Prisma-only URL
+parameters such as ``?schema=`` are translated or dropped.
+
+Product.url has no unique index, so there is nothing for ON CONFLICT to
+work on; merges take a transaction-level advisory lock instead, so two
+concurrent batches never insert the same URL twice.
+
+    python pg_store.py load result.json --websiteId ID   # persist a scraper.py JSON result
+"""
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(__file__), 'libs'))
+import json
+import time
+import argparse
+import threading
+import urllib.parse
+
+BACKEND = "postgres"
+# Connection URL parameters understood by Prisma but not by libpq
+PRISMA_PARAMS = {"schema", "pgbouncer", "connection_limit", "pool_timeout", "socket_timeout", "statement_cache_size"}
+MERGE_LOCK = "scraper:Product.url"
+
+STAGE_COLUMNS = ("name", "price", "priceAmount", "reference", "overview", "category", "url", "domain")
+
+CREATE_STAGE = """
+CREATE TEMP TABLE product_stage (
+    seq bigserial, name text, price text, "priceAmount" double precision, reference text,
+    overview text, category text, url text, domain text
+) ON COMMIT DROP
+"""
+# The last row of a URL in the batch wins, like sequential upserts would
+LATEST = "(SELECT DISTINCT ON (url) * FROM product_stage ORDER BY url, seq DESC)"
+MERGE_UPDATE = f"""
+UPDATE "Product" p SET name = s.name, price = s.price, "priceAmount" = s."priceAmount", reference = s.reference,
+    overview = s.overview, category = s.category, domain = s.domain, "websiteId" = %(website)s,
+    "scrapedAt" = %(now)s, "updatedAt" = %(now)s
+FROM {LATEST} s WHERE p.url = s.url
+"""
+MERGE_INSERT = f"""
+INSERT INTO "Product" (id, name, price, "priceAmount", reference, overview, category, url, domain, "websiteId",
+    "scrapedAt", "createdAt", "updatedAt")
+SELECT gen_random_uuid()::text, s.name, s.price, s."priceAmount", s.reference, s.overview, s.category, s.url, s.domain,
+    %(website)s, %(now)s, %(now)s, %(now)s
+FROM {LATEST} s WHERE NOT EXISTS (SELECT 1 FROM "Product" p WHERE p.url = s.url)
+"""
+UPDATE_WEBSITE = """
+UPDATE "Website" SET "scrapedData" = %(summary)s::jsonb, "lastScraped" = %(now)s, "updatedAt" = %(now)s WHERE id = %(website)s
+"""
+
+_local = threading.local()
+
+
+def enabled():
+    # Read on every call: DATABASE_URL usually comes from the backend .env, loaded after import
+    return os.getenv('SCRAPER_PERSIST_BACKEND', '').lower() == BACKEND and bool(os.getenv('DATABASE_URL'))
+
+
+def connection_params(url):
+    """libpq URL and search_path for a Prisma DATABASE_URL."""
+    parts = urllib.parse.urlsplit(url)
+    query = urllib.parse.parse_qsl(parts.query, keep_blank_values=True)
+    schema = dict(query).get("schema")
+    query = [(k, v) for k, v in query if k not in PRISMA_PARAMS]
+    return urllib.parse.urlunsplit(parts._replace(query=urllib.parse.urlencode(query))), schema
+
+
+def _psycopg():
+    import psycopg
+    return psycopg
+
+
+def get_connection():
+    """Per-thread connection, reopened when the previous one broke."""
+    conn = getattr(_local, "conn", None)
+    if conn is None or conn.closed or conn.broken:
+        url, schema = connection_params(os.environ['DATABASE_URL'])
+        conn = _psycopg().connect(url)
+        if schema:
+            conn.execute("SELECT set_config('search_path', %s, false)", (schema,))
+            conn.commit()
+        _local.conn = conn
+    return conn
+
+
+def _clean(value):
+    # COPY rejects NUL bytes in text
+    return value.replace("\x00", "") if isinstance(value, str) else value
+
+
+def product_row(item, domain=""):
+    """Staging row of an item, with the defaults save_products uses."""
+    return (_clean(item.get("name", "Unknown")), _clean(item.get("price", "Not found")), float(item.get("priceAmount") or 0.0),
+            _clean(item.get("reference", "Not found")), _clean(item.get("overview", "Not found")),
+            _clean(item.get("category", "Not found")), _clean(item.get("url")), _clean(item.get("domain") or domain))
+
+
+def save(website_id, url, items, summary=None, domain=""):
+    """Merges items into Product and, with a summary, updates the Website, in one transaction.
+    Returns the number of products written."""
+    started = time.monotonic()
+    rows = [product_row(dict(item, url=item.get("url") or url), domain) for item in items]
+    params = {"website": website_id, "now": None}
+    written = 0
+    conn = get_connection()
+    try:
+        with conn.transaction():
+            cur = conn.cursor()
+            params["now"] = cur.execute("SELECT now() AT TIME ZONE 'UTC'").fetchone()[0]
+            if rows:
+                cur.execute(CREATE_STAGE)
+                columns = ", ".join(f'"{c}"' for c in STAGE_COLUMNS)
+                with cur.copy(f"COPY product_stage ({columns}) FROM STDIN") as copy:
+                    for row in rows: copy.write_row(row)
+                cur.execute("SELECT pg_advisory_xact_lock(hashtext(%s))", (MERGE_LOCK,))
+                written += cur.execute(MERGE_UPDATE, params).rowcount
+                written += cur.execute(MERGE_INSERT, params).rowcount
+            if summary is not None:
+                cur.execute(UPDATE_WEBSITE, dict(params, summary=json.dumps(summary)))
+    except Exception:
+        # Leave no half-open session behind for the next batch of this thread
+        try: conn.close()
+        except Exception: pass
+        raise
+    if rows:
+        print(f"Postgres: merged {len(rows)} product(s) in {time.monotonic() - started:.2f}s", file=sys.stderr)
+    return written
+
+
+def fetch_website(website_id):
+    row = get_connection().execute('SELECT id, url FROM "Website" WHERE id = %s', (website_id,)).fetchone()
+    get_connection().commit()
+    return {"id": row[0], "url": row[1]} if row else None
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    sub = parser.add_subparsers(dest='command', required=True)
+    load = sub.add_parser('load', help="Persist the result printed by scraper.py")
+    load.add_argument('file', help="JSON file, or - for stdin")
+    load.add_argument('--websiteId', required=True)
+    args = parser.parse_args()
+
+    from dotenv import load_dotenv
+    load_dotenv(os.path.join(os.path.dirname(__file__), '../.env'))
+    if not os.getenv('DATABASE_URL'):
+        print(json.dumps({"error": "DATABASE_URL is not set"})); return
+    with (sys.stdin if args.file == '-' else open(args.file, encoding='utf-8')) as f:
+        data = json.load(f)
+    data = data.get("data", data)
+    items = data["data"] if data.get("type") == "list" else [data]
+    summary = {"type": "list", "count": len(items), "url": data.get("url"), "timestamp": data.get("timestamp")} if data.get("type") == "list" else data
+    started = time.time()
+    written = save(args.websiteId, data.get("url"), items, summary, data.get("domain", ""))
+    print(json.dumps({"success": True, "written": written, "elapsed": round(time.time() - started, 3)}))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""Staged pipeline with bounded queues between the stages.
+
+    pipeline = Pipeline([Stage("filter", keep_matches), Stage("persist", save, workers=2)])
+    pipeline.submit(page_items)     # called by the crawl for every page
+    metrics = pipeline.close()      # drains every stage, in order
+
+Each stage has its own worker threads reading a bounded queue. A stage
+function returns what goes on to the next stage, or None to drop it. A full
+queue blocks whoever feeds it: when persistence falls behind, filtering
+stalls and then the crawl itself waits before handing over its next page,
+so memory stays bounded while network, parsing and database latency
+overlap instead of adding up.
+
+metrics() reports per stage the queue depth (now and at its highest),
+items in/out, errors, busy seconds, seconds spent blocked on the next
+queue and throughput; "source" is the same for the producer. Items a stage
+function raised on are kept, so the caller can deal with them once the
+pipeline is closed (see failed()).
+"""
+import os
+import sys
+import time
+import queue
+import threading
+
+QUEUE_SIZE = int(os.getenv('SCRAPER_PIPELINE_QUEUE', '4'))
+
+_DONE = object()
+
+
+class Stage:
+    def __init__(self, name, fn, workers=1, maxsize=QUEUE_SIZE):
+        self.name = name
+        self.fn = fn
+        self.workers = max(1, workers)
+        self.queue = queue.Queue(maxsize)
+        self.received = self.sent = self.dropped = self.errors = 0
+        self.busy = self.blocked = 0.0
+        self.max_queued = 0
+        self.failed = []
+        self._lock = threading.Lock()
+
+    def metrics(self, elapsed):
+        with self._lock:
+            return {"workers": self.workers, "queued": self.queue.qsize(), "maxQueued": self.max_queued,
+                    "in": self.received, "out": self.sent, "dropped": self.dropped, "errors": self.errors,
+                    "busy": round(self.busy, 3), "blocked": round(self.blocked, 3),
+                    "throughput": round(self.sent / elapsed, 2) if elapsed else None}
+
+
+class Pipeline:
+    def __init__(self, stages):
+        self.stages = list(stages)
+        self.submitted = 0
+        self.blocked = 0.0
+        self.started = time.monotonic()
+        self.elapsed = None
+        self._closed = False
+        self._lock = threading.Lock()
+        self._threads = []
+        for index, stage in enumerate(self.stages):
+            downstream = self.stages[index + 1] if index + 1 < len(self.stages) else None
+            threads = [threading.Thread(target=self._run, args=(stage, downstream), name=f"pipeline-{stage.name}-{i}", daemon=True)
+                       for i in range(stage.workers)]
+            for t in threads: t.start()
+            self._threads.append(threads)
+
+    def _put(self, stage, item):
+        """Enqueues item on stage; returns the seconds spent waiting for room."""
+        started = time.monotonic()
+        stage.queue.put(item)
+        with stage._lock:
+            stage.received += 1
+            stage.max_queued = max(stage.max_queued, stage.queue.qsize())
+        return time.monotonic() - started
+
+    def submit(self, item):
+        """Hands item to the first stage, waiting while its queue is full."""
+        if self._closed: raise RuntimeError("pipeline is closed")
+        waited = self._put(self.stages[0], item)
+        with self._lock:
+            self.submitted += 1
+            self.blocked += waited
+
+    def _run(self, stage, downstream):
+        while True:
+            item = stage.queue.get()
+            if item is _DONE: return
+            started = time.monotonic()
+            try:
+                result = stage.fn(item)
+            except Exception as e:
+                print(f"Pipeline stage {stage.name} failed: {e}", file=sys.stderr)
+                with stage._lock:
+                    stage.errors += 1
+                    stage.failed.append(item)
+                    stage.busy += time.monotonic() - started
+                continue
+            with stage._lock:
+                stage.busy += time.monotonic() - started
+                if result is None: stage.dropped += 1
+                else: stage.sent += 1
+            if result is not None and downstream is not None:
+                waited = self._put(downstream, result)
+                with stage._lock: stage.blocked += waited
+
+    def close(self):
+        """Waits until everything submitted went through every stage; returns the metrics."""
+        if not self._closed:
+            self._closed = True
+            # Stage by stage, so a stage only stops once nothing upstream can feed it any more
+            for stage, threads in zip(self.stages, self._threads):
+                for _ in threads: stage.queue.put(_DONE)
+                for t in threads: t.join()
+            self.elapsed = time.monotonic() - self.started
+        return self.metrics()
+
+    def failed(self):
+        """Items some stage raised on, in no particular order; they did not reach the stages after it."""
+        return [item for stage in self.stages for item in stage.failed]
+
+    def metrics(self):
+        elapsed = self.elapsed or time.monotonic() - self.started
+        data = {"elapsed": round(elapsed, 3), "source": {"submitted": self.submitted, "blocked": round(self.blocked, 3)}}
+        for stage in self.stages:
+            data[stage.name] = stage.metrics(elapsed)
+        return data
+
+    def summary(self):
+        """One line for the log: items and max queue depth per stage."""
+        m = self.metrics()
+        stages = ", ".join(f"{s.name} {m[s.name]['out']}/{m[s.name]['in']} (max queue {m[s.name]['maxQueued']}, "
+                           f"busy {m[s.name]['busy']:.1f}s)" for s in self.stages)
+        return f"{m['source']['submitted']} page(s) in {m['elapsed']:.1f}s, crawl blocked {m['source']['blocked']:.1f}s; {stages}"
@@ -0,0 +1,246 @@
+"""Price normalization with per-domain locale profiles.
+
+A profile says which character is the decimal separator, which ones group
+thousands and whether amounts above a threshold are really millimes
+(``1150000`` meaning ``1150.000 DT``). Retailers whose format is known get a
+fixed profile; the others use ``auto``, which guesses the separators from
+the string. An amount a fixed profile cannot read ("1,099,000" under a
+decimal comma) is guessed like ``auto`` does. Percentages, quantities
+("4 x 299,000 DT") and savings ("Économisez 200,000 DT") are not prices and
+are skipped before the lowest remaining amount is taken. Results are memoized per (profile, text), since a listing
+repeats the same handful of price strings, and every failure carries a
+reason instead of silently becoming 0.0.
+
+    python prices.py                 # corpus check + fuzz + throughput benchmark
+    python prices.py --items 100000  # larger benchmark
+"""
+import re
+import sys
+import time
+import random
+import collections
+import functools
+
+PriceResult = collections.namedtuple("PriceResult", "value reason")
+
+# Failure reasons
+EMPTY, NO_DIGITS, NO_PRICE, MALFORMED, NOT_POSITIVE = "empty", "no_digits", "no_price", "malformed", "not_positive"
+
+
+class PriceProfile:
+    def __init__(self, name, decimal=None, thousands="", millimes_above=None):
+        """decimal=None guesses the separators from each string."""
+        self.name = name
+        self.decimal = decimal
+        self.thousands = thousands
+        self.millimes_above = millimes_above
+        self.strip_thousands = re.compile("[" + re.escape(thousands) + "]") if thousands else None
+
+
+PROFILES = {
+    "auto": PriceProfile("auto", millimes_above=50000),
+    # "1 099,000 DT", "1.099,000 DT"
+    "tnd": PriceProfile("tnd", decimal=",", thousands=". ", millimes_above=50000),
+    # Machine-readable values from meta tags and JSON-LD: "1099.000"
+    "machine": PriceProfile("machine", decimal=".", millimes_above=50000),
+}
+DOMAIN_PROFILES = {
+    "tunisianet.com.tn": "tnd",
+    "mytek.tn": "tnd",
+}
+
+WHITESPACE = re.compile(r'[\s\u00A0\u1680\u180E\u2000-\u200B\u202F\u205F\u3000]+')
+# A space followed by exactly three digits groups thousands ("1 099,000")
+THOUSANDS_SPACE = re.compile(r'(?<=\d) (?=\d{3}(?!\d))')
+# Anything that is neither a digit nor a separator ends an amount: "1 299,000 DT 1 099,000 DT" holds two
+AMOUNTS = re.compile(r'\d[\d.,]*')
+# Amounts that are not a price: "-10%", "4 x 299,000 DT", "Économisez 200,000 DT"
+PERCENT = re.compile(r'\s*%')
+QUANTITY = re.compile(r'\s*[x\u00D7]\s*\d', re.I)
+SAVINGS = re.compile(r'[ée]conomi|remise|r[ée]duction|gagnez|\bsave', re.I)
+
+
+def profile_for(domain=None):
+    for d, name in DOMAIN_PROFILES.items():
+        if domain and d in domain: return PROFILES[name]
+    return PROFILES["auto"]
+
+
+def _guess_number(clean):
+    """Separator heuristics for an unknown format; returns a float() compatible string."""
+    comma_count, dot_count = clean.count(','), clean.count('.')
+    if comma_count and dot_count:
+        # The right-most separator is the decimal one: 1.099,000 or 1,099.00
+        if clean.rfind(',') > clean.rfind('.'): return clean.replace('.', '').replace(',', '.')
+        return clean.replace(',', '')
+    if comma_count:
+        # 849,000 (millimes) and 19,99 are decimals, 1,099,000 groups thousands
+        return clean.replace(',', '.') if comma_count == 1 else clean.replace(',', '')
+    if dot_count > 1: return clean.replace('.', '')
+    return clean
+
+
+def _fits(amount, profile):
+    """Whether amount reads under the profile: one decimal separator at most, no grouping after it."""
+    decimal = amount.rfind(profile.decimal)
+    if amount.count(profile.decimal) > 1: return False
+    return decimal < 0 or not any(c in profile.thousands for c in amount[decimal + 1:])
+
+
+def _to_float(amount, profile):
+    if profile.decimal is None or not _fits(amount, profile):
+        number = _guess_number(amount)
+    else:
+        number = profile.strip_thousands.sub('', amount) if profile.strip_thousands else amount
+        number = number.replace(profile.decimal, '.')
+    return float(number)
+
+
+def _price_amounts(text):
+    """Amounts of text, without percentages, quantities and savings."""
+    amounts, start = [], 0
+    for match in AMOUNTS.finditer(text):
+        before, after = text[start:match.start()], text[match.end():]
+        start = match.end()
+        if PERCENT.match(after) or QUANTITY.match(after) or SAVINGS.search(before): continue
+        amounts.append(match.group())
+    return amounts
+
+
+@functools.lru_cache(maxsize=16384)
+def _normalize(text, profile_name):
+    profile = PROFILES[profile_name]
+    text = WHITESPACE.sub(' ', text).strip() if text else ""
+    if not text: return PriceResult(0.0, EMPTY)
+    text = THOUSANDS_SPACE.sub('', text)
+    if not AMOUNTS.search(text): return PriceResult(0.0, NO_DIGITS)
+    amounts = _price_amounts(text)
+    if not amounts: return PriceResult(0.0, NO_PRICE)
+    values = []
+    for amount in amounts:
+        try: values.append(_to_float(amount.strip('.,'), profile))
+        except ValueError: continue
+    if not values: return PriceResult(0.0, MALFORMED)
+    values = [v for v in values if v > 0]
+    if not values: return PriceResult(0.0, NOT_POSITIVE)
+    # Old and discounted price, or a "from - to" range: the lower one is what the customer pays
+    value = min(values)
+    if profile.millimes_above and value > profile.millimes_above:
+        value = value / 1000.0
+    return PriceResult(value, None)
+
+
+def normalize_price(text, domain=None, profile=None):
+    """PriceResult(value, reason) for one price string; reason is None on success."""
+    return _normalize(text or "", (profile or profile_for(domain)).name)
+
+
+def normalize_prices(texts, domain=None, profile=None):
+    """Batch form of normalize_price: one result per input, in order."""
+    name = (profile or profile_for(domain)).name
+    return [_normalize(text or "", name) for text in texts]
+
+
+def failure_counts(results):
+    return collections.Counter(r.reason for r in results if r.reason)
+
+
+# --- corpus check and benchmark -------------------------------------------
+
+CORPUS = [
+    # (domain, text, expected value or None when it must fail)
+    ("tunisianet.com.tn", "1 099,000 DT", 1099.0),
+    ("tunisianet.com.tn", "849,000 DT", 849.0),
+    ("tunisianet.com.tn", "1 299,000 DT", 1299.0),
+    ("tunisianet.com.tn", "12 499,000 DT", 12499.0),
+    ("tunisianet.com.tn", "1.099,000 DT", 1099.0),
+    ("tunisianet.com.tn", "59,900 DT", 59.9),
+    ("tunisianet.com.tn", "1 299,000 DT 1 099,000 DT", 1099.0),
+    ("mytek.tn", "Prix spécial 2 349,000 DT Prix normal 2 599,000 DT", 2349.0),
+    ("mytek.tn", "À partir de 399,000 DT", 399.0),
+    ("mytek.tn", "1 150 000", 1150.0),
+    ("mytek.tn", "1 299,000 1 099,000", 1099.0),
+    ("tunisianet.com.tn", "1,099,000 DT", 1099.0),
+    ("mytek.tn", "1,299.000 TND", 1299.0),
+    ("tunisianet.com.tn", "-10% 1 099,000 DT", 1099.0),
+    ("tunisianet.com.tn", "Économisez 200,000 DT 1 099,000 DT", 1099.0),
+    ("mytek.tn", "4 x 299,000 DT", 299.0),
+    ("mytek.tn", "Remise -150,000 DT 1 349,000 DT", 1349.0),
+    (None, "-15%", None),
+    ("wiki.tn", "1,099.000 TND", 1099.0),
+    ("wiki.tn", "1.099,000 DT", 1099.0),
+    ("wiki.tn", "849,000 DT", 849.0),
+    ("wiki.tn", "19.99", 19.99),
+    ("wiki.tn", "1.299.000", 1299.0),
+    ("wiki.tn", "1150000", 1150.0),
+    ("wiki.tn", "2,499 DT", 2.499),
+    (None, "1 099,000 DT", 1099.0),
+    (None, "Sur commande", None),
+    (None, "", None),
+    (None, "0,000 DT", None),
+    (None, "Prix: -", None),
+]
+
+
+def check_corpus():
+    failures = []
+    for domain, text, expected in CORPUS:
+        result = normalize_price(text, domain)
+        ok = result.reason is not None if expected is None else (result.reason is None and abs(result.value - expected) < 1e-6)
+        if not ok: failures.append((domain, text, expected, result))
+    return failures
+
+
+def _format_tnd(value, rng):
+    """Renders value the way Tunisian retailers do, with random spacing and grouping."""
+    dinars, millimes = divmod(int(round(value * 1000)), 1000)
+    group = rng.choice([" ", " ", ".", ""])
+    grouped = f"{dinars:,}".replace(",", group)
+    return f"{grouped},{millimes:03d}{rng.choice([' DT', 'DT', ' TND', ''])}"
+
+
+def fuzz(count=5000, seed=1):
+    """Round-trips random TND prices through the tnd and auto profiles."""
+    rng = random.Random(seed)
+    failures = []
+    for _ in range(count):
+        value = round(rng.uniform(1, 40000), rng.choice([0, 3]))
+        text = _format_tnd(value, rng)
+        for domain in ("tunisianet.com.tn", None):
+            result = normalize_price(text, domain)
+            if result.reason or abs(result.value - value) > 1e-6: failures.append((domain, text, value, result))
+    return failures
+
+
+def benchmark(items=10000, distinct=300, seed=2):
+    """Items per second for a crawl with `distinct` different price strings, cold and warm cache."""
+    rng = random.Random(seed)
+    pool = [_format_tnd(round(rng.uniform(10, 9000)), rng) for _ in range(distinct)]
+    texts = [rng.choice(pool) for _ in range(items)]
+    timings = {}
+    for label in ("cold", "warm"):
+        if label == "cold": _normalize.cache_clear()
+        started = time.perf_counter()
+        normalize_prices(texts, "tunisianet.com.tn")
+        timings[label] = items / max(time.perf_counter() - started, 1e-9)
+    return timings
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--items', type=int, default=10000)
+    parser.add_argument('--fuzz', type=int, default=5000)
+    args = parser.parse_args()
+
+    failures = check_corpus() + fuzz(args.fuzz)
+    for domain, text, expected, result in failures[:20]:
+        print(f"FAIL {domain or 'auto'}: {text!r} expected {expected}, got {result}")
+    timings = benchmark(args.items)
+    print(f"corpus {len(CORPUS)} + fuzz {args.fuzz}: {len(failures)} failure(s)")
+    print(f"{args.items} items: {timings['cold']:,.0f}/s cold, {timings['warm']:,.0f}/s warm")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""Limit and top-K list queries with early termination of the crawl.
+
+``--limit N`` stops paginating once N matching items were seen.
+``--topK N --orderBy priceAmount`` (``-priceAmount`` for most expensive
+first) keeps only the N best matches in a bounded heap. When the domain
+can sort its listing by price, the crawl asks for that order and stops as
+soon as a page reaches the heap bound: every later page is at least as
+expensive, so the answer cannot change anymore.
+"""
+import heapq
+import itertools
+import urllib.parse
+
+ORDER_FIELDS = ("priceAmount",)
+
+
+class ListQuery:
+    def __init__(self, filter_fn=None, limit=None, top_k=None, order_by="priceAmount"):
+        """filter_fn narrows a list of items to the job's matches (identity when None)."""
+        self.filter_fn = filter_fn or (lambda items: items)
+        self.limit = limit
+        self.top_k = top_k
+        self.descending = (order_by or "").startswith("-")
+        self.order_field = (order_by or "priceAmount").lstrip("-")
+        if self.order_field not in ORDER_FIELDS:
+            raise ValueError(f"Unsupported orderBy: {order_by}")
+        self.sorted_listing = False
+        self._heap = []
+        self._seen = 0
+        self._tie = itertools.count()
+
+    def _key(self, item):
+        value = item.get(self.order_field) or 0.0
+        return value if self.descending else -value
+
+    def _rankable(self, item):
+        # Unparsed prices (0.0) would always look cheapest
+        return (item.get(self.order_field) or 0.0) > 0
+
+    def offer(self, items):
+        """Feeds matching items; returns True once later pages can no longer change the answer."""
+        matches = self.filter_fn(items)
+        self._seen += len(matches)
+        if self.top_k:
+            for item in matches:
+                if not self._rankable(item): continue
+                # Max-heap of the K best by _key: the root is the current worst kept item
+                entry = (self._key(item), next(self._tie), item)
+                if len(self._heap) < self.top_k: heapq.heappush(self._heap, entry)
+                elif entry[0] > self._heap[0][0]: heapq.heapreplace(self._heap, entry)
+            return self._bound_reached(items)
+        return bool(self.limit) and self._seen >= self.limit
+
+    def _bound_reached(self, page_items):
+        if not self.sorted_listing or len(self._heap) < self.top_k: return False
+        values = [i.get(self.order_field) for i in page_items if self._rankable(i)]
+        if not values: return False
+        bound = -self._heap[0][0] if not self.descending else self._heap[0][0]
+        # On a listing sorted by price the next pages start where this one ends
+        return max(values) >= bound if not self.descending else min(values) <= bound
+
+    def results(self):
+        if self.top_k:
+            return [entry[2] for entry in sorted(self._heap, key=lambda e: (-e[0], e[1]))]
+        return None
+
+    def select(self, items):
+        """Answer of the query over a complete list of items."""
+        if self.top_k:
+            self._heap, self._seen = [], 0
+            self.offer(items)
+            return self.results()
+        matches = self.filter_fn(items)
+        return matches[:self.limit] if self.limit else matches
+
+    def crawl_url(self, url, config):
+        """URL asking the retailer for the listing in the query's price order, when it supports one."""
+        sort = (config or {}).get("price_sort")
+        if not self.top_k or not sort: return url
+        parts = urllib.parse.urlsplit(url)
+        query = urllib.parse.parse_qsl(parts.query, keep_blank_values=True)
+        params = urllib.parse.parse_qsl(sort["desc" if self.descending else "asc"])
+        if any(k in dict(query) for k, _ in params) and not all((k, v) in query for k, v in params):
+            # The user asked for another order; keep it and do not assume a price sort
+            return url
+        self.sorted_listing = True
+        merged = [(k, v) for k, v in query if k not in dict(params)] + params
+        return urllib.parse.urlunsplit(parts._replace(query=urllib.parse.urlencode(merged)))
@@ -0,0 +1,113 @@
+"""Adaptive revisit planning from observed catalog change rates.
+
+Every unfiltered list scrape records a fingerprint of each listing page and
+of the listing as a whole. Comparing consecutive fingerprints gives, per
+listing and per page, n visits and X detected changes over the elapsed time,
+from which a Poisson change rate is estimated (Cho & Garcia-Molina):
+
+    rate = -ln((n - X + 0.5) / (n + 0.5)) / mean_interval
+
+``plan`` then splits a global crawl budget (crawls/day) between listings so
+that the summed expected freshness ``(f / rate) * (1 - exp(-rate / f))`` is
+maximal, which is solved with a Lagrange multiplier and bisection.
+"""
+import math
+import time
+import zlib
+import threading
+
+from state import load_json, update_json
+
+STATE_FILE = 'revisit.json'
+DAY = 86400.0
+# Planned frequencies are clamped to [one crawl per MAX_INTERVAL, one crawl per MIN_INTERVAL]
+MIN_INTERVAL = 3600.0
+MAX_INTERVAL = 30 * DAY
+
+_lock = threading.Lock()
+
+
+def page_fingerprint(items):
+    """Order-insensitive hash of what matters in a page: product URLs and prices."""
+    rows = sorted(f"{i.get('url')}|{i.get('priceAmount')}|{i.get('name')}" for i in items)
+    return zlib.crc32("\n".join(rows).encode('utf-8'))
+
+
+def _observe(stats, fingerprint, at):
+    if stats.get("fingerprint") is not None:
+        stats["visits"] = stats.get("visits", 0) + 1
+        stats["elapsed"] = stats.get("elapsed", 0.0) + max(0.0, at - stats["at"])
+        if fingerprint != stats["fingerprint"]:
+            stats["changes"] = stats.get("changes", 0) + 1
+    stats["fingerprint"] = fingerprint
+    stats["at"] = at
+
+
+def change_rate(stats):
+    """Estimated changes per day, or None before the second visit."""
+    n = stats.get("visits", 0)
+    if not n or not stats.get("elapsed"): return None
+    x = stats.get("changes", 0)
+    mean_interval = stats["elapsed"] / n / DAY
+    return -math.log((n - x + 0.5) / (n + 0.5)) / max(mean_interval, 1e-6)
+
+
+def record_scrape(listing_url, pages, at=None):
+    """pages: list of {"key", "fingerprint"} in crawl order."""
+    at = at or time.time()
+
+    def update(state):
+        listing = state.setdefault(listing_url, {"pages": {}})
+        _observe(listing, zlib.crc32(",".join(str(p["fingerprint"]) for p in pages).encode()), at)
+        for page in pages:
+            _observe(listing["pages"].setdefault(page["key"], {}), page["fingerprint"], at)
+
+    with _lock:
+        update_json(STATE_FILE, update, {})
+
+
+def load_rates():
+    """{listing_url: {"rate", "pages": {page_key: rate}}} for listings seen at least twice."""
+    rates = {}
+    for url, listing in (load_json(STATE_FILE, {}) or {}).items():
+        rate = change_rate(listing)
+        if rate is None: continue
+        rates[url] = {"rate": rate, "pages": {k: change_rate(p) for k, p in listing.get("pages", {}).items()}}
+    return rates
+
+
+def _optimal_frequency(rate, mu):
+    """Frequency (crawls/day) where d freshness / df equals mu."""
+    if rate <= 0: return 0.0
+    target = mu * rate
+    if target >= 1: return 0.0
+    # dF/df = (1 - e^-x (1 + x)) / rate with x = rate / f, increasing in x
+    lo, hi = 0.0, 1.0
+    while 1 - math.exp(-hi) * (1 + hi) < target: hi *= 2
+    for _ in range(60):
+        mid = (lo + hi) / 2
+        if 1 - math.exp(-mid) * (1 + mid) < target: lo = mid
+        else: hi = mid
+    return rate / hi if hi > 0 else 0.0
+
+
+def plan(rates, budget):
+    """Splits budget crawls/day over {key: rate}; returns {key: interval_seconds}."""
+    if not rates: return {}
+    f_min, f_max = DAY / MAX_INTERVAL, DAY / MIN_INTERVAL
+    clamp = lambda f: min(f_max, max(f_min, f))
+
+    def total(mu):
+        return sum(clamp(_optimal_frequency(r, mu)) for r in rates.values())
+
+    positive = [r for r in rates.values() if r > 0]
+    if not positive or budget <= f_min * len(rates):
+        freqs = {k: f_min for k in rates}
+    else:
+        lo, hi = 0.0, 1.0 / min(positive)
+        for _ in range(60):
+            mid = (lo + hi) / 2
+            if total(mid) > budget: lo = mid
+            else: hi = mid
+        freqs = {k: clamp(_optimal_frequency(r, hi)) for k, r in rates.items()}
+    return {k: DAY / f for k, f in freqs.items()}
@@ -0,0 +1,210 @@
+"""Scheduler daemon that scrapes websites according to Website.scrapeFrequency.
+
+Usage:
+    python scheduler.py                  # run forever
+    python scheduler.py --once           # dispatch what is due now, wait, exit
+
+Every tick the active websites are read from Supabase and the ones whose
+``lastScraped + frequency + jitter`` has passed are handed to a long-lived
+WorkStealingPool. The jitter is derived from the website id, so a website
+always lands on the same offset and a fleet of "daily" websites is spread
+over the jitter window instead of firing at the same minute.
+
+Once a website has been scraped twice, its interval comes from the revisit
+planner instead: the crawl budget (by default, what the configured
+frequencies would spend per day) is redistributed according to how often
+each listing was actually seen changing.
+"""
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(__file__), 'libs'))
+import json
+import time
+import signal
+import datetime
+import threading
+import urllib.parse
+import zlib
+import argparse
+
+from scraper import get_supabase_client, run_job, spool_writer, SPOOL_DRAIN_TIMEOUT
+from matching import wait_for_updates
+from worker_pool import WorkStealingPool
+from job_control import JobControl
+from lanes import BackgroundThrottle
+import revisit
+import spool
+
+FREQUENCY_INTERVALS = {
+    "daily": datetime.timedelta(days=1),
+    "weekly": datetime.timedelta(days=7),
+    "monthly": datetime.timedelta(days=30),
+}
+# Websites are spread over at most this fraction of their interval...
+JITTER_FRACTION = 0.1
+# ...capped to this window
+MAX_JITTER = datetime.timedelta(hours=2)
+# Never-scraped websites are spread over this window after startup
+STARTUP_SPREAD = datetime.timedelta(minutes=15)
+# A failed website is not retried before this delay
+RETRY_DELAY = datetime.timedelta(hours=1)
+
+
+def parse_timestamp(value):
+    if not value: return None
+    try:
+        ts = datetime.datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+    except ValueError:
+        return None
+    # lastScraped is written both by Prisma (UTC) and by scraper.py (local time)
+    if ts.tzinfo: ts = ts.astimezone().replace(tzinfo=None)
+    return ts
+
+
+def jitter_for(website_id, window):
+    """Stable offset in [0, window) for a website."""
+    fraction = (zlib.crc32(str(website_id).encode()) % 10000) / 10000.0
+    return datetime.timedelta(seconds=window.total_seconds() * fraction)
+
+
+def next_due(website, now, started_at, planned=None):
+    interval = FREQUENCY_INTERVALS.get(website.get("scrapeFrequency"))
+    if not interval: return None
+    if planned and website["url"] in planned:
+        interval = datetime.timedelta(seconds=planned[website["url"]])
+    last = parse_timestamp(website.get("lastScraped"))
+    if last is None:
+        return started_at + jitter_for(website["id"], STARTUP_SPREAD)
+    window = min(interval * JITTER_FRACTION, MAX_JITTER)
+    return last + interval + jitter_for(website["id"], window)
+
+
+class Scheduler:
+    def __init__(self, supabase, workers=4, per_domain=2, tick=60, crawl_budget=None):
+        self.supabase = supabase
+        self.tick = tick
+        self.crawl_budget = crawl_budget
+        self.pool = WorkStealingPool(workers, per_domain)
+        self.started_at = datetime.datetime.now()
+        self._in_flight = set()
+        self._retry_after = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+
+    def fetch_websites(self):
+        response = self.supabase.table('Website') \
+            .select('id,url,scrapeFrequency,isActive,lastScraped,metadata') \
+            .eq('isActive', True).neq('scrapeFrequency', 'on-demand').execute()
+        return response.data or []
+
+    def plan_intervals(self, websites):
+        """Learned revisit intervals by website URL."""
+        scheduled = [w for w in websites if w.get("scrapeFrequency") in FREQUENCY_INTERVALS]
+        per_day = lambda w: revisit.DAY / FREQUENCY_INTERVALS[w["scrapeFrequency"]].total_seconds()
+        rates = revisit.load_rates()
+        budget = self.crawl_budget if self.crawl_budget is not None else sum(per_day(w) for w in scheduled)
+        # Websites without a learned rate yet keep spending their configured frequency
+        budget -= sum(per_day(w) for w in scheduled if w["url"] not in rates)
+        return revisit.plan({w["url"]: rates[w["url"]]["rate"] for w in scheduled if w["url"] in rates}, max(budget, 0.0))
+
+    def due_websites(self, websites, now):
+        planned = self.plan_intervals(websites)
+        due = []
+        for website in websites:
+            with self._lock:
+                if website["id"] in self._in_flight: continue
+                if self._retry_after.get(website["id"], now) > now: continue
+            due_at = next_due(website, now, self.started_at, planned)
+            if due_at is not None and due_at <= now:
+                due.append((due_at, website))
+        # Most overdue first
+        return [w for _, w in sorted(due, key=lambda d: d[0])]
+
+    def dispatch(self, website):
+        with self._lock:
+            self._in_flight.add(website["id"])
+        domain = urllib.parse.urlparse(website["url"]).netloc
+        # Scheduled refreshes are bulk work: they yield between pages to interactive scrapes
+        ctl = JobControl(pause_hook=BackgroundThrottle())
+        metadata = website.get("metadata")
+        # {"mode": "catalog"} keeps the whole retailer catalog fresh from this one Website
+        mode = (metadata.get("mode") if isinstance(metadata, dict) else None) or "auto"
+        future = self.pool.submit(domain, run_job, website["url"], mode, website_id=website["id"], supabase=self.supabase, ctl=ctl)
+        future.add_done_callback(lambda f, w=website: self._finished(w, f))
+
+    def _finished(self, website, future):
+        try:
+            result = future.result()
+        except Exception as e:
+            result = {"error": str(e)}
+        with self._lock:
+            self._in_flight.discard(website["id"])
+            if result.get("status") == "circuit_open":
+                # Defer until the domain's circuit lets a probe through
+                self._retry_after[website["id"]] = datetime.datetime.now() + datetime.timedelta(seconds=result["retryAfter"])
+            elif result.get("error"):
+                self._retry_after[website["id"]] = datetime.datetime.now() + RETRY_DELAY
+            else:
+                self._retry_after.pop(website["id"], None)
+        status = "failed: " + result["error"] if result.get("error") else "done"
+        print(f"[scheduler] {website['url']} {status}", file=sys.stderr)
+
+    def run_once(self):
+        now = datetime.datetime.now()
+        try:
+            websites = self.fetch_websites()
+        except Exception as e:
+            print(f"[scheduler] Website fetch error: {e}", file=sys.stderr)
+            return 0
+        due = self.due_websites(websites, now)
+        for website in due:
+            self.dispatch(website)
+        if due: print(f"[scheduler] Dispatched {len(due)} of {len(websites)} websites", file=sys.stderr)
+        return len(due)
+
+    def run_forever(self):
+        while not self._stop.is_set():
+            self.run_once()
+            self._stop.wait(self.tick)
+
+    def stop(self):
+        self._stop.set()
+
+    def wait_idle(self):
+        while self.pool.pending() or self.pool.active():
+            time.sleep(0.5)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--once', action='store_true', help="Dispatch the websites due now, wait for them and exit")
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--perDomain', type=int, default=2)
+    parser.add_argument('--tick', type=int, default=60, help="Seconds between two looks at the Website table")
+    parser.add_argument('--crawlBudget', type=float, help="Crawls per day shared by all websites (default: sum of their frequencies)")
+    args = parser.parse_args()
+
+    supabase = get_supabase_client()
+    if not supabase:
+        print(json.dumps({"error": "Supabase is not configured"})); return
+
+    scheduler = Scheduler(supabase, args.workers, args.perDomain, args.tick, args.crawlBudget)
+    signal.signal(signal.SIGTERM, lambda *_: scheduler.stop())
+    # Jobs only spool their writes; this thread replays them while the scheduler runs
+    drainer = spool.Drainer(spool_writer(supabase)).start() if spool.ENABLED else None
+    try:
+        if args.once:
+            print(json.dumps({"success": True, "dispatched": scheduler.run_once()}))
+        else:
+            scheduler.run_forever()
+        scheduler.wait_idle()
+    except KeyboardInterrupt:
+        scheduler.stop()
+    finally:
+        scheduler.pool.shutdown(wait=False)
+        if drainer: drainer.stop(SPOOL_DRAIN_TIMEOUT)
+        wait_for_updates()
+
+
+if __name__ == "__main__":
+    main()
@@ -2,8 +2,6 @@ import sys
 import os
 sys.path.append(os.path.join(os.path.dirname(__file__), 'libs'))
 import json
-import time
-import requests
 from bs4 import BeautifulSoup
 from selenium import webdriver
 from selenium.webdriver.chrome.service import Service
@@ -13,8 +11,31 @@ import datetime
 import urllib.parse
 import re
 import os
+import threading
 from dotenv import load_dotenv
 from supabase import create_client, Client
+from item_store import ItemStore, dump as dump_json
+from html_regions import cut_regions
+from revisit import page_fingerprint, record_scrape
+from fetch import fetch_page
+from circuit_breaker import breaker, CircuitOpenError
+from job_control import JobControl, JobStopped
+from lanes import INTERACTIVE, BACKGROUND, BackgroundThrottle, interactive_marker
+from query import ListQuery
+from matching import submit_update, wait_for_updates
+import archive
+import drift
+import extraction_cache
+import selector_stats
+from selector_stats import SelectorRecorder, DOCUMENT
+from prices import PROFILES, normalize_price, normalize_prices, failure_counts
+from singleflight import coalesce
+from urls import normalize_url
+from frontier import Frontier
+from snapshots import load_snapshot, save_snapshot
+from pipeline import Pipeline, Stage
+import pg_store
+import spool
 
 # Load environment variables
 # Try loading from backend .env
@@ -23,6 +44,11 @@ load_dotenv(os.path.join(os.path.dirname(__file__), '../.env'))
 # Configuration
 SUPABASE_URL = os.getenv('SUPABASE_URL') or os.getenv('NEXT_PUBLIC_SUPABASE_URL')
 SUPABASE_KEY = os.getenv('SUPABASE_SERVICE_ROLE_KEY') or os.getenv('NEXT_PUBLIC_SUPABASE_ANON_KEY')
+# Parse only the LIST_CONFIGS "regions" of listing pages (set to 0 to always build the full tree)
+PARTIAL_PARSE = os.getenv('SCRAPER_PARTIAL_PARSE', '1') != '0'
+# Persist products page by page while the crawl goes on (set to 0 to save everything at the end)
+PIPELINE = os.getenv('SCRAPER_PIPELINE', '1') != '0'
+PERSIST_WORKERS = int(os.getenv('SCRAPER_PERSIST_WORKERS', '2'))
 
 SITE_CONFIGS = {
     "tunisianet.com.tn": {
@@ -56,7 +82,12 @@ LIST_CONFIGS = {
         "url": ".product-title a",
         "img": ".product-thumbnail img",
         "reference": ".product-reference",
-        "next": "a.next"
+        "next": "a.next",
+        "regions": ["#js-product-list", ".pagination"],
+        "price_sort": {"asc": "order=product.price.asc", "desc": "order=product.price.desc"},
+        "search": "https://www.tunisianet.com.tn/recherche?controller=search&s={query}",
+        "catalog": {"home": "https://www.tunisianet.com.tn/", "nav": "#_desktop_top_menu a", "subcategories": "#subcategories a",
+                    "breadcrumb": ".breadcrumb li", "title": "h1", "category": r"^/\d+-[^/]+$"}
     },
     "mytek.tn": {
         "card": ".product-container",
@@ -65,7 +96,12 @@ LIST_CONFIGS = {
         "url": ".product-item-link",
         "img": "img",
         "reference": ".sku",
-        "next": "a.action.next"
+        "next": "a.action.next",
+        "regions": [".products", ".toolbar"],
+        "price_sort": {"asc": "product_list_order=price&product_list_dir=asc", "desc": "product_list_order=price&product_list_dir=desc"},
+        "search": "https://www.mytek.tn/catalogsearch/result/?q={query}",
+        "catalog": {"home": "https://www.mytek.tn/", "nav": ".navigation a, .rootmenu a", "breadcrumb": ".breadcrumbs li",
+                    "title": "h1.page-title", "category": r"\.html$"}
     },
     "wiki.tn": {
         "card": ".product-miniature, .product-container, .product-type-simple, .product, .product-card, .brxe-loop-item", 
@@ -74,68 +110,28 @@ LIST_CONFIGS = {
         "url": ".product-title a, .product-name, .woocommerce-loop-product__link, .product-card__title a",
         "img": "img",
         "reference": ".sku, .product-reference",
-        "next": "a.next, .brxe-pagination a.next"
+        "next": "a.next, .brxe-pagination a.next",
+        "price_sort": {"asc": "orderby=price", "desc": "orderby=price-desc"},
+        "search": "https://www.wiki.tn/?s={query}&post_type=product",
+        "catalog": {"home": "https://www.wiki.tn/", "nav": ".brxe-nav-nested a, .menu-item a", "subcategories": ".product-categories a",
+                    "breadcrumb": ".woocommerce-breadcrumb a, .breadcrumb a", "title": "h1", "category": r"/categorie-produit/"}
     }
 }
 
-def parse_price(price_str):
+def parse_price(price_str, domain=None):
     """Extracts numeric value from price string. Handles TND format (e.g. '1,099,000 DT' = 1099.000)."""
-    if not price_str: return 0.0
-    try:
-        # Pre-clean: remove all whitespace including non-breaking spaces
-        clean_str = re.sub(r'[\s\u00A0\u1680\u180E\u2000-\u200B\u202F\u205F\u3000]', '', price_str.strip())
-        
-        # Remove non-numeric except commas and dots
-        clean = re.sub(r'[^\d.,]', '', clean_str)
-        if not clean: return 0.0
-        
-        # Count commas and dots
-        comma_count = clean.count(',')
-        dot_count = clean.count('.')
-        
-        if comma_count >= 1 and dot_count >= 1:
-            # Format: 1.099,000 or 1,099.00
-            if clean.rfind(',') > clean.rfind('.'):
-                # , is decimal: 1.099,000 -> 1099.000
-                clean = clean.replace('.', '').replace(',', '.')
-            else:
-                # . is decimal: 1,099.00 -> 1099.00
-                clean = clean.replace(',', '')
-        elif comma_count > 0:
-            # Single or many commas
-            parts = clean.split(',')
-            if len(parts) == 2 and len(parts[1]) == 3:
-                # TND Millimes: 849,000 -> 849.0
-                clean = parts[0] + '.' + parts[1]
-            else:
-                # Standard decimal or thousand separator
-                if comma_count == 1:
-                    clean = clean.replace(',', '.')
-                else:
-                    clean = clean.replace(',', '')
-        elif dot_count > 0:
-            # Only dots
-            if dot_count > 1:
-                clean = clean.replace('.', '')
-            else:
-                parts = clean.split('.')
-                if len(parts[1]) == 3:
-                    # 849.000 remains 849.000
-                    pass
-                else:
-                    # 19.99 remains 19.99
-                    pass
-
-        val = float(clean)
-        
-        # Final safety check for TND (if value is in millimes like 1150000 instead of 1150.0)
-        if val > 50000:
-            val = val / 1000.0
-            
-        return val
-    except:
-        pass
-    return 0.0
+    return normalize_price(price_str, domain).value
+
+def parse_page(html, config=None):
+    """Builds a tree of the listing regions only, falling back to the whole page when no card is found there.
+    Returns the tree and the markup it was parsed from."""
+    if PARTIAL_PARSE and config and config.get("regions"):
+        fragment = cut_regions(html, config["regions"])
+        if fragment:
+            soup = BeautifulSoup(fragment, 'html.parser')
+            if soup.select_one(config["card"]): return soup, fragment
+            soup.decompose()
+    return BeautifulSoup(html, 'html.parser'), html
 
 def extract_reference_from_url(url, domain):
     if not url: return None
@@ -173,6 +169,33 @@ def get_supabase_client():
         print(f"Error connecting to Supabase: {e}", file=sys.stderr)
         return None
 
+# Ancestors of the name/reference element searched for the other product fields
+ANCESTOR_DEPTH = 6
+
+def select_first(root, selectors, accept):
+    """(selector, element) of the first selector whose match passes accept, or (None, None)."""
+    for selector in selectors:
+        el = root.select_one(selector)
+        if el and accept(el): return selector, el
+    return None, None
+
+def select_near(anchor, selectors, accept, preferred=None):
+    """Searches anchor and its ancestors, nearest first; (selector, depth, element) or (None, None, None).
+    preferred is the (selector, depth) that usually matches on this domain and is tried first."""
+    if preferred and preferred[1] != DOCUMENT and preferred[0] in selectors:
+        curr = anchor
+        for _ in range(preferred[1]):
+            curr = curr.parent if curr else None
+        el = curr.select_one(preferred[0]) if curr else None
+        if el and accept(el): return preferred[0], preferred[1], el
+    curr = anchor
+    for depth in range(ANCESTOR_DEPTH):
+        selector, el = select_first(curr, selectors, accept)
+        if el: return selector, depth, el
+        curr = curr.parent
+        if not curr: break
+    return None, None, None
+
 def extract_specific_data(soup, domain):
     config = None
     for d, cfg in SITE_CONFIGS.items():
@@ -186,104 +209,136 @@ def extract_specific_data(soup, domain):
                  soup.find("meta", attrs={"name": "twitter:data1"})
     if meta_price and meta_price.get("content"):
         val = meta_price.get("content").strip()
-        data["priceAmount"] = parse_price(val)
+        data["priceAmount"] = normalize_price(val, profile=PROFILES["machine"]).value
         if any(c.isdigit() for c in val):
             if "," not in val and "." not in val and len(val) > 4:
                  data["price"] = f"{val[:-3]} {val[-3:]} DT"
             else:
                  data["price"] = f"{val} DT"
 
-    ref_el = None
-    for s in config.get("reference", []):
-        ref_el = soup.select_one(s)
-        if ref_el and ref_el.get_text().strip():
-            data["reference"] = ref_el.get_text().strip()
-            break
-            
-    name_el = None
-    for s in config.get("name", []):
-        name_el = soup.select_one(s)
-        if name_el and name_el.get_text().strip():
-            data["name"] = name_el.get_text().strip()
-            break
+    recorder = SelectorRecorder(domain, "site")
+    has_text = lambda el: bool(el.get_text().strip())
+    ref_field = recorder.field("reference", config.get("reference", []))
+    selector, ref_el = select_first(soup, ref_field.ordered(), has_text)
+    if ref_el:
+        data["reference"] = ref_el.get_text().strip()
+        recorder.hit("reference", selector)
+
+    name_field = recorder.field("name", config.get("name", []))
+    selector, name_el = select_first(soup, name_field.ordered(), has_text)
+    if name_el:
+        data["name"] = name_el.get_text().strip()
+        recorder.hit("name", selector)
 
     anchor = ref_el or name_el
     for key in ["price", "overview", "category"]:
         if key in data and data[key] != "Not found": continue
+        field = recorder.field(key, config.get(key, []))
+        selectors = field.ordered()
+        accept = has_text
+        if key == "price":
+            accept = lambda el: has_text(el) and len(el.get_text().strip()) <= 25 and any(c.isdigit() for c in el.get_text())
+        selector, depth, found = None, None, None
         if anchor:
-            curr = anchor
-            for _ in range(6):
-                for selector in config.get(key, []):
-                    found = curr.select_one(selector)
-                    if found and found.get_text().strip():
-                        val = found.get_text().strip()
-                        if key == "price" and (len(val) > 25 or not any(c.isdigit() for c in val)):
-                            continue
-                        if key == "price":
-                            data["priceAmount"] = parse_price(val)
-                        data[key] = val
-                        break
-                if key in data: break
-                curr = curr.parent
-                if not curr: break
-        
-        if key not in data or data[key] == "Not found":
-            for selector in config.get(key, []):
-                found = soup.select_one(selector)
-                if found and found.get_text().strip():
-                    val = found.get_text().strip()
-                    if key == "price":
-                        data["priceAmount"] = parse_price(val)
-                    data[key] = val
-                    break
+            selector, depth, found = select_near(anchor, selectors, accept, field.preferred())
+        if not found:
+            # Whole document, without the price sanity check of the anchored search
+            selector, found = select_first(soup, selectors, has_text)
+            depth = None
+        if found:
+            val = found.get_text().strip()
+            if key == "price":
+                data["priceAmount"] = parse_price(val, domain)
+            data[key] = val
+            recorder.hit(key, selector, depth)
+    recorder.commit()
     for key in ["name", "price", "reference", "overview", "category"]:
         if key not in data: data[key] = "Not found"
     return data
 
-def extract_list_data(soup, domain, min_price=None, max_price=None, name_filter=None, reference_filter=None):
-    config = None
+def get_list_config(domain):
     for d, cfg in LIST_CONFIGS.items():
-        if d in domain: config = cfg; break
-    if not config: return None
+        if d in domain: return cfg
+    return None
+
+def has_filters(min_price=None, max_price=None, name_filter=None, reference_filter=None):
+    return bool(min_price or max_price or name_filter or reference_filter)
+
+# Per-card fields of LIST_CONFIGS ("card" and "next" are page level)
+LIST_FIELDS = ("name", "url", "price", "img", "reference")
+
+def extract_items(soup, domain, config, markup=None):
+    """Extracts the product cards of a listing. Cards whose raw HTML is unchanged since an earlier
+    crawl are served from the extraction cache; markup is the source soup was parsed from."""
     items = []
     cards = soup.select(config["card"])
     print(f"Found {len(cards)} items on {domain}", file=sys.stderr)
+    cache_ns = extraction_cache.namespace(domain, config) if extraction_cache.ENABLED else None
+    source = extraction_cache.SourceIndex(markup) if cache_ns and markup else None
+    extracted = []
+    # Comma separated alternatives are tried one by one, in the order that has been hitting on this domain
+    recorder = SelectorRecorder(domain, "list")
+    ordered = {f: recorder.field(f, config[f]).ordered() for f in LIST_FIELDS if config.get(f)}
+
+    def select_field(card, field):
+        selector, el = select_first(card, ordered[field], lambda el: True)
+        if el: recorder.hit(field, selector)
+        return el
+
     for card in cards:
         try:
+            key = None
+            if cache_ns:
+                key = extraction_cache.card_key(card, source)
+                cached = extraction_cache.lookup(cache_ns, key)
+                if cached is not None:
+                    items.append(cached); continue
             item = {}
-            name_el = card.select_one(config["name"])
+            name_el = select_field(card, "name")
             if name_el:
                 item["name"] = name_el.get_text().strip()
                 if not item.get("url"): item["url"] = name_el.get("href")
             if config.get("url") and not item.get("url"):
-                 url_el = card.select_one(config["url"])
+                 url_el = select_field(card, "url")
                  if url_el: item["url"] = url_el.get("href")
-            price_el = card.select_one(config["price"])
+            price_el = select_field(card, "price")
             if price_el:
-                val = price_el.get_text().strip()
-                item["price"] = val
-                item["priceAmount"] = parse_price(val)
+                item["price"] = price_el.get_text().strip()
             if config.get("img"):
-                img_el = card.select_one(config["img"])
+                img_el = select_field(card, "img")
                 if img_el: item["image"] = img_el.get("src") or img_el.get("data-src")
             if config.get("reference"):
-                ref_el = card.select_one(config["reference"])
+                ref_el = select_field(card, "reference")
                 if ref_el: item["reference"] = ref_el.get_text().strip().strip('[]')
             if not item.get("reference") and item.get("url"):
                 url_ref = extract_reference_from_url(item.get("url"), domain)
                 if url_ref: item["reference"] = url_ref
             if item.get("name") and item.get("url"):
                 items.append(item)
+                extracted.append((key, item))
         except Exception as e:
             print(f"Error parsing card: {e}", file=sys.stderr); continue
-    
-    # ------------------
-    # ACTUAL FILTERING
-    # ------------------
-    if min_price or max_price or name_filter or reference_filter:
-        print(f"DEBUG: Filtering {len(items)} items...", file=sys.stderr)
-        if name_filter: print(f"DEBUG: Name Filter: {name_filter}", file=sys.stderr)
-        if reference_filter: print(f"DEBUG: Ref Filter: {reference_filter}", file=sys.stderr)
+    priced = [item for _, item in extracted if "price" in item]
+    results = normalize_prices([item["price"] for item in priced], domain)
+    for item, result in zip(priced, results):
+        item["priceAmount"] = result.value
+    failures = failure_counts(results)
+    if failures:
+        print(f"Unparsed prices on {domain}: {dict(failures)}", file=sys.stderr)
+    recorder.commit()
+    if cache_ns:
+        if extracted: extraction_cache.store(cache_ns, extracted)
+        print(f"Extraction cache on {domain}: {len(items) - len(extracted)} hit(s), {len(extracted)} extracted", file=sys.stderr)
+    return items
+
+def filter_items(items, min_price=None, max_price=None, name_filter=None, reference_filter=None):
+    """Applies the job filters to extracted items without modifying them."""
+    if not has_filters(min_price, max_price, name_filter, reference_filter):
+        return items
+
+    print(f"DEBUG: Filtering {len(items)} items...", file=sys.stderr)
+    if name_filter: print(f"DEBUG: Name Filter: {name_filter}", file=sys.stderr)
+    if reference_filter: print(f"DEBUG: Ref Filter: {reference_filter}", file=sys.stderr)
 
     final_items = []
     
@@ -316,113 +371,605 @@ def extract_list_data(soup, domain, min_price=None, max_price=None, name_filter=
             
         if valid: final_items.append(item)
     
-    if min_price or max_price or name_filter or reference_filter:
-        print(f"Filtered from {len(items)} to {len(final_items)} items matching criteria", file=sys.stderr)
-        return final_items
-        
+    print(f"Filtered from {len(items)} to {len(final_items)} items matching criteria", file=sys.stderr)
+    return final_items
+
+def extract_list_data(soup, domain, min_price=None, max_price=None, name_filter=None, reference_filter=None, markup=None):
+    config = get_list_config(domain)
+    if not config: return None
+    return filter_items(extract_items(soup, domain, config, markup), min_price, max_price, name_filter, reference_filter)
+
+JSON_LD = re.compile(r'<script[^>]*application/ld\+json[^>]*>(.*?)</script>', re.I | re.S)
+
+def extract_structured_items(html, domain):
+    """Products listed in the page's JSON-LD (ItemList or Product), independent of any CSS selector."""
+    def walk(node):
+        if isinstance(node, list):
+            for n in node: yield from walk(n)
+        elif isinstance(node, dict):
+            types = node.get("@type")
+            types = types if isinstance(types, list) else [types]
+            if "Product" in types: yield node
+            for key in ("@graph", "itemListElement", "item"):
+                if key in node: yield from walk(node[key])
+
+    items = []
+    for block in JSON_LD.findall(html or ""):
+        try: data = json.loads(block.strip())
+        except ValueError: continue
+        for product in walk(data):
+            offers = product.get("offers") or {}
+            if isinstance(offers, list): offers = offers[0] if offers else {}
+            price = offers.get("price") or offers.get("lowPrice")
+            image = product.get("image")
+            item = {"name": product.get("name"), "url": product.get("url") or offers.get("url"),
+                    "image": image[0] if isinstance(image, list) and image else image,
+                    "reference": product.get("sku") or product.get("mpn")}
+            if price is not None:
+                item["price"] = f"{price} {offers.get('priceCurrency') or 'DT'}"
+                item["priceAmount"] = normalize_price(str(price), profile=PROFILES["machine"]).value
+            if item["name"] and item["url"]:
+                items.append({k: v for k, v in item.items() if v is not None})
     return items
 
-def scrape_static(start_url, min_price=None, max_price=None, name_filter=None, reference_filter=None):
+def looks_like_product(specific):
+    return bool(specific) and specific.get("name") != "Not found" and specific.get("price") != "Not found"
+
+# Messages of a category or search page that really has nothing to list
+EMPTY_MARKERS = ("aucun produit", "aucun résultat", "aucun article", "pas de produit", "pas de résultat",
+                 "il n'y a pas de produit", "no products", "no results", "nothing found")
+
+def is_search_page(url, config):
+    """Whether url is the retailer's search page (LIST_CONFIGS "search"), whatever the query."""
+    template = (config or {}).get("search")
+    if not template: return False
+    page, search = urllib.parse.urlsplit(url), urllib.parse.urlsplit(template)
+    keys = {k for k, v in urllib.parse.parse_qsl(search.query, keep_blank_values=True)}
+    return page.path.rstrip("/") == search.path.rstrip("/") and keys <= set(urllib.parse.parse_qs(page.query, keep_blank_values=True))
+
+def is_empty_listing(soup, url, config):
+    """A page without cards that has nothing to list (a search without results, an empty category),
+    as opposed to one whose selectors stopped matching."""
+    if is_search_page(url, config): return True
+    text = soup.get_text(" ", strip=True).lower().replace("\u2019", "'")
+    return any(marker in text for marker in EMPTY_MARKERS)
+
+def load_static_page(url, domain, config, ctl=None):
+    """Fetches and parses one page. Returns the unfiltered items and next link of a listing,
+    or the product fields (items None) when the domain has no listing config."""
+    ctl = ctl or JobControl()
+    html = fetch_page(url, ctl=ctl)
+    ctl.checkpoint()
+    archived = archive.store_page(html)
+    soup, markup = parse_page(html, config)
+    try:
+        if not config:
+            page = {"items": None, "title": soup.title.string.strip() if soup.title and soup.title.string else "", "archived": archived}
+            page["specific"] = extract_specific_data(soup, domain)
+            return page
+        items = extract_items(soup, domain, config, markup)
+        if not items:
+            # A product page of a domain that also has listings
+            specific = extract_specific_data(soup, domain)
+            if looks_like_product(specific):
+                return {"items": None, "title": soup.title.string.strip() if soup.title and soup.title.string else "", "specific": specific, "archived": archived}
+        health = drift.page_health(items, empty=not items and is_empty_listing(soup, url, config))
+        page = {"items": items, "next": None, "health": health, "archived": archived}
+        report = drift.check(domain, page["health"])
+        if report:
+            page["drift"] = report
+            page["structured"] = extract_structured_items(html, domain)
+        if config.get("next"):
+            next_el = soup.select_one(config["next"])
+            if next_el and next_el.get("href"):
+                page["next"] = next_el.get("href")
+        return page
+    finally:
+        # Release the page tree now; only the extracted fields are kept
+        soup.decompose()
+
+# Crawl ended because the query was answered, not because something cut it short
+QUERY_SATISFIED = "query_satisfied"
+
+def drift_result(domain, url, report):
+    """Crawl abandoned after the first page because the selectors no longer fit the site."""
+    print(f"Selector drift on {domain} ({report['reason']}), aborting crawl", file=sys.stderr)
+    return dict(list_result(ItemStore(), [], domain, url, drift.SELECTOR_DRIFT, url), drift=report)
+
+def list_result(items, pages, domain, url, stop_reason=None, cursor=None):
+    """List scrape result. stop_reason marks a crawl that ended early; cursor is where to resume.
+    The items stay an ItemStore; item_store.dump serializes them."""
+    data = {"type": "list", "data": items, "pages": pages, "domain": domain, "url": url, "timestamp": datetime.datetime.now().isoformat()}
+    if stop_reason:
+        data["stopReason"] = stop_reason
+        if stop_reason != QUERY_SATISFIED: data["partial"] = True
+        if cursor: data["cursor"] = cursor
+    return data
+
+def scrape_static(start_url, min_price=None, max_price=None, name_filter=None, reference_filter=None, ctl=None, query=None, escalate=False, on_page=None):
+    """With escalate, selector drift on the first page raises SelectorDrift so the caller can try the browser.
+    on_page receives the items of every page as soon as it is scraped."""
     print(f"Using Static Scraper for: {start_url}", file=sys.stderr)
-    headers = {'User-Agent': 'Mozilla/5.0'}
+    ctl = ctl or JobControl()
     domain = urllib.parse.urlparse(start_url).netloc
-    config = None
-    for d, cfg in LIST_CONFIGS.items():
-        if d in domain: config = cfg; break
-    all_list_data = []
-    current_url = start_url
-    visited_urls = set()
+    config = get_list_config(domain)
+    all_list_data = ItemStore()
+    pages = []
+    # Pagination links that come back under another spelling (tracking or session params) are not refetched
+    frontier = Frontier()
+    frontier.push(start_url)
+    current_url, _ = frontier.pop()
+    stop_reason = None
+    empty = False
     page_count = 0
     MAX_PAGES = 50
-    while current_url and current_url not in visited_urls and page_count < MAX_PAGES:
+    crawl = archive.start_crawl(start_url, domain, "static")
+    while current_url and page_count < MAX_PAGES:
         print(f"Scraping page {page_count + 1}: {current_url}", file=sys.stderr)
-        visited_urls.add(current_url)
         try:
-            response = requests.get(current_url, headers=headers, timeout=15, verify=False)
-            response.raise_for_status()
-            soup = BeautifulSoup(response.text, 'html.parser')
-            list_data = extract_list_data(soup, domain, min_price, max_price, name_filter, reference_filter)
-            if list_data is not None:
+            ctl.between_pages()
+            # Jobs fetching the same page at the same time share one download and parse; it runs
+            # under no job's control, so one job stopping never fails the others waiting on it
+            page = coalesce(normalize_url(current_url), lambda u=current_url: load_static_page(u, domain, config), ctl)
+            if crawl: crawl.add(current_url, page.get("archived"))
+            if page["items"] is not None:
+                if page.get("drift") and (page_count == 0 or page["drift"]["reason"] != drift.FEW_CARDS):
+                    if page["structured"]:
+                        print(f"Selector drift on {domain} ({page['drift']['reason']}), using structured data", file=sys.stderr)
+                        page = dict(page, items=page["structured"])
+                    elif page_count == 0:
+                        if escalate: raise drift.SelectorDrift(domain, page["drift"])
+                        return drift_result(domain, start_url, page["drift"])
+                elif page_count == 0:
+                    drift.record(domain, page["health"])
+                    # Nothing to list is an answer, not a reason to try the browser
+                    empty = page["health"].get("empty")
+                list_data = filter_items(page["items"], min_price, max_price, name_filter, reference_filter)
                 all_list_data.extend(list_data)
+                pages.append({"key": str(page_count), "count": len(list_data), "fingerprint": page_fingerprint(list_data)})
                 page_count += 1
-                current_url = None
-                if config and config.get("next"):
-                    next_el = soup.select_one(config["next"])
-                    if next_el and next_el.get("href"):
-                        current_url = urllib.parse.urljoin(start_url, next_el.get("href"))
+                if on_page: on_page(list_data)
+                page_url, current_url = current_url, None
+                if frontier.push(page.get("next"), priority=page_count, base=page_url):
+                    current_url, _ = frontier.pop()
+                if query and query.offer(page["items"]) and current_url:
+                    print(f"Query answered after {page_count} page(s)", file=sys.stderr)
+                    stop_reason = QUERY_SATISFIED; break
             else:
                 if page_count == 0:
-                     if min_price or max_price or name_filter or reference_filter: return None
-                     specific_data = extract_specific_data(soup, domain)
-                     data = {"title": soup.title.string.strip() if soup.title else "", "method": "static", "timestamp": datetime.datetime.now().isoformat(), "domain": domain, "type": "single"}
-                     if specific_data: data.update(specific_data)
+                     if has_filters(min_price, max_price, name_filter, reference_filter): return None
+                     data = {"title": page["title"], "method": "static", "timestamp": datetime.datetime.now().isoformat(), "domain": domain, "type": "single"}
+                     if page["specific"]: data.update(page["specific"])
                      return data
                 else: break
+        except JobStopped as e:
+            print(f"Job stopped ({e.reason}) before {current_url}", file=sys.stderr)
+            stop_reason = e.reason; break
+        except CircuitOpenError:
+            # Nothing collected yet: let the caller report the open circuit
+            if page_count == 0: raise
+            stop_reason = "circuit_open"; break
+        except drift.SelectorDrift:
+            # scrape_url escalates it to the browser
+            raise
         except Exception as e:
-            print(f"Error scraping {current_url}: {e}", file=sys.stderr); break
-    if all_list_data:
-         return {"type": "list", "data": all_list_data, "domain": domain, "url": start_url, "timestamp": datetime.datetime.now().isoformat()}
+            print(f"Error scraping {current_url}: {e}", file=sys.stderr)
+            stop_reason = "error"; break
+    if all_list_data or empty or stop_reason in ("deadline", "cancelled", QUERY_SATISFIED):
+         return list_result(all_list_data, pages, domain, start_url, stop_reason, current_url)
     return None
 
-def scrape_selenium(url, min_price=None, max_price=None, name_filter=None, reference_filter=None):
+def scrape_selenium(url, min_price=None, max_price=None, name_filter=None, reference_filter=None, ctl=None, query=None, on_page=None):
     print(f"Using Selenium Scraper for: {url}", file=sys.stderr)
-    chrome_options = Options()
-    chrome_options.add_argument("--headless=new")
-    chrome_options.add_argument("--no-sandbox")
-    chrome_options.add_argument("--disable-dev-shm-usage")
-    chrome_options.add_argument("--window-size=1920,1080")
-    service = Service(ChromeDriverManager().install())
-    driver = webdriver.Chrome(service=service, options=chrome_options)
-    all_list_data = []
+    ctl = ctl or JobControl()
+    domain = urllib.parse.urlparse(url).netloc
+    # Fail fast before starting a browser for a domain that is known to be down
+    probe = breaker.before_call(domain)
+    try:
+        chrome_options = Options()
+        chrome_options.add_argument("--headless=new")
+        chrome_options.add_argument("--no-sandbox")
+        chrome_options.add_argument("--disable-dev-shm-usage")
+        chrome_options.add_argument("--window-size=1920,1080")
+        service = Service(ChromeDriverManager().install())
+        driver = webdriver.Chrome(service=service, options=chrome_options)
+    except BaseException:
+        # A browser that fails to start says nothing about the domain
+        if probe: breaker.release(domain)
+        raise
+    # Cancelling quits the browser right away, which also aborts whatever it is loading
+    release_driver = ctl.on_cancel(driver.quit)
+    all_list_data = ItemStore()
+    pages = []
+    stop_reason = None
     page_count = 0
     MAX_PAGES = 10
+    crawl = archive.start_crawl(url, domain, "selenium")
     try:
-        domain = urllib.parse.urlparse(url).netloc
-        driver.get(url)
+        try:
+            if ctl.remaining() is not None:
+                driver.set_page_load_timeout(max(1, ctl.timeout(300)))
+            driver.get(url)
+        except Exception:
+            # A page load interrupted by the deadline or a cancel is not the domain's fault
+            ctl.checkpoint()
+            breaker.record_failure(domain)
+            raise
+        else:
+            breaker.record_success(domain)
+        finally:
+            if probe: breaker.release(domain)
         from selenium.webdriver.common.by import By
         from selenium.webdriver.support.ui import WebDriverWait
         from selenium.webdriver.support import expected_conditions as EC
-        config = None
-        for d, cfg in LIST_CONFIGS.items():
-            if d in domain: config = cfg; break
+        config = get_list_config(domain)
         while page_count < MAX_PAGES:
             print(f"Scraping page {page_count + 1}: {driver.current_url}", file=sys.stderr)
             try:
-                WebDriverWait(driver, 10).until(EC.presence_of_element_located((By.TAG_NAME, "body")))
-            except: break
-            driver.execute_script("window.scrollTo(0, document.body.scrollHeight/2)")
-            time.sleep(1.5)
-            driver.execute_script("window.scrollTo(0, document.body.scrollHeight)")
-            time.sleep(1.5)
-            soup = BeautifulSoup(driver.page_source, 'html.parser')
-            list_data = extract_list_data(soup, domain, min_price, max_price, name_filter, reference_filter)
+                ctl.between_pages()
+                try:
+                    WebDriverWait(driver, ctl.timeout(10)).until(EC.presence_of_element_located((By.TAG_NAME, "body")))
+                except JobStopped: raise
+                except: break
+                driver.execute_script("window.scrollTo(0, document.body.scrollHeight/2)")
+                ctl.sleep(1.5)
+                driver.execute_script("window.scrollTo(0, document.body.scrollHeight)")
+                ctl.sleep(1.5)
+                html = driver.page_source
+                if crawl: crawl.add(driver.current_url, archive.store_page(html))
+                soup, markup = parse_page(html, config)
+            except JobStopped as e:
+                print(f"Job stopped ({e.reason}) on page {page_count + 1}", file=sys.stderr)
+                stop_reason = e.reason; break
+            list_data = None
+            if config:
+                items = extract_items(soup, domain, config, markup)
+                if not items and page_count == 0 and looks_like_product(extract_specific_data(soup, domain)):
+                    items = None
+                elif page_count == 0:
+                    health = drift.page_health(items, empty=not items and is_empty_listing(soup, url, config))
+                    report = drift.check(domain, health)
+                    if report:
+                        items = extract_structured_items(html, domain)
+                        if not items:
+                            soup.decompose()
+                            return drift_result(domain, url, report)
+                        print(f"Selector drift on {domain} ({report['reason']}), using structured data", file=sys.stderr)
+                    else:
+                        drift.record(domain, health)
+                if items is not None:
+                    list_data = filter_items(items, min_price, max_price, name_filter, reference_filter)
             if list_data is not None:
                 all_list_data.extend(list_data)
+                pages.append({"key": str(page_count), "count": len(list_data), "fingerprint": page_fingerprint(list_data)})
                 page_count += 1
+                soup.decompose()
+                if on_page: on_page(list_data)
+                if query and query.offer(list_data):
+                    print(f"Query answered after {page_count} page(s)", file=sys.stderr)
+                    stop_reason = QUERY_SATISFIED; break
                 if config and config.get("next"):
                     try:
                         next_btns = driver.find_elements(By.CSS_SELECTOR, config["next"])
                         if next_btns and next_btns[0].is_displayed():
                             driver.execute_script("arguments[0].scrollIntoView(true);", next_btns[0])
-                            time.sleep(1)
+                            ctl.sleep(1)
                             driver.execute_script("arguments[0].click();", next_btns[0])
-                            time.sleep(3)
+                            ctl.sleep(3)
                         else: break
+                    except JobStopped as e:
+                        stop_reason = e.reason; break
                     except: break
                 else: break
             else:
                 if page_count == 0:
-                     if min_price or max_price or name_filter or reference_filter: return None
+                     if has_filters(min_price, max_price, name_filter, reference_filter): return None
                      specific_data = extract_specific_data(soup, domain)
                      data = {"title": driver.title, "method": "selenium", "timestamp": datetime.datetime.now().isoformat(), "domain": domain, "type": "single"}
                      if specific_data: data.update(specific_data)
+                     soup.decompose()
                      return data
                 else: break
-        if all_list_data:
-             return {"type": "list", "data": all_list_data, "domain": domain, "url": url, "timestamp": datetime.datetime.now().isoformat()}
+        if ctl.cancelled: stop_reason = "cancelled"
+        if all_list_data or stop_reason:
+             cursor = None
+             if stop_reason:
+                 try: cursor = driver.current_url
+                 except Exception: cursor = url
+             return list_result(all_list_data, pages, domain, url, stop_reason, cursor)
         return None
     finally:
-        driver.quit()
+        release_driver()
+        try: driver.quit()
+        except Exception: pass
+
+def scrape_url(url, mode="auto", min_price=None, max_price=None, name_filter=None, reference_filter=None, ctl=None, query=None, on_page=None):
+    if mode == "auto":
+        if "wiki.tn" in url or "mytek.tn" in url:
+            return scrape_selenium(url, min_price, max_price, name_filter, reference_filter, ctl, query, on_page)
+        try: return scrape_static(url, min_price, max_price, name_filter, reference_filter, ctl, query, escalate=True, on_page=on_page)
+        except (CircuitOpenError, JobStopped): raise
+        except drift.SelectorDrift as e:
+            print(f"{e}; escalating to the browser", file=sys.stderr)
+            return scrape_selenium(url, min_price, max_price, name_filter, reference_filter, ctl, query, on_page)
+        except: return scrape_selenium(url, min_price, max_price, name_filter, reference_filter, ctl, query, on_page)
+    elif mode == "selenium":
+        return scrape_selenium(url, min_price, max_price, name_filter, reference_filter, ctl, query, on_page)
+    elif mode == "catalog":
+        # Every leaf listing of the URL's retailer, discovered from its navigation
+        from catalog import crawl_domain
+        return crawl_domain(urllib.parse.urlparse(url).netloc, ctl, on_page=on_page)
+    return scrape_static(url, min_price, max_price, name_filter, reference_filter, ctl, query, on_page=on_page)
+
+def fetch_website(supabase, website_id):
+    if pg_store.enabled() and not supabase:
+        try: return pg_store.fetch_website(website_id)
+        except Exception as e:
+            print(f"Website fetch error: {e}", file=sys.stderr)
+            return None
+    try:
+        response = supabase.table('Website').select('*').eq('id', website_id).single().execute()
+        return response.data
+    except Exception as e:
+        # print(f"Website fetch error: {e}", file=sys.stderr)
+        return None
+
+def save_scraped_data(supabase, website_id, url, scraped_data, products=True):
+    """Updates the Website's last scrape summary and, unless products is False, upserts the scraped products."""
+    summary = scraped_data
+    if scraped_data.get("type") == "list":
+         summary = {"type": "list", "count": len(scraped_data["data"]), "url": url, "timestamp": scraped_data["timestamp"]}
+    items = (scraped_data["data"] if scraped_data.get("type") == "list" else [scraped_data]) if products else []
+    if spool.ENABLED:
+        # Products first, so the summary never lands before what it counts
+        spool.append_products(website_id, url, items, scraped_data.get("domain", ""))
+        spool.append_website(website_id, url, summary)
+        return
+    if pg_store.enabled():
+        pg_store.save(website_id, url, items, summary, scraped_data.get("domain", ""))
+        return
+    
+    # Update Website with last scrape data
+    supabase.table('Website').update({
+        "scrapedData": json.dumps(summary),
+        "lastScraped": datetime.datetime.now().isoformat()
+    }).eq('id', website_id).execute()
+
+    if items:
+        save_products(supabase, website_id, url, items, scraped_data.get("domain", ""))
+
+def product_doc(item, website_id, url, domain="", scraped_at=None):
+    return {
+        "name": item.get("name", "Unknown"),
+        "price": item.get("price", "Not found"),
+        "priceAmount": float(item.get("priceAmount") or 0.0),
+        "reference": item.get("reference", "Not found"),
+        "overview": item.get("overview", "Not found"),
+        "category": item.get("category", "Not found"),
+        "url": item.get("url", url),
+        "domain": item.get("domain") or domain,
+        "websiteId": website_id,
+        "scrapedAt": scraped_at or datetime.datetime.now().isoformat()
+    }
+
+def save_products(supabase, website_id, url, items, domain=""):
+    """Upserts products by URL; returns how many were written (spooled, with the spool on)."""
+    if spool.ENABLED: return spool.append_products(website_id, url, items, domain)
+    if pg_store.enabled(): return pg_store.save(website_id, url, items, domain=domain)
+    saved = 0
+    for item in items:
+        try:
+            p_doc = product_doc(item, website_id, url, domain)
+            p_url = p_doc["url"]
+            
+            # Upsert product
+            # Check if exists by URL
+            # Note: upsert in Supabase usually requires conflict on unique constraint.
+            # Assuming 'url' is unique in Product schema? 
+            # Checking schema: URL is NOT unique in Product model! 
+            # "url String" in Model Product.
+            # So we must search first.
+            
+            existing = supabase.table('Product').select('id').eq('url', p_url).execute()
+            if existing.data and len(existing.data) > 0:
+                supabase.table('Product').update(p_doc).eq('id', existing.data[0]['id']).execute()
+            else:
+                supabase.table('Product').insert(p_doc).execute()
+            saved += 1
+                
+        except Exception as e:
+            # print(f"Product save error: {e}", file=sys.stderr)
+            pass
+    return saved
+
+# Product URLs per lookup when replaying spooled writes (they travel in the query string)
+URL_LOOKUP_CHUNK = 50
+
+def write_spooled(supabase, records):
+    """Replays one batch of spooled writes. Raises when the database refuses, so the spool keeps the batch."""
+    products, websites = {}, []
+    for record in records:
+        if record["kind"] == "product":
+            # The last spooled version of a product wins
+            products.setdefault(record["website"], {})[record["key"]] = record
+        else:
+            websites.append(record)
+    if pg_store.enabled():
+        # A website's products and its summary in this batch commit together (the last summary wins)
+        summaries = {record["website"]: record for record in websites}
+        for website_id in dict.fromkeys(list(products) + list(summaries)):
+            latest, website = products.get(website_id, {}), summaries.get(website_id)
+            pg_store.save(website_id, website and website["url"], [dict(r["item"], domain=r["item"].get("domain") or r["domain"]) for r in latest.values()],
+                          website and website["summary"])
+        return
+    for website_id, latest in products.items():
+        urls = [r["item"]["url"] for r in latest.values()]
+        ids = {}
+        for i in range(0, len(urls), URL_LOOKUP_CHUNK):
+            existing = supabase.table('Product').select('id,url').in_('url', urls[i:i + URL_LOOKUP_CHUNK]).execute()
+            ids.update((row["url"], row["id"]) for row in existing.data or [])
+        docs = []
+        for record in latest.values():
+            doc = product_doc(record["item"], website_id, record["item"]["url"], record["domain"], record["at"])
+            # A product inserted by an earlier, unacknowledged replay already carries the key as its id
+            doc.update(id=ids.get(doc["url"], record["key"]), updatedAt=record["at"])
+            docs.append(doc)
+        supabase.table('Product').upsert(docs, on_conflict='id').execute()
+    for record in websites:
+        supabase.table('Website').update({"scrapedData": json.dumps(record["summary"]), "lastScraped": record["at"]}).eq('id', record["website"]).execute()
+
+def spool_writer(supabase):
+    """write_batch callback for spool.drain, or None when no database is configured."""
+    if not supabase and not pg_store.enabled(): return None
+    return lambda records: write_spooled(supabase, records)
+
+SPOOL_DRAIN_TIMEOUT = float(os.getenv('SCRAPER_SPOOL_DRAIN_TIMEOUT', '60'))
+
+def drain_spool(supabase, timeout=SPOOL_DRAIN_TIMEOUT, detach=False):
+    """Writes out what this process spooled, for at most timeout seconds; the rest waits for the next drain.
+    With detach a detached process does it, so an exiting scraper does not hold back its caller.
+    Segments of other processes are left to their own drainer or the scheduler's."""
+    write_batch = spool_writer(supabase)
+    if not spool.ENABLED or not write_batch: return None
+    spool.seal()
+    segments = spool.own_segments()
+    if not segments: return None
+    if detach and spool.drain_detached(segments, timeout):
+        print(f"Spool: {len(segments)} segment(s) handed to a background drainer", file=sys.stderr)
+        return None
+    stats = spool.drain(write_batch, timeout, set(segments))
+    if stats["written"] or stats["pending"]:
+        print(f"Spool: {stats['written']} write(s) replayed, {stats['pending']} segment(s) pending", file=sys.stderr)
+    return stats
+
+def apply_filters(scraped_data, min_price=None, max_price=None, name_filter=None, reference_filter=None):
+    """Narrows an unfiltered scrape result to the job filters; None when nothing matches."""
+    if not has_filters(min_price, max_price, name_filter, reference_filter): return scraped_data
+    if not scraped_data or scraped_data.get("type") != "list": return None
+    items = filter_items(scraped_data["data"], min_price, max_price, name_filter, reference_filter)
+    if not items and not scraped_data.get("partial"): return None
+    return dict(scraped_data, data=items)
+
+def apply_query(scraped_data, query):
+    """Answers a limit/top-K query over a list result; None when nothing matches."""
+    if not scraped_data or scraped_data.get("type") != "list": return None
+    items = query.select(scraped_data["data"])
+    if not items and not scraped_data.get("partial"): return None
+    return dict(scraped_data, data=items)
+
+def can_persist(supabase, website_id):
+    return bool(website_id) and (bool(supabase) or pg_store.enabled())
+
+def persist_pipeline(supabase, website_id, url, min_price=None, max_price=None, name_filter=None, reference_filter=None):
+    """filter -> persist stages saving the job's matching products of each page while the crawl continues."""
+    return Pipeline([
+        Stage("filter", lambda items: filter_items(items, min_price, max_price, name_filter, reference_filter) or None),
+        Stage("persist", lambda items: save_products(supabase, website_id, url, items), workers=PERSIST_WORKERS),
+    ])
+
+def run_job(url, mode="auto", min_price=None, max_price=None, name_filter=None, reference_filter=None, website_id=None, supabase=None, snapshot_ttl=None, deadline=None, ctl=None, limit=None, top_k=None, order_by="priceAmount"):
+    """Scrapes url and, when website_id is given, persists the results. Returns the JSON-ready result.
+
+    Listings are always crawled unfiltered and the filters applied afterwards, so that filtered
+    jobs can be answered from a fresh snapshot of the last complete crawl instead.
+    With a deadline (seconds) or a cancel through ctl the job stops and returns what it has, flagged partial.
+    limit / top_k (ordered by order_by) stop paginating as soon as the answer is known.
+    Crawled products are persisted through a pipeline page by page, except for limit / top-K jobs."""
+    ctl = ctl or JobControl(deadline)
+    pipeline = None
+    try:
+        filtered = has_filters(min_price, max_price, name_filter, reference_filter)
+        query = None
+        if limit or top_k:
+            query = ListQuery(lambda items: filter_items(items, min_price, max_price, name_filter, reference_filter), limit, top_k, order_by)
+        full_data = load_snapshot(url, snapshot_ttl) if filtered or query else None
+        if full_data:
+            print(f"Serving filtered scrape of {url} from snapshot", file=sys.stderr)
+            full_data = dict(full_data, source="snapshot")
+        else:
+            crawl_url = query.crawl_url(url, get_list_config(urllib.parse.urlparse(url).netloc)) if query else url
+            # A top-K answer is only known at the end, so those jobs are saved in one go
+            if can_persist(supabase, website_id) and not query and PIPELINE:
+                pipeline = persist_pipeline(supabase, website_id, url, min_price, max_price, name_filter, reference_filter)
+            try:
+                full_data = scrape_url(crawl_url, mode, ctl=ctl, query=query, on_page=pipeline and pipeline.submit)
+            finally:
+                if pipeline:
+                    pipeline.close()
+                    print(f"Pipeline: {pipeline.summary()}", file=sys.stderr)
+            if full_data and full_data.get("type") == "list":
+                # Indexed in the background: the job's result does not wait for matching
+                submit_update(full_data["data"], full_data.get("domain"))
+            # Only complete crawls can stand in for later filtered jobs
+            if full_data and full_data.get("type") == "list" and not full_data.get("stopReason"):
+                try: save_snapshot(crawl_url, full_data)
+                except Exception as e: print(f"Snapshot save error: {e}", file=sys.stderr)
+                # ...and say anything about how fast the listing changes
+                if crawl_url == url:
+                    try: record_scrape(url, full_data.get("pages", []))
+                    except Exception as e: print(f"Revisit stats error: {e}", file=sys.stderr)
+
+        if query:
+            scraped_data = apply_query(full_data, query)
+        else:
+            scraped_data = apply_filters(full_data, min_price, max_price, name_filter, reference_filter)
+        if not scraped_data:
+            if filtered or query:
+                return {"success": True, "data": {"type": "list", "data": [], "count": 0, "domain": urllib.parse.urlparse(url).netloc, "url": url, "timestamp": datetime.datetime.now().isoformat()}}
+            return {"error": "No data scraped"}
+
+        if can_persist(supabase, website_id):
+            # Listing products already went through the pipeline's persist stage
+            streamed = bool(pipeline and pipeline.submitted) and scraped_data.get("type") == "list"
+            # ...except pages a stage failed on, which are saved now with the rest of the job
+            unsaved = [item for page in pipeline.failed() for item in filter_items(page, min_price, max_price, name_filter, reference_filter)] if streamed else []
+            if unsaved: save_products(supabase, website_id, url, unsaved, scraped_data.get("domain", ""))
+            save_scraped_data(supabase, website_id, url, scraped_data, products=not streamed)
+                    
+        result = {"success": True, "data": scraped_data}
+        if pipeline: result["pipeline"] = pipeline.metrics()
+        return result
+    except JobStopped as e:
+        return {"success": True, "data": list_result(ItemStore(), [], urllib.parse.urlparse(url).netloc, url, e.reason, url)}
+    except CircuitOpenError as e:
+        return {"error": str(e), "status": "circuit_open", "domain": e.domain, "retryAfter": round(e.retry_after, 1)}
+    except Exception as e:
+        return {"error": str(e)}
+    finally:
+        flush_state()
+
+def flush_state():
+    """Writes the extraction cache and selector stats gathered in memory to the state directory,
+    and seals this process's spool segment so it can be drained."""
+    for name, flush in (("Extraction cache", extraction_cache.flush), ("Selector stats", selector_stats.flush), ("Spool", spool.seal)):
+        try: flush()
+        except Exception as e: print(f"{name} save error: {e}", file=sys.stderr)
+
+def print_json(value):
+    """Prints value as one JSON line, streaming the items of list results, and flushes it."""
+    dump_json(value, sys.stdout)
+    sys.stdout.write("\n")
+    sys.stdout.flush()
+
+def watch_for_cancel(ctl):
+    """Cancels ctl on SIGTERM/SIGINT or when a "cancel" line arrives on stdin (sent by scraperService)."""
+    import signal
+    for name in ("SIGTERM", "SIGINT", "SIGBREAK"):
+        if hasattr(signal, name):
+            signal.signal(getattr(signal, name), lambda *_: ctl.cancel())
+
+    def read_stdin():
+        try:
+            for line in sys.stdin:
+                if line.strip().lower() == "cancel":
+                    print("Cancel requested", file=sys.stderr)
+                    ctl.cancel()
+                    return
+        except (OSError, ValueError):
+            pass
+
+    if sys.stdin and not sys.stdin.isatty():
+        threading.Thread(target=read_stdin, name="cancel-watcher", daemon=True).start()
 
 def main():
     import argparse
@@ -434,6 +981,12 @@ def main():
     parser.add_argument('--maxPrice', type=float)
     parser.add_argument('--nameFilter', type=str)
     parser.add_argument('--referenceFilter', type=str)
+    parser.add_argument('--deadline', type=float, help="Time budget in seconds; when it runs out the items collected so far are returned with partial=true")
+    parser.add_argument('--limit', type=int, help="Stop once this many matching items were found")
+    parser.add_argument('--topK', type=int, help="Return only the K best matches by --orderBy")
+    parser.add_argument('--orderBy', default="priceAmount", help="priceAmount (cheapest first) or -priceAmount")
+    parser.add_argument('--lane', choices=[INTERACTIVE, BACKGROUND], default=INTERACTIVE, help="Background runs pause between pages while interactive scrapes are running")
+    parser.add_argument('--snapshotTtl', type=float, help="Max age in seconds of a snapshot used to answer filtered scrapes (0 always crawls)")
     args = parser.parse_args()
     min_price = args.minPrice
     max_price = args.maxPrice
@@ -444,86 +997,24 @@ def main():
     url = args.url or args.website_id
     website_id = None
     
-    if supabase and not args.url:
+    if (supabase or pg_store.enabled()) and not args.url:
          # Fetch website URL from Supabase if not provided
-         try:
-             response = supabase.table('Website').select('*').eq('id', args.website_id).single().execute()
-             if response.data:
-                 website = response.data
-                 url = website['url']
-                 website_id = website['id']
-         except Exception as e:
-             # print(f"Website fetch error: {e}", file=sys.stderr)
-             pass
-
-    try:
-        scraped_data = None
-        if args.mode == "auto":
-            if "wiki.tn" in url or "mytek.tn" in url:
-                scraped_data = scrape_selenium(url, min_price, max_price, name_filter, reference_filter)
-            else:
-                try: scraped_data = scrape_static(url, min_price, max_price, name_filter, reference_filter)
-                except: scraped_data = scrape_selenium(url, min_price, max_price, name_filter, reference_filter)
-        elif args.mode == "selenium":
-            scraped_data = scrape_selenium(url, min_price, max_price, name_filter, reference_filter)
-        else:
-            scraped_data = scrape_static(url, min_price, max_price, name_filter, reference_filter)
-        if not scraped_data:
-            if min_price or max_price or name_filter or reference_filter:
-                print(json.dumps({"success": True, "data": {"type": "list", "data": [], "count": 0, "domain": urllib.parse.urlparse(url).netloc, "url": url, "timestamp": datetime.datetime.now().isoformat()}}))
-            else:
-                print(json.dumps({"error": "No data scraped"}))
-            return
+         website = fetch_website(supabase, args.website_id)
+         if website:
+             url = website['url']
+             website_id = website['id']
 
-        if supabase and website_id:
-            summary = scraped_data
-            if scraped_data.get("type") == "list":
-                 summary = {"type": "list", "count": len(scraped_data["data"]), "url": url, "timestamp": scraped_data["timestamp"]}
-            
-            # Update Website with last scrape data
-            supabase.table('Website').update({
-                "scrapedData": json.dumps(summary),
-                "lastScraped": datetime.datetime.now().isoformat()
-            }).eq('id', website_id).execute()
-
-            items = scraped_data["data"] if scraped_data.get("type") == "list" else [scraped_data]
-            for item in items:
-                try:
-                    p_url = item.get("url", url)
-                    p_doc = {
-                        "name": item.get("name", "Unknown"),
-                        "price": item.get("price", "Not found"),
-                        "priceAmount": float(item.get("priceAmount", 0.0)),
-                        "reference": item.get("reference", "Not found"),
-                        "overview": item.get("overview", "Not found"),
-                        "category": item.get("category", "Not found"),
-                        "url": p_url,
-                        "domain": item.get("domain") or scraped_data.get("domain", ""),
-                        "websiteId": website_id,
-                        "scrapedAt": datetime.datetime.now().isoformat()
-                    }
-                    
-                    # Upsert product
-                    # Check if exists by URL
-                    # Note: upsert in Supabase usually requires conflict on unique constraint.
-                    # Assuming 'url' is unique in Product schema? 
-                    # Checking schema: URL is NOT unique in Product model! 
-                    # "url String" in Model Product.
-                    # So we must search first.
-                    
-                    existing = supabase.table('Product').select('id').eq('url', p_url).execute()
-                    if existing.data and len(existing.data) > 0:
-                        supabase.table('Product').update(p_doc).eq('id', existing.data[0]['id']).execute()
-                    else:
-                        supabase.table('Product').insert(p_doc).execute()
-                        
-                except Exception as e:
-                    # print(f"Product save error: {e}", file=sys.stderr)
-                    pass
-                    
-        print(json.dumps({"success": True, "data": scraped_data}))
-    except Exception as e:
-        print(json.dumps({"error": str(e)}))
+    ctl = JobControl(args.deadline, BackgroundThrottle() if args.lane == BACKGROUND else None)
+    watch_for_cancel(ctl)
+    if args.lane == INTERACTIVE:
+        with interactive_marker():
+            result = run_job(url, args.mode, min_price, max_price, name_filter, reference_filter, website_id, supabase, args.snapshotTtl, ctl=ctl, limit=args.limit, top_k=args.topK, order_by=args.orderBy)
+    else:
+        result = run_job(url, args.mode, min_price, max_price, name_filter, reference_filter, website_id, supabase, args.snapshotTtl, ctl=ctl, limit=args.limit, top_k=args.topK, order_by=args.orderBy)
+    # The result goes out first; persistence and matching finish behind it
+    print_json(result)
+    drain_spool(supabase, detach=True)
+    wait_for_updates()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,136 @@
+"""Cross-retailer search: one query fanned out to every retailer at once.
+
+Usage:
+    python search.py "lenovo ideapad" [--minPrice 800] [--maxPrice 2000]
+                     [--domains tunisianet.com.tn,mytek.tn] [--limit 40] [--deadline 60]
+
+Each retailer's search page (LIST_CONFIGS "search") is crawled on its own
+interactive worker, static or browser as scrape_url picks it, so the whole
+search takes about as long as the slowest retailer. Results are streamed as
+JSON lines while they arrive:
+
+    {"event": "items", "domain": ..., "items": [...]}   # one page, cheapest first
+    {"event": "done", "domain": ..., "count": ..., ...}   # a retailer finished
+    {"event": "result", "success": true, "data": [...]}   # everything, merged by price
+"""
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(__file__), 'libs'))
+import json
+import time
+import heapq
+import threading
+import urllib.parse
+import argparse
+
+from scraper import LIST_CONFIGS, scrape_url, filter_items, watch_for_cancel, flush_state
+from worker_pool import WorkStealingPool
+from job_control import JobControl, JobStopped
+from circuit_breaker import CircuitOpenError
+from query import ListQuery
+from lanes import INTERACTIVE, interactive_marker
+
+
+def price_key(item):
+    # Items without a parsed price sort after every priced one
+    price = item.get("priceAmount") or 0.0
+    return (price <= 0, price)
+
+
+def search_url(domain, query):
+    template = LIST_CONFIGS[domain].get("search")
+    return template.format(query=urllib.parse.quote_plus(query)) if template else None
+
+
+def searchable_domains():
+    return [d for d, cfg in LIST_CONFIGS.items() if cfg.get("search")]
+
+
+class ResultStream:
+    """Writes search events as JSON lines, one at a time."""
+
+    def __init__(self, out=None):
+        self.out = out or sys.stdout
+        self._lock = threading.Lock()
+
+    def emit(self, event, **fields):
+        with self._lock:
+            self.out.write(json.dumps(dict(event=event, **fields)) + "\n")
+            self.out.flush()
+
+
+def search_retailer(domain, query, stream, ctl, min_price=None, max_price=None, name_filter=None, limit=None):
+    """Crawls one retailer's search results, streaming each page; returns its matches cheapest first."""
+    started = time.time()
+    url = search_url(domain, query)
+    found = []
+
+    def on_page(items):
+        matches = filter_items(items, min_price, max_price, name_filter)
+        if matches:
+            matches = sorted(matches, key=price_key)
+            found.extend(matches)
+            stream.emit("items", domain=domain, items=matches)
+        return matches
+
+    summary = {"domain": domain, "url": url}
+    try:
+        data = scrape_url(url, "auto", ctl=ctl, query=ListQuery(on_page, limit))
+        if data and data.get("stopReason"): summary["stopReason"] = data["stopReason"]
+    except JobStopped as e:
+        summary["stopReason"] = e.reason
+    except CircuitOpenError as e:
+        summary.update(error=str(e), status="circuit_open", retryAfter=round(e.retry_after, 1))
+    except Exception as e:
+        print(f"Search on {domain} failed: {e}", file=sys.stderr)
+        summary["error"] = str(e)
+    found.sort(key=price_key)
+    stream.emit("done", count=len(found), elapsed=round(time.time() - started, 3), **summary)
+    return found
+
+
+def search(query, min_price=None, max_price=None, name_filter=None, domains=None, limit=None, ctl=None, stream=None):
+    """Searches every retailer concurrently and returns all matches merged in price order."""
+    domains = domains or searchable_domains()
+    stream = stream or ResultStream()
+    ctl = ctl or JobControl()
+    pool = WorkStealingPool(workers=len(domains), per_key_limit=1, interactive_workers=0)
+    try:
+        futures = [pool.submit(d, search_retailer, d, query, stream, ctl, min_price, max_price, name_filter, limit, lane=INTERACTIVE)
+                   for d in domains]
+        # search_retailer reports its own failures, so every future holds a list
+        return list(heapq.merge(*[f.result() for f in futures], key=price_key))
+    finally:
+        pool.shutdown()
+        flush_state()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('query')
+    parser.add_argument('--minPrice', type=float)
+    parser.add_argument('--maxPrice', type=float)
+    parser.add_argument('--nameFilter', type=str)
+    parser.add_argument('--domains', type=str, help="Comma separated retailers (default: every retailer with a search page)")
+    parser.add_argument('--limit', type=int, help="Matches to collect per retailer before it stops paginating")
+    parser.add_argument('--deadline', type=float, help="Time budget in seconds for the whole search")
+    args = parser.parse_args()
+
+    domains = [d.strip() for d in args.domains.split(",") if d.strip()] if args.domains else None
+    unknown = [d for d in domains or [] if d not in searchable_domains()]
+    if unknown:
+        print(json.dumps({"event": "result", "error": f"No search page configured for: {', '.join(unknown)}"})); return
+
+    stream = ResultStream()
+    ctl = JobControl(args.deadline)
+    watch_for_cancel(ctl)
+    started = time.time()
+    with interactive_marker():
+        items = search(args.query, args.minPrice, args.maxPrice, args.nameFilter.lower() if args.nameFilter else None,
+                       domains, args.limit, ctl, stream)
+    stream.emit("result", success=True, query=args.query, count=len(items), elapsed=round(time.time() - started, 3),
+                partial=ctl.stopped, data=items)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+"""Per-domain selector hit statistics and fallback reordering.
+
+SITE_CONFIGS and LIST_CONFIGS list several fallback selectors per field, and
+extract_specific_data also walks up to six ancestors of an anchor for each
+of them. This module records which selector (and at which ancestor depth)
+actually matched, per domain and field, so that later extractions try the
+winner first. Selectors that have not matched in ``IDLE_AFTER`` extractions
+in a row are moved behind all the others: they are only tried as a last
+resort, which keeps their misses out of the hot path.
+
+Stats are kept in memory and merged into the state directory by flush():
+what this process counted since its last flush is added to what the file
+holds, so concurrent scraper processes never drop each other's counts.
+"""
+import os
+import copy
+import threading
+
+from state import load_json, update_json
+
+STATE_FILE = 'selectors.json'
+IDLE_AFTER = int(os.getenv('SCRAPER_SELECTOR_IDLE_AFTER', '50'))
+# Whole-document fallback of extract_specific_data, as opposed to an ancestor depth
+DOCUMENT = "doc"
+# A selector's first stats, and its first entry in the changes since the last flush
+BLANK = {"hits": 0, "idle": 0, "depths": {}}
+PENDING = dict(BLANK, hit=False)
+
+_stats = None
+# Changes since the last flush, per domain, field and selector: hits, depth counts, misses
+# since the last hit (all of them when it was not hit) and whether it was hit at all
+_pending = {}
+_lock = threading.Lock()
+
+
+def _load():
+    global _stats
+    if _stats is None: _stats = load_json(STATE_FILE, {}) or {}
+    return _stats
+
+
+def _apply(stats, delta, blank):
+    """Folds delta into stats (stats or another delta, whose new entries start as blank)."""
+    for domain, fields in delta.items():
+        for field, selectors in fields.items():
+            field_stats = stats.setdefault(domain, {}).setdefault(field, {})
+            for selector, d in selectors.items():
+                s = field_stats.setdefault(selector, copy.deepcopy(blank))
+                s["hits"] += d["hits"]
+                s["idle"] = d["idle"] if d["hit"] else s["idle"] + d["idle"]
+                for depth, count in d["depths"].items():
+                    s["depths"][depth] = s["depths"].get(depth, 0) + count
+                if "hit" in s: s["hit"] = s["hit"] or d["hit"]
+
+
+def split_selectors(selectors):
+    """A LIST_CONFIGS value ("a, b") or a SITE_CONFIGS list as a list of alternatives."""
+    if isinstance(selectors, str): return [s.strip() for s in selectors.split(',') if s.strip()]
+    return list(selectors or [])
+
+
+class FieldStats:
+    """Snapshot of the stats of one (domain, table, field), taken once per page."""
+
+    def __init__(self, stats, selectors):
+        self.selectors = split_selectors(selectors)
+        self._stats = stats
+
+    def ordered(self):
+        """Winners first (most hits), then untried and losing selectors in config order, idle ones last."""
+        def rank(pair):
+            index, selector = pair
+            s = self._stats.get(selector, {})
+            idle = s.get("idle", 0) >= IDLE_AFTER
+            return (idle, -s.get("hits", 0) if not idle else 0, index)
+        return [s for _, s in sorted(enumerate(self.selectors), key=rank)]
+
+    def preferred(self):
+        """(selector, depth) that matched most often, or None."""
+        best = None
+        for selector in self.selectors:
+            s = self._stats.get(selector)
+            if not s or not s.get("depths") or s.get("idle", 0) >= IDLE_AFTER: continue
+            depth, count = max(s["depths"].items(), key=lambda kv: kv[1])
+            if best is None or s["hits"] > best[2]: best = (selector, depth, s["hits"])
+        return best and (best[0], DOCUMENT if best[1] == DOCUMENT else int(best[1]))
+
+
+class SelectorRecorder:
+    """Collects the hits of one extraction (a page) and merges them into the stats on commit()."""
+
+    def __init__(self, domain, table):
+        self.domain = domain
+        self.table = table
+        self._hits = {}
+        self._fields = {}
+
+    def field(self, name, selectors):
+        with _lock:
+            stats = dict(_load().get(self.domain, {}).get(f"{self.table}:{name}", {}))
+        fs = FieldStats(stats, selectors)
+        self._fields[name] = fs.selectors
+        return fs
+
+    def hit(self, name, selector, depth=None):
+        key = (name, selector, DOCUMENT if depth is None else str(depth))
+        self._hits[key] = self._hits.get(key, 0) + 1
+
+    def commit(self):
+        if not self._fields: return
+        delta = {}
+        for name, selectors in self._fields.items():
+            field_delta = delta.setdefault(self.domain, {}).setdefault(f"{self.table}:{name}", {})
+            hit_now = {selector for (n, selector, _) in self._hits if n == name}
+            for selector in selectors:
+                field_delta[selector] = {"hits": 0, "idle": 1 if hit_now and selector not in hit_now else 0,
+                                         "depths": {}, "hit": selector in hit_now}
+            for (n, selector, depth), count in self._hits.items():
+                if n != name: continue
+                field_delta[selector]["hits"] += count
+                field_delta[selector]["depths"][depth] = field_delta[selector]["depths"].get(depth, 0) + count
+        with _lock:
+            _apply(_load(), delta, BLANK)
+            _apply(_pending, delta, PENDING)
+        self._hits, self._fields = {}, {}
+
+
+def flush():
+    """Adds what was counted since the last flush to the state file, and picks up other processes' counts."""
+    global _stats, _pending
+    with _lock:
+        if not _pending: return
+        delta, _pending = _pending, {}
+    try:
+        data = update_json(STATE_FILE, lambda stats: _apply(stats, delta, BLANK), {})
+    except BaseException:
+        with _lock:
+            # Kept for the next flush, ahead of what was counted meanwhile
+            _apply(delta, _pending, PENDING)
+            _pending = delta
+        raise
+    with _lock:
+        _stats = data
+        _apply(_stats, _pending, BLANK)
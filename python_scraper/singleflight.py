@@ -0,0 +1,136 @@
+"""Request coalescing for identical pages fetched by concurrent jobs.
+
+``SingleFlight`` shares one in-flight call between threads of the same
+worker process. ``FileSingleFlight`` does the same across scraper processes
+(each scrape triggered from the backend is its own ``scraper.py``): the
+first process takes an exclusive lock file for the key, publishes its
+result next to it, and the others wait for that result instead of
+downloading the page again. Published results stay reusable for a few
+seconds, which covers jobs triggered moments apart.
+"""
+import os
+import json
+import time
+import hashlib
+import threading
+
+from state import state_path
+
+FLIGHT_DIR = 'flight'
+# How long a published result is reused by processes that arrive after the leader finished
+RESULT_TTL = float(os.getenv('SCRAPER_FLIGHT_TTL', '10'))
+# A lock older than this is considered abandoned by a crashed leader
+LOCK_TIMEOUT = 60.0
+POLL_INTERVAL = 0.1
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn, ctl=None):
+        """Runs fn once per key at a time; concurrent callers get the same result (or exception).
+        fn runs on a thread of its own, so no caller's job control applies to it: every caller,
+        the one that started it included, waits under its own ctl and raises JobStopped when its
+        job stops, while fn keeps going for the others."""
+        with self._lock:
+            call = self._calls.get(key)
+            if call is None:
+                call = self._calls[key] = _Call()
+                threading.Thread(target=self._run, args=(key, call, fn), name="singleflight", daemon=True).start()
+        while not call.done.wait(POLL_INTERVAL):
+            if ctl: ctl.checkpoint()
+        if call.error: raise call.error
+        return call.result
+
+    def _run(self, key, call, fn):
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+
+class FileSingleFlight:
+    def __init__(self, ttl=RESULT_TTL, lock_timeout=LOCK_TIMEOUT):
+        self.ttl = ttl
+        self.lock_timeout = lock_timeout
+
+    def _paths(self, key):
+        digest = hashlib.sha1(key.encode('utf-8')).hexdigest()
+        return state_path(FLIGHT_DIR, digest + '.lock'), state_path(FLIGHT_DIR, digest + '.json')
+
+    def _fresh_result(self, result_path):
+        try:
+            if time.time() - os.path.getmtime(result_path) > self.ttl: return None
+            with open(result_path, encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _acquire(self, lock_path):
+        try:
+            os.close(os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+            return True
+        except FileExistsError:
+            try:
+                if time.time() - os.path.getmtime(lock_path) > self.lock_timeout:
+                    os.remove(lock_path)
+            except OSError:
+                pass
+            return False
+
+    def _prune(self, directory):
+        cutoff = time.time() - max(self.ttl, self.lock_timeout) * 10
+        for name in os.listdir(directory):
+            path = os.path.join(directory, name)
+            try:
+                if name.endswith('.json') and os.path.getmtime(path) < cutoff: os.remove(path)
+            except OSError:
+                pass
+
+    def do(self, key, fn, ctl=None):
+        """Like SingleFlight.do across processes; fn must return a JSON-serializable value.
+        A leader that fails publishes nothing, so a waiting process takes over the lock."""
+        lock_path, result_path = self._paths(key)
+        while True:
+            cached = self._fresh_result(result_path)
+            if cached is not None: return cached["value"]
+            if self._acquire(lock_path): break
+            if ctl: ctl.sleep(POLL_INTERVAL)
+            else: time.sleep(POLL_INTERVAL)
+        try:
+            value = fn()
+            tmp = f"{result_path}.{os.getpid()}.tmp"
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump({"value": value}, f)
+            os.replace(tmp, result_path)
+            self._prune(os.path.dirname(result_path))
+            return value
+        finally:
+            try: os.remove(lock_path)
+            except OSError: pass
+
+
+_local_flight = SingleFlight()
+_process_flight = FileSingleFlight()
+
+
+def coalesce(key, fn, ctl=None):
+    """Shares fn() between concurrent callers for key, within this process and across processes.
+    fn runs for whichever job gets there first, so it must not depend on that job's control;
+    ctl only bounds how long this caller waits, and is checked again once the result is in."""
+    value = _local_flight.do(key, lambda: _process_flight.do(key, fn), ctl)
+    if ctl: ctl.checkpoint()
+    return value
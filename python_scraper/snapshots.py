@@ -0,0 +1,34 @@
+"""Latest complete unfiltered extraction per listing URL.
+
+Filtered scrapes (price range, name, reference) only narrow down what a
+full crawl of the same listing returns, so while a snapshot is fresher than
+the TTL they are answered from it without touching the network.
+"""
+import os
+import time
+import hashlib
+
+from state import load_json, save_json
+from urls import normalize_url
+
+SNAPSHOT_DIR = 'snapshots'
+DEFAULT_TTL = float(os.getenv('SCRAPER_SNAPSHOT_TTL', '600'))
+
+
+def _name(url):
+    return os.path.join(SNAPSHOT_DIR, hashlib.sha1(normalize_url(url).encode('utf-8')).hexdigest() + '.json')
+
+
+def save_snapshot(url, scraped_data):
+    """Stores a complete unfiltered list result."""
+    save_json(_name(url), {"savedAt": time.time(), "url": normalize_url(url), "data": scraped_data})
+
+
+def load_snapshot(url, ttl=None):
+    """Returns the stored list result if it is younger than ttl seconds, else None."""
+    ttl = DEFAULT_TTL if ttl is None else ttl
+    if ttl <= 0: return None
+    snapshot = load_json(_name(url))
+    if not snapshot or snapshot.get("url") != normalize_url(url): return None
+    if time.time() - snapshot.get("savedAt", 0) > ttl: return None
+    return snapshot["data"]
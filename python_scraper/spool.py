@@ -0,0 +1,347 @@
+"""Local write-ahead spool for Product and Website writes.
+
+Writes are appended to the spool (JSON lines, fsynced) instead of going to
+the database while the scrape runs, so a slow or unreachable database
+neither stalls the crawl nor loses a single item. A drainer replays the
+spool in batches, retrying with backoff, and only forgets a batch once the
+database accepted it.
+
+Every process appends to its own segment file, sealed after
+``SEGMENT_AGE`` seconds or ``SEGMENT_BYTES`` (and by flush). Drainers claim
+sealed segments through lock files and record how far they got, so
+several processes can drain the same spool and a crashed drainer resumes
+where it stopped. A replayed batch may already have been written; each
+product carries an idempotency key (a UUID derived from its URL) that
+becomes its id when inserted, so a replay updates the product instead of
+inserting it twice. A batch that still fails after ``DEAD_AFTER`` drain
+passes is moved to ``dead/`` rather than blocking the spool.
+
+A scraper process hands the segments it wrote to a detached drainer when
+it exits (``drain --segments``), so its result is not held back by the
+database; segments of processes that died are left to the scheduler's
+drainer or a plain ``drain``.
+
+    python spool.py status
+    python spool.py drain [--timeout 60] [--segments NAME,...]
+"""
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(__file__), 'libs'))
+import json
+import time
+import uuid
+import argparse
+import datetime
+import threading
+import subprocess
+
+from tenacity import retry, stop_after_attempt, wait_random_exponential
+
+from state import STATE_DIR
+
+ENABLED = os.getenv('SCRAPER_SPOOL', '1') != '0'
+SPOOL_DIR = os.getenv('SCRAPER_SPOOL_DIR') or os.path.join(STATE_DIR, 'spool')
+FSYNC = os.getenv('SCRAPER_SPOOL_FSYNC', '1') != '0'
+SEGMENT_BYTES = 4 * 1024 * 1024
+SEGMENT_AGE = 5.0
+BATCH_SIZE = 200
+RETRY_ATTEMPTS = 4
+DEAD_AFTER = 10
+# Lock files and open segments untouched this long belong to dead processes
+LOCK_STALE = 120.0
+ORPHAN_AGE = 600.0
+DRAIN_INTERVAL = 5.0
+
+OPEN, SEALED = ".open", ".jsonl"
+
+
+def idempotency_key(url):
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, url))
+
+
+def _now():
+    return datetime.datetime.now().isoformat()
+
+
+def _path(*parts):
+    return os.path.join(SPOOL_DIR, *parts)
+
+
+class SegmentWriter:
+    """This process's open segment."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._file = None
+        self._name = None
+        self._opened = 0.0
+        # Segments this writer sealed, in order
+        self.sealed = []
+
+    def append(self, records):
+        if not records: return
+        data = "".join(json.dumps(r) + "\n" for r in records).encode('utf-8')
+        with self._lock:
+            # A segment sealed by another process as orphaned is not ours any more
+            if self._file and not os.path.exists(_path(self._name + OPEN)): self._close()
+            if self._file is None: self._open()
+            self._file.write(data)
+            self._file.flush()
+            if FSYNC: os.fsync(self._file.fileno())
+            if self._file.tell() >= SEGMENT_BYTES or time.monotonic() - self._opened >= SEGMENT_AGE: self._seal()
+
+    def seal(self, min_age=0.0):
+        with self._lock:
+            if self._file and time.monotonic() - self._opened >= min_age: self._seal()
+
+    def _open(self):
+        os.makedirs(SPOOL_DIR, exist_ok=True)
+        # Names sort in creation order, so segments drain roughly first in, first out
+        self._name = f"{time.time():.6f}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        self._file = open(_path(self._name + OPEN), 'ab')
+        self._opened = time.monotonic()
+
+    def _close(self):
+        try: self._file.close()
+        except OSError: pass
+        self._file = self._name = None
+
+    def _seal(self):
+        name = self._name
+        self._close()
+        try:
+            os.replace(_path(name + OPEN), _path(name + SEALED))
+            self.sealed.append(name + SEALED)
+        except OSError as e:
+            print(f"Spool seal error: {e}", file=sys.stderr)
+
+
+_writer = SegmentWriter()
+
+
+def append_products(website_id, url, items, domain=""):
+    """Spools product upserts; returns how many were spooled."""
+    at = _now()
+    records = []
+    for item in items:
+        p_url = item.get("url") or url
+        records.append({"kind": "product", "key": idempotency_key(p_url), "website": website_id,
+                        "domain": item.get("domain") or domain, "at": at, "item": dict(item, url=p_url)})
+    _writer.append(records)
+    return len(records)
+
+
+def append_website(website_id, url, summary):
+    _writer.append([{"kind": "website", "website": website_id, "url": url, "at": _now(), "summary": summary}])
+
+
+def seal(min_age=0.0):
+    """Makes what this process spooled drainable (only a segment at least min_age seconds old)."""
+    _writer.seal(min_age)
+
+
+def own_segments():
+    """Sealed segments written by this process that are not drained yet."""
+    return [name for name in _writer.sealed if os.path.exists(_path(name))]
+
+
+def _segments():
+    try: names = os.listdir(SPOOL_DIR)
+    except OSError: return []
+    now = time.time()
+    for name in names:
+        # Segments left open by a process that died are drained like sealed ones
+        if name.endswith(OPEN):
+            try:
+                if now - os.path.getmtime(_path(name)) > ORPHAN_AGE:
+                    os.replace(_path(name), _path(name[:-len(OPEN)] + SEALED))
+            except OSError: pass
+    try: names = os.listdir(SPOOL_DIR)
+    except OSError: return []
+    return sorted(n for n in names if n.endswith(SEALED))
+
+
+def _claim(segment):
+    lock = _path(segment + ".lock")
+    try:
+        if time.time() - os.path.getmtime(lock) > LOCK_STALE: os.remove(lock)
+    except OSError: pass
+    try:
+        os.close(os.open(lock, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+        return lock
+    except OSError:
+        return None
+
+
+def _load_progress(segment):
+    try:
+        with open(_path(segment + ".progress"), encoding='utf-8') as f: return json.load(f)
+    except (OSError, ValueError):
+        return {"offset": 0, "failures": 0}
+
+
+def _save_progress(segment, progress):
+    path = _path(segment + ".progress")
+    with open(path + ".tmp", 'w', encoding='utf-8') as f: json.dump(progress, f)
+    os.replace(path + ".tmp", path)
+
+
+def _read_batch(f):
+    """Up to BATCH_SIZE records from f's position; returns (records, raw lines)."""
+    records, lines = [], []
+    while len(records) < BATCH_SIZE:
+        line = f.readline()
+        if not line: break
+        lines.append(line)
+        try: records.append(json.loads(line))
+        except ValueError:
+            # Torn last line of a writer that crashed mid-append
+            print(f"Spool: skipping unreadable record ({len(line)} bytes)", file=sys.stderr)
+    return records, lines
+
+
+def _dead_letter(segment, offset, lines):
+    os.makedirs(_path("dead"), exist_ok=True)
+    with open(_path("dead", f"{segment}.{offset}"), 'wb') as f: f.writelines(lines)
+
+
+def _drain_segment(segment, write_batch, deadline, stats):
+    lock = _claim(segment)
+    if not lock: return
+    try:
+        progress = _load_progress(segment)
+        # Another drainer may have finished it between listing and claiming
+        if not os.path.exists(_path(segment)): return
+        with open(_path(segment), 'rb') as f:
+            f.seek(progress["offset"])
+            while deadline is None or time.monotonic() < deadline:
+                offset = f.tell()
+                records, lines = _read_batch(f)
+                if not lines:
+                    f.close()
+                    for path in (_path(segment), _path(segment + ".progress")):
+                        try: os.remove(path)
+                        except OSError: pass
+                    return
+                try:
+                    if records: _write_with_retries(write_batch, records)
+                    stats["written"] += len(records)
+                except Exception as e:
+                    progress["failures"] += 1
+                    if progress["failures"] < DEAD_AFTER:
+                        print(f"Spool: batch of {len(records)} write(s) failed ({e}), kept for the next drain", file=sys.stderr)
+                        _save_progress(segment, dict(progress, offset=offset))
+                        stats["failed"] += len(records)
+                        return
+                    print(f"Spool: batch of {len(records)} write(s) failed {DEAD_AFTER} times ({e}), moved to dead/", file=sys.stderr)
+                    _dead_letter(segment, offset, lines)
+                    stats["dead"] += len(records)
+                progress = {"offset": f.tell(), "failures": 0}
+                _save_progress(segment, progress)
+                try: os.utime(lock)
+                except OSError: pass
+    finally:
+        try: os.remove(lock)
+        except OSError: pass
+
+
+@retry(stop=stop_after_attempt(RETRY_ATTEMPTS), wait=wait_random_exponential(multiplier=0.5, max=8), reraise=True)
+def _write_with_retries(write_batch, records):
+    write_batch(records)
+
+
+def drain(write_batch, timeout=None, segments=None):
+    """Replays sealed segments (only those named in segments, if given) through write_batch(records)
+    until none is left, a batch keeps failing, or timeout seconds passed.
+    Returns {"written", "failed", "dead", "pending"}."""
+    deadline = time.monotonic() + timeout if timeout is not None else None
+    stats = {"written": 0, "failed": 0, "dead": 0}
+    chosen = lambda: [n for n in _segments() if segments is None or n in segments]
+    for segment in chosen():
+        if deadline is not None and time.monotonic() >= deadline: break
+        _drain_segment(segment, write_batch, deadline, stats)
+        if stats["failed"]: break
+    stats["pending"] = len(chosen())
+    return stats
+
+
+def drain_detached(segments, timeout=None):
+    """Drains segments from a detached process that outlives this one; returns False when it could not start."""
+    args = [sys.executable, os.path.abspath(__file__), 'drain', '--segments', ','.join(segments)]
+    if timeout is not None: args += ['--timeout', str(timeout)]
+    # Its own session and no inherited pipes: whoever waits for this process's output is not kept waiting
+    detach = {"creationflags": subprocess.DETACHED_PROCESS | subprocess.CREATE_NEW_PROCESS_GROUP} if os.name == 'nt' else {"start_new_session": True}
+    try:
+        subprocess.Popen(args, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, close_fds=True, **detach)
+        return True
+    except OSError as e:
+        print(f"Spool: could not start a drainer ({e})", file=sys.stderr)
+        return False
+
+
+class Drainer:
+    """Background thread draining the spool every DRAIN_INTERVAL seconds."""
+
+    def __init__(self, write_batch, interval=DRAIN_INTERVAL):
+        self.write_batch = write_batch
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="spool-drainer", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            # Segments this process is still filling are sealed by age here too
+            seal(SEGMENT_AGE)
+            try: drain(self.write_batch)
+            except Exception as e: print(f"Spool drain error: {e}", file=sys.stderr)
+
+    def stop(self, final_timeout=None):
+        """Stops the thread, then drains what is left for at most final_timeout seconds."""
+        self._stop.set()
+        self._thread.join()
+        seal()
+        return drain(self.write_batch, final_timeout)
+
+
+def status():
+    segments = _segments()
+    records = size = 0
+    for segment in segments:
+        offset = _load_progress(segment)["offset"]
+        try:
+            with open(_path(segment), 'rb') as f:
+                f.seek(offset)
+                for _ in f: records += 1
+            size += os.path.getsize(_path(segment)) - offset
+        except OSError:
+            pass
+    try: dead = len(os.listdir(_path("dead")))
+    except OSError: dead = 0
+    return {"segments": len(segments), "records": records, "bytes": size, "deadBatches": dead}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    sub = parser.add_subparsers(dest='command', required=True)
+    sub.add_parser('status')
+    dr = sub.add_parser('drain')
+    dr.add_argument('--timeout', type=float, help="Give up after this many seconds (default: until empty or failing)")
+    dr.add_argument('--segments', type=str, help="Comma separated segment names (default: every sealed segment)")
+    args = parser.parse_args()
+
+    if args.command == 'status':
+        print(json.dumps(status())); return
+    from scraper import get_supabase_client, spool_writer
+    write_batch = spool_writer(get_supabase_client())
+    if not write_batch:
+        print(json.dumps({"error": "No database configured"})); return
+    segments = set(args.segments.split(",")) if args.segments else None
+    print(json.dumps(dict(drain(write_batch, args.timeout, segments), success=True)))
+
+
+if __name__ == "__main__":
+    main()
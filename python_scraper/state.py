@@ -0,0 +1,74 @@
+"""Local state directory shared by the scraper's persistent helpers."""
+import os
+import json
+import time
+import tempfile
+import contextlib
+
+from item_store import dump
+
+STATE_DIR = os.getenv('SCRAPER_STATE_DIR') or os.path.join(os.path.dirname(os.path.abspath(__file__)), '.state')
+# A lock file older than this was left by a crashed process
+LOCK_STALE = 30.0
+
+
+def state_path(*parts):
+    path = os.path.join(STATE_DIR, *parts)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    return path
+
+
+def load_json(name, default=None):
+    try:
+        with open(state_path(name), encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return default
+
+
+def save_json(name, data):
+    """Writes atomically so concurrent scraper processes never read a torn file."""
+    path = state_path(name)
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            dump(data, f)
+        os.replace(tmp, path)
+    except BaseException:
+        try: os.remove(tmp)
+        except OSError: pass
+        raise
+
+
+@contextlib.contextmanager
+def file_lock(name, timeout=LOCK_STALE * 2):
+    """Exclusive lock on state file name, across processes (a lock file next to it)."""
+    path = state_path(name + '.lock')
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            os.close(os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+            break
+        except FileExistsError:
+            try:
+                if time.time() - os.path.getmtime(path) > LOCK_STALE: os.remove(path)
+            except OSError:
+                pass
+            if time.monotonic() > deadline: raise TimeoutError(f"State file {name} is locked")
+            time.sleep(0.01)
+    try:
+        yield
+    finally:
+        try: os.remove(path)
+        except OSError: pass
+
+
+def update_json(name, update, default=None):
+    """Read-modify-write of a state file under file_lock, so concurrent processes never
+    overwrite each other's changes. update(data) changes data in place."""
+    with file_lock(name):
+        data = load_json(name, default)
+        if data is None: data = default
+        update(data)
+        save_json(name, data)
+    return data
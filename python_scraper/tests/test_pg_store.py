@@ -0,0 +1,263 @@
+"""pg_store against a real Postgres, compared with the PostgREST (supabase) path.
+
+Needs a scratch database; every run works in fresh schemas it drops afterwards:
+
+    docker run -d --name pg -e POSTGRES_PASSWORD=pg -p 5432:5432 postgres:16
+    PG_TEST_DATABASE_URL=postgresql://postgres:pg@localhost:5432/postgres \
+        python -m unittest discover -s python_scraper/tests
+
+The schemas are built from the Prisma migrations. The PostgREST path runs the
+scraper's own save_products / write_spooled code through a small client that
+turns its select/update/insert/upsert calls into the SQL PostgREST would run,
+so both paths write to the same kind of tables and can be compared row by row.
+"""
+import os
+import sys
+import glob
+import json
+import threading
+import unittest
+import contextlib
+import urllib.parse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+TEST_URL = os.getenv('PG_TEST_DATABASE_URL')
+MIGRATIONS = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'prisma', 'migrations', '*', 'migration.sql')
+COMPARED = ("url", "name", "price", "priceAmount", "reference", "overview", "category", "domain", "websiteId")
+WEBSITE = "w1"
+PAGE = "https://www.tunisianet.com.tn/laptops"
+
+try:
+    import psycopg
+except ImportError:
+    psycopg = None
+
+
+def _with_schema(url, schema):
+    parts = urllib.parse.urlsplit(url)
+    query = urllib.parse.parse_qsl(parts.query) + [("schema", schema)]
+    return urllib.parse.urlunsplit(parts._replace(query=urllib.parse.urlencode(query)))
+
+
+def _item(n, name=None, price=None):
+    return {"url": f"https://www.tunisianet.com.tn/p{n}.html", "name": name or f"Laptop {n}", "price": f"{price or 1000 + n},000 DT",
+            "priceAmount": float(price or 1000 + n), "reference": f"REF{n}", "domain": "www.tunisianet.com.tn"}
+
+
+class _Query:
+    """The subset of the supabase query builder the scraper uses, run as SQL."""
+
+    def __init__(self, client, table):
+        self.client, self.table = client, table
+        self.op, self.columns, self.payload, self.where, self.conflict = "select", "*", None, [], None
+
+    def select(self, columns="*"):
+        self.op, self.columns = "select", columns
+        return self
+
+    def eq(self, column, value):
+        self.where.append((f'"{column}" = %s', value))
+        return self
+
+    def in_(self, column, values):
+        self.where.append((f'"{column}" = ANY(%s)', list(values)))
+        return self
+
+    def update(self, doc):
+        self.op, self.payload = "update", doc
+        return self
+
+    def insert(self, doc):
+        self.op, self.payload = "insert", doc
+        return self
+
+    def upsert(self, docs, on_conflict="id"):
+        self.op, self.payload, self.conflict = "upsert", docs, on_conflict
+        return self
+
+    def execute(self):
+        where = " AND ".join(clause for clause, _ in self.where) or "TRUE"
+        args = [value for _, value in self.where]
+        cur = self.client.conn.cursor()
+        data = None
+        if self.op == "select":
+            columns = ", ".join(f'"{c.strip()}"' for c in self.columns.split(",")) if self.columns != "*" else "*"
+            cur.execute(f'SELECT {columns} FROM "{self.table}" WHERE {where}', args)
+            names = [d.name for d in cur.description]
+            data = [dict(zip(names, row)) for row in cur.fetchall()]
+        elif self.op == "update":
+            sets = ", ".join(f'"{k}" = %s' for k in self.payload)
+            cur.execute(f'UPDATE "{self.table}" SET {sets} WHERE {where}', list(self.payload.values()) + args)
+            self.client.counts["update"] += cur.rowcount
+        else:
+            docs = self.payload if isinstance(self.payload, list) else [self.payload]
+            for doc in docs:
+                columns = ", ".join(f'"{k}"' for k in doc)
+                sql = f'INSERT INTO "{self.table}" ({columns}) VALUES ({", ".join(["%s"] * len(doc))})'
+                if self.conflict:
+                    sets = ", ".join(f'"{k}" = EXCLUDED."{k}"' for k in doc if k != self.conflict)
+                    # xmax is 0 for a freshly inserted row
+                    sql += f' ON CONFLICT ("{self.conflict}") DO UPDATE SET {sets} RETURNING (xmax = 0)'
+                cur.execute(sql, [json.dumps(v) if isinstance(v, dict) else v for v in doc.values()])
+                inserted = cur.fetchone()[0] if self.conflict else True
+                self.client.counts["insert" if inserted else "update"] += 1
+        self.client.conn.commit()
+
+        class Response:
+            pass
+        response = Response()
+        response.data = data
+        return response
+
+
+class PostgrestClient:
+    def __init__(self, conn):
+        self.conn = conn
+        self.counts = {"update": 0, "insert": 0}
+
+    def table(self, name):
+        return _Query(self, name)
+
+
+@unittest.skipUnless(TEST_URL and psycopg, "needs PG_TEST_DATABASE_URL and psycopg")
+class PgStoreTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.schemas = {"pg": f"copy_test_{os.getpid()}", "rest": f"postgrest_test_{os.getpid()}"}
+        cls.admin = psycopg.connect(TEST_URL, autocommit=True)
+        os.environ['DATABASE_URL'] = _with_schema(TEST_URL, cls.schemas["pg"])
+        os.environ['SCRAPER_PERSIST_BACKEND'] = 'postgres'
+        import pg_store
+        import scraper
+        import spool
+        cls.pg_store, cls.scraper, cls.spool = pg_store, scraper, spool
+        cls.spool_enabled, spool.ENABLED = spool.ENABLED, False
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.spool.ENABLED = cls.spool_enabled
+        conn = getattr(cls.pg_store._local, "conn", None)
+        if conn: conn.close()
+        for schema in cls.schemas.values():
+            cls.admin.execute(f"DROP SCHEMA IF EXISTS {schema} CASCADE")
+        cls.admin.close()
+
+    def setUp(self):
+        for schema in self.schemas.values():
+            self.admin.execute(f"DROP SCHEMA IF EXISTS {schema} CASCADE")
+            self.admin.execute(f"CREATE SCHEMA {schema}")
+            self.admin.execute(f"SET search_path TO {schema}")
+            for path in sorted(glob.glob(MIGRATIONS)):
+                with open(path, encoding='utf-8') as f: self.admin.execute(f.read())
+            self.admin.execute("""INSERT INTO "Website" (id, name, url, "updatedAt") VALUES (%s, 'Tunisianet', %s, now())""", (WEBSITE, PAGE))
+        # Prisma fills id and updatedAt client-side; inserts through PostgREST need database defaults for them
+        self.admin.execute(f"""ALTER TABLE {self.schemas['rest']}."Product" ALTER COLUMN id SET DEFAULT gen_random_uuid()::text,
+                               ALTER COLUMN "updatedAt" SET DEFAULT now()""")
+        self.rest = PostgrestClient(psycopg.connect(TEST_URL))
+        self.rest.conn.execute(f"SET search_path TO {self.schemas['rest']}")
+        self.rest.conn.commit()
+        # The pg_store connection of this thread still points at the dropped schema
+        conn = getattr(self.pg_store._local, "conn", None)
+        if conn: conn.close()
+
+    def tearDown(self):
+        self.rest.conn.close()
+
+    @contextlib.contextmanager
+    def postgrest(self):
+        os.environ['SCRAPER_PERSIST_BACKEND'] = ''
+        try: yield self.rest
+        finally: os.environ['SCRAPER_PERSIST_BACKEND'] = 'postgres'
+
+    def seed(self, items):
+        for schema in self.schemas.values():
+            for n, item in enumerate(items):
+                self.admin.execute(f"""INSERT INTO {schema}."Product" (id, name, url, "websiteId", "updatedAt") VALUES (%s, %s, %s, %s, now())""",
+                                   (f"seed{n}", item["name"], item["url"], WEBSITE))
+
+    def products(self, which):
+        columns = ", ".join(f'"{c}"' for c in COMPARED)
+        return self.admin.execute(f'SELECT {columns} FROM {self.schemas[which]}."Product" ORDER BY url').fetchall()
+
+    def count(self, which):
+        return self.admin.execute(f'SELECT count(*) FROM {self.schemas[which]}."Product"').fetchone()[0]
+
+    def test_counts_and_rows_match_postgrest(self):
+        self.seed([_item(n, name="stale") for n in range(3)])
+        items = [_item(n) for n in range(1, 6)] + [{"name": "Product page", "priceAmount": 99.0}]
+        with self.postgrest() as rest:
+            self.scraper.save_products(rest, WEBSITE, PAGE, items, "www.tunisianet.com.tn")
+        before = self.count("pg")
+        written = self.pg_store.save(WEBSITE, PAGE, items, domain="www.tunisianet.com.tn")
+        inserted = self.count("pg") - before
+        self.assertEqual(self.rest.counts, {"update": 2, "insert": 4})
+        self.assertEqual({"update": written - inserted, "insert": inserted}, self.rest.counts)
+        self.assertEqual(self.products("pg"), self.products("rest"))
+
+    def test_last_version_of_a_url_wins(self):
+        self.seed([_item(1, name="stale")])
+        items = [_item(1, price=900), _item(2, price=500), _item(1, price=800), _item(2, price=450)]
+        with self.postgrest() as rest:
+            self.scraper.save_products(rest, WEBSITE, PAGE, items)
+        self.pg_store.save(WEBSITE, PAGE, items)
+        self.assertEqual(self.count("pg"), 2)
+        self.assertEqual(self.products("pg"), self.products("rest"))
+        self.assertEqual([row[3] for row in self.products("pg")], [800.0, 450.0])
+
+    def test_spool_replay_is_idempotent(self):
+        self.seed([_item(1, name="stale")])
+        records = [{"kind": "product", "key": self.spool.idempotency_key(item["url"]), "website": WEBSITE,
+                    "domain": item["domain"], "at": "2026-01-01T00:00:00", "item": item} for item in map(_item, range(1, 4))]
+        for _ in range(2):
+            with self.postgrest() as rest:
+                self.scraper.write_spooled(rest, records)
+            self.scraper.write_spooled(None, records)
+        self.assertEqual(self.count("pg"), 3)
+        self.assertEqual(self.products("pg"), self.products("rest"))
+
+    def test_spooled_products_and_summary_commit_together(self):
+        summary = {"type": "list", "count": 2, "url": PAGE}
+        records = [{"kind": "product", "key": self.spool.idempotency_key(item["url"]), "website": WEBSITE,
+                    "domain": item["domain"], "at": "2026-01-01T00:00:00", "item": item} for item in map(_item, range(1, 3))]
+        records.append({"kind": "website", "website": WEBSITE, "url": PAGE, "at": "2026-01-01T00:00:00", "summary": summary})
+        calls, save = [], self.pg_store.save
+        self.pg_store.save = lambda *args, **kwargs: calls.append(args) or save(*args, **kwargs)
+        try: self.scraper.write_spooled(None, records)
+        finally: self.pg_store.save = save
+        self.assertEqual([(website, len(items), summary) for website, _, items, summary in calls], [(WEBSITE, 2, summary)])
+        self.assertEqual(self.count("pg"), 2)
+        row = self.admin.execute(f'SELECT "scrapedData" FROM {self.schemas["pg"]}."Website" WHERE id = %s', (WEBSITE,)).fetchone()
+        self.assertEqual(row[0], summary)
+
+    def test_concurrent_batches_insert_each_url_once(self):
+        batches = [[_item(n) for n in range(start, start + 40)] for start in (0, 20, 10)]
+        errors = []
+
+        def save(items):
+            try: self.pg_store.save(WEBSITE, PAGE, items)
+            except Exception as e: errors.append(e)
+            finally:
+                conn = getattr(self.pg_store._local, "conn", None)
+                if conn: conn.close()
+
+        threads = [threading.Thread(target=save, args=(batch,)) for batch in batches]
+        for t in threads: t.start()
+        for t in threads: t.join()
+        self.assertEqual(errors, [])
+        urls = self.admin.execute(f'SELECT url, count(*) FROM {self.schemas["pg"]}."Product" GROUP BY url HAVING count(*) > 1').fetchall()
+        self.assertEqual(urls, [])
+        self.assertEqual(self.count("pg"), 60)
+
+    def test_website_summary_and_nul_bytes(self):
+        summary = {"type": "list", "count": 1, "url": PAGE}
+        self.pg_store.save(WEBSITE, PAGE, [_item(1, name="Laptop\x00 1")], summary)
+        row = self.admin.execute(f'SELECT "scrapedData", "lastScraped" FROM {self.schemas["pg"]}."Website" WHERE id = %s', (WEBSITE,)).fetchone()
+        self.assertEqual(row[0], summary)
+        self.assertIsNotNone(row[1])
+        self.assertEqual(self.products("pg")[0][1], "Laptop 1")
+        self.assertEqual(self.pg_store.fetch_website(WEBSITE), {"id": WEBSITE, "url": PAGE})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,59 @@
+"""A job stopping while it waits on a coalesced fetch returns at once; the fetch goes on for the others."""
+import os
+import sys
+import time
+import tempfile
+import threading
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import state
+import singleflight
+from fetch import POLL_INTERVAL
+from job_control import JobControl, JobCancelled, DeadlineExceeded
+
+FETCH_TIME = 2.0
+
+
+class CoalesceTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.state_dir, state.STATE_DIR = state.STATE_DIR, self.tmp.name
+        self.runs = []
+
+    def tearDown(self):
+        state.STATE_DIR = self.state_dir
+        self.tmp.cleanup()
+
+    def slow_fetch(self):
+        self.runs.append(1)
+        time.sleep(FETCH_TIME)
+        return {"items": [1, 2, 3]}
+
+    def test_cancel_during_slow_fetch(self):
+        results = {}
+        other = threading.Thread(target=lambda: results.update(other=singleflight.coalesce("page-1", self.slow_fetch, JobControl())))
+        ctl = JobControl()
+        threading.Timer(0.2, ctl.cancel).start()
+        other.start()
+        started = time.monotonic()
+        with self.assertRaises(JobCancelled):
+            singleflight.coalesce("page-1", self.slow_fetch, ctl)
+        self.assertLess(time.monotonic() - started, 0.2 + POLL_INTERVAL)
+        other.join()
+        self.assertEqual(results["other"], {"items": [1, 2, 3]})
+        self.assertEqual(self.runs, [1])
+
+    def test_deadline_of_the_first_caller(self):
+        started = time.monotonic()
+        with self.assertRaises(DeadlineExceeded):
+            singleflight.coalesce("page-2", self.slow_fetch, JobControl(deadline=0.3))
+        self.assertLess(time.monotonic() - started, 0.3 + POLL_INTERVAL)
+        # The fetch it started still completes for a job arriving later
+        self.assertEqual(singleflight.coalesce("page-2", self.slow_fetch, JobControl()), {"items": [1, 2, 3]})
+        self.assertEqual(self.runs, [1])
+
+
+if __name__ == "__main__":
+    unittest.main()
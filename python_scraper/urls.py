@@ -0,0 +1,33 @@
+"""URL canonicalization used to recognise the same page behind different URLs."""
+import re
+import urllib.parse
+
+TRACKING_PARAMS = {"gclid", "fbclid", "msclkid", "yclid", "mc_cid", "mc_eid", "_ga", "_gl"}
+# Session ids make every visit look like a new page
+SESSION_PARAMS = {"phpsessid", "jsessionid", "sessionid", "sid", "session_id"}
+TRACKING_PREFIXES = ("utm_",)
+DEFAULT_PORTS = {"http": 80, "https": 443}
+
+
+def is_tracking_param(name):
+    name = name.lower()
+    return name in TRACKING_PARAMS or name in SESSION_PARAMS or name.startswith(TRACKING_PREFIXES)
+
+
+def normalize_url(url):
+    """Lowercases scheme/host, drops default ports, fragments, tracking and session params, sorts the query."""
+    parts = urllib.parse.urlsplit(url.strip())
+    # Java style path parameter: /cat;jsessionid=ABC?page=2
+    parts = parts._replace(path=re.sub(r';jsessionid=[^/?#]*', '', parts.path, flags=re.I))
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or "").lower()
+    if parts.port and parts.port != DEFAULT_PORTS.get(scheme):
+        host = f"{host}:{parts.port}"
+    query = [(k, v) for k, v in urllib.parse.parse_qsl(parts.query, keep_blank_values=True) if not is_tracking_param(k)]
+    query.sort()
+    return urllib.parse.urlunsplit((scheme, host, parts.path or "/", urllib.parse.urlencode(query), ""))
+
+
+def canonical_url(url, base=None):
+    """normalize_url of url resolved against base (relative links, ./ and ../ segments)."""
+    return normalize_url(urllib.parse.urljoin(base, url) if base else url)
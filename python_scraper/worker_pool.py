@@ -0,0 +1,119 @@
+"""Thread pool with per-domain affinity, work stealing, concurrency caps and priority lanes.
+
+Every task is tagged with a key (the retailer domain). Keys are assigned
+round-robin to a home worker, which drains its own deque from the front.
+A worker with nothing runnable at home steals from the back of the busiest
+other deque, so a slow retailer only ever occupies the workers it is
+actually running on. At most ``per_key_limit`` tasks of a key run at once.
+
+Tasks also belong to a lane (see lanes.py). When both lanes have runnable
+work the next one is picked by weighted fair share, and a few extra
+workers only ever run interactive tasks, so an interactive job starts at
+once even when every regular worker is busy with a bulk refresh.
+"""
+import collections
+import sys
+import threading
+from concurrent.futures import Future
+
+from lanes import INTERACTIVE, BACKGROUND, LANES, LaneSelector, add_interactive_demand
+
+
+class WorkStealingPool:
+    def __init__(self, workers=4, per_key_limit=2, interactive_workers=1):
+        self.workers = max(1, workers)
+        self.per_key_limit = max(1, per_key_limit)
+        self._deques = [collections.deque() for _ in range(self.workers)]
+        self._home = {}
+        self._active = collections.Counter()
+        self._lanes = LaneSelector()
+        self._cond = threading.Condition()
+        self._closed = False
+        self._threads = []
+        for i in range(self.workers):
+            self._start(f"scrape-worker-{i}", i, LANES)
+        for i in range(max(0, interactive_workers)):
+            self._start(f"scrape-interactive-{i}", None, (INTERACTIVE,))
+
+    def _start(self, name, index, lanes):
+        t = threading.Thread(target=self._run, args=(index, lanes), name=name, daemon=True)
+        t.start()
+        self._threads.append(t)
+
+    def submit(self, key, fn, *args, lane=BACKGROUND, **kwargs):
+        future = Future()
+        with self._cond:
+            if self._closed: raise RuntimeError("pool is shut down")
+            if key not in self._home:
+                self._home[key] = len(self._home) % self.workers
+            self._deques[self._home[key]].append((key, lane, future, fn, args, kwargs))
+            self._cond.notify_all()
+        # Running background crawls yield between pages while this is non-zero
+        if lane == INTERACTIVE: add_interactive_demand(1)
+        return future
+
+    def map(self, key_fn, fn, items, lane=BACKGROUND):
+        """Runs fn(item) for every item and returns the results in input order."""
+        futures = [self.submit(key_fn(item), fn, item, lane=lane) for item in items]
+        return [f.result() for f in futures]
+
+    def pending(self):
+        with self._cond:
+            return sum(len(d) for d in self._deques)
+
+    def active(self, key=None):
+        with self._cond:
+            return self._active[key] if key is not None else sum(self._active.values())
+
+    def shutdown(self, wait=True):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        if wait:
+            for t in self._threads: t.join()
+
+    def _runnable(self, task, lanes):
+        return task[1] in lanes and self._active[task[0]] < self.per_key_limit
+
+    def _find(self, index, lane):
+        """Locates the next runnable task of lane: own deque first, then the back of the busiest one."""
+        own = self._deques[index] if index is not None else None
+        if own is not None:
+            for task in own:
+                if self._runnable(task, (lane,)): return own, task
+        for victim in sorted(self._deques, key=len, reverse=True):
+            if victim is own: continue
+            for task in reversed(victim):
+                if self._runnable(task, (lane,)): return victim, task
+        return None
+
+    def _take(self, index, lanes):
+        found = {lane: self._find(index, lane) for lane in lanes}
+        lane = self._lanes.choose([lane for lane in lanes if found[lane]])
+        if lane is None: return None
+        deque, task = found[lane]
+        deque.remove(task)
+        return task
+
+    def _run(self, index, lanes):
+        while True:
+            with self._cond:
+                task = self._take(index, lanes)
+                while task is None:
+                    if self._closed and not any(self._deques): return
+                    self._cond.wait()
+                    task = self._take(index, lanes)
+                key, lane, future, fn, args, kwargs = task
+                self._active[key] += 1
+            try:
+                if future.set_running_or_notify_cancel():
+                    try:
+                        future.set_result(fn(*args, **kwargs))
+                    except BaseException as e:
+                        print(f"Worker task for {key} failed: {e}", file=sys.stderr)
+                        future.set_exception(e)
+            finally:
+                if lane == INTERACTIVE: add_interactive_demand(-1)
+                with self._cond:
+                    self._active[key] -= 1
+                    self._cond.notify_all()
@@ -3,6 +3,7 @@ const router = express.Router();
 const { PrismaClient } = require('@prisma/client');
 const prisma = new PrismaClient();
 const auth = require('../middleware/auth');
+const { searchRetailersTask } = require('../services/scraperService');
 
 const { Parser } = require('json2csv');
 
@@ -136,6 +137,27 @@ router.get('/', auth, async (req, res) => {
     }
 });
 
+// GET: Search every retailer at once, streamed as newline-delimited JSON (Protected)
+router.get('/search', auth, (req, res) => {
+    const { q, minPrice, maxPrice, name, domains, limit, deadline } = req.query;
+    if (!q || !q.trim()) return res.status(400).json({ error: 'Query (q) is required' });
+
+    res.setHeader('Content-Type', 'application/x-ndjson');
+    const task = searchRetailersTask(q.trim(), {
+        minPrice, maxPrice, name, limit, deadline,
+        domains: domains ? domains.split(',') : undefined
+    }, (event) => res.write(JSON.stringify(event) + '\n'));
+
+    // Client went away: stop the crawlers instead of finishing the search for nobody
+    res.on('close', () => { if (!res.writableEnded) task.cancel(); });
+    task.done
+        .catch((error) => {
+            console.error('Search error:', error.message);
+            res.write(JSON.stringify({ event: 'result', error: error.message }) + '\n');
+        })
+        .finally(() => res.end());
+});
+
 // GET: Get single product by ID (Protected)
 router.get('/:id', auth, async (req, res) => {
     try {
@@ -2,7 +2,7 @@ const express = require('express');
 const router = express.Router();
 const { PrismaClient } = require('@prisma/client');
 const prisma = new PrismaClient();
-const { scrapeWebsiteTask } = require('../services/scraperService');
+const { scrapeWebsiteTask, cancelScrapeTask } = require('../services/scraperService');
 const auth = require('../middleware/auth');
 
 // Helper to format website for frontend
@@ -230,4 +230,33 @@ router.post('/:id/scrape-trigger', auth, async (req, res) => {
     }
 });
 
+// POST: Cancel a running scrape
+router.post('/:id/scrape-cancel', auth, async (req, res) => {
+    try {
+        const websiteId = req.params.id;
+
+        // Verify existence and ownership
+        const website = await prisma.website.findUnique({
+            where: { id: websiteId }
+        });
+
+        if (!website) return res.status(404).json({ error: 'Website not found' });
+        if (website.userId && website.userId !== req.user.id) {
+            return res.status(403).json({ error: 'Access denied' });
+        }
+
+        if (!cancelScrapeTask(websiteId)) {
+            return res.status(404).json({ error: 'No running scrape for this website' });
+        }
+
+        res.status(202).json({
+            message: 'Cancellation requested. Items collected so far will still be saved.',
+            status: 'cancelling'
+        });
+    } catch (error) {
+        console.error('Scrape cancel error:', error);
+        res.status(500).json({ error: error.message });
+    }
+});
+
 module.exports = router;
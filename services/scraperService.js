@@ -3,10 +3,108 @@ const path = require('path');
 const { PrismaClient } = require('@prisma/client');
 const prisma = new PrismaClient();
 
+// Running scraper processes by website ID, so a scrape can be cancelled
+const runningScrapes = new Map();
+// How long a cancelled scraper gets to report what it collected before being killed
+const CANCEL_GRACE_MS = 10000;
+
+/**
+ * Asks the running scrape of a website to stop. The Python scraper stops at its next
+ * checkpoint, releases its browser and still reports the items collected so far.
+ * @param {string} websiteId - The ID of the website
+ * @returns {boolean} - Whether a running scrape was found
+ */
+function cancelScrapeTask(websiteId) {
+    const pythonProcess = runningScrapes.get(websiteId);
+    if (!pythonProcess) return false;
+
+    console.log(`Cancelling scrape for ID: ${websiteId}`);
+    try {
+        pythonProcess.stdin.write('cancel\n');
+    } catch (err) {
+        console.error(`Failed to send cancel to scraper for ${websiteId}:`, err.message);
+    }
+    const killTimer = setTimeout(() => {
+        if (pythonProcess.exitCode === null) pythonProcess.kill('SIGTERM');
+    }, CANCEL_GRACE_MS);
+    pythonProcess.once('close', () => clearTimeout(killTimer));
+    return true;
+}
+
+/**
+ * Python interpreter of the project virtualenv, falling back to the system one.
+ * @returns {string}
+ */
+function resolvePythonPath() {
+    const fs = require('fs');
+    // Potential paths for virtual environment python
+    const venvPath = path.join(__dirname, '../../.venv/Scripts/python.exe');
+    const venvPathUnix = path.join(__dirname, '../../.venv/bin/python');
+
+    if (fs.existsSync(venvPath)) return venvPath;
+    if (fs.existsSync(venvPathUnix)) return venvPathUnix;
+    return 'python'; // Default system fallback
+}
+
+/**
+ * Searches every retailer at once with the Python search script. Events (one page of
+ * items, a retailer finished, the final merged result) are passed to onEvent as they arrive.
+ * @param {string} query - The search terms
+ * @param {Object} filters - minPrice, maxPrice, name, domains, limit, deadline
+ * @param {Function} onEvent - Called with every event object
+ * @returns {Object} - { done: Promise<Object> resolving to the final result, cancel: Function }
+ */
+function searchRetailersTask(query, filters = {}, onEvent = () => {}) {
+    const scriptPath = path.join(__dirname, '../python_scraper/search.py');
+    const args = [scriptPath, query];
+    if (filters?.minPrice) args.push('--minPrice', String(filters.minPrice));
+    if (filters?.maxPrice) args.push('--maxPrice', String(filters.maxPrice));
+    if (filters?.name) args.push('--nameFilter', String(filters.name));
+    if (filters?.domains) args.push('--domains', [].concat(filters.domains).join(','));
+    if (filters?.limit) args.push('--limit', String(filters.limit));
+    if (filters?.deadline) args.push('--deadline', String(filters.deadline));
+
+    const pythonProcess = spawn(resolvePythonPath(), args);
+    const done = new Promise((resolve, reject) => {
+        let buffered = '';
+        let result = null;
+        let errorOutput = '';
+
+        pythonProcess.on('error', (err) => reject(new Error(`Failed to start Python process: ${err.message}`)));
+        pythonProcess.stderr.on('data', (data) => { errorOutput += data.toString(); });
+        pythonProcess.stdout.on('data', (data) => {
+            buffered += data.toString();
+            const lines = buffered.split('\n');
+            buffered = lines.pop();
+            for (const line of lines) {
+                if (!line.trim().startsWith('{')) continue;
+                try {
+                    const event = JSON.parse(line);
+                    if (event.event === 'result') result = event;
+                    onEvent(event);
+                } catch (e) { continue; }
+            }
+        });
+        pythonProcess.on('close', (code) => {
+            if (result && !result.error) return resolve(result);
+            if (result) return reject(new Error(result.error));
+            reject(new Error(`Python search exited with code ${code}. Error: ${errorOutput}`));
+        });
+    });
+    const cancel = () => {
+        try { pythonProcess.stdin.write('cancel\n'); } catch (err) { /* already gone */ }
+        const killTimer = setTimeout(() => {
+            if (pythonProcess.exitCode === null) pythonProcess.kill('SIGTERM');
+        }, CANCEL_GRACE_MS);
+        pythonProcess.once('close', () => clearTimeout(killTimer));
+    };
+    return { done, cancel };
+}
+
 /**
  * Scrapes a website using the Python scraper script.
  * @param {string} websiteId - The ID of the website
- * @param {string} mode - 'static' or 'selenium'
+ * @param {string} mode - 'static', 'selenium', 'auto' or 'catalog' (every leaf category of the retailer)
  * @returns {Promise<Object>} - The updated data
  */
 async function scrapeWebsiteTask(websiteId, mode = 'static', url, filters = {}, userId = null) {
@@ -18,19 +116,7 @@ async function scrapeWebsiteTask(websiteId, mode = 'static', url, filters = {},
 
     return new Promise((resolve, reject) => {
         // ... (lines 24-110 omitted for brevity, logic remains same)
-        const fs = require('fs');
-        let pythonPath = 'python'; // Default system fallback
-
-        // Potential paths for virtual environment python
-        const venvPath = path.join(__dirname, '../../.venv/Scripts/python.exe');
-        const venvPathUnix = path.join(__dirname, '../../.venv/bin/python');
-
-        if (fs.existsSync(venvPath)) {
-            pythonPath = venvPath;
-        } else if (fs.existsSync(venvPathUnix)) {
-            pythonPath = venvPathUnix;
-        }
-
+        const pythonPath = resolvePythonPath();
         const scriptPath = path.join(__dirname, '../python_scraper/scraper.py');
 
         console.log(`Executing Python scraper using: ${pythonPath} for ID: ${websiteId}`);
@@ -43,9 +129,18 @@ async function scrapeWebsiteTask(websiteId, mode = 'static', url, filters = {},
         if (filters?.maxPrice) args.push('--maxPrice', String(filters.maxPrice));
         if (filters?.name) args.push('--nameFilter', String(filters.name));
         if (filters?.reference) args.push('--referenceFilter', String(filters.reference));
+        if (filters?.deadline) args.push('--deadline', String(filters.deadline));
+        if (filters?.limit) args.push('--limit', String(filters.limit));
+        if (filters?.topK) args.push('--topK', String(filters.topK));
+        if (filters?.orderBy) args.push('--orderBy', String(filters.orderBy));
         
         console.log(`Python args:`, args);
+
+        // A new scrape of the same website supersedes the one still running
+        cancelScrapeTask(websiteId);
+
         const pythonProcess = spawn(pythonPath, args);
+        runningScrapes.set(websiteId, pythonProcess);
 
         pythonProcess.on('error', async (err) => {
             console.error('Failed to start Python process:', err);
@@ -67,6 +162,7 @@ async function scrapeWebsiteTask(websiteId, mode = 'static', url, filters = {},
 
         pythonProcess.on('close', async (code) => {
             console.log(`Python process for ${websiteId} exited with code ${code}`);
+            if (runningScrapes.get(websiteId) === pythonProcess) runningScrapes.delete(websiteId);
             
             if (code !== 0) {
                 console.error(`Python stderr for ${websiteId}: ${errorOutput}`);
@@ -218,6 +314,8 @@ async function scrapeWebsiteTask(websiteId, mode = 'static', url, filters = {},
 }
 
 module.exports = {
-    scrapeWebsiteTask
+    scrapeWebsiteTask,
+    cancelScrapeTask,
+    searchRetailersTask
 };
 